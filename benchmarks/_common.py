@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+ベンチマーク共通処理 (Shared benchmark helpers)
+
+リポジトリ直下の image_converter をインポートできるようにし、
+合成画像の生成とピークメモリの取得を提供する。
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+
+def peak_rss_mb():
+    """このプロセスのピークRSS (MB) を返す。取得できない環境ではNone"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def make_photo(size):
+    """ノイズとグラデーションで写真に近いRGB画像を作る"""
+    noise = Image.effect_noise(size, 30)
+    gradient = Image.linear_gradient('L').resize(size)
+    return Image.merge('RGB', (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def make_graphic(size):
+    """単色の図形が多いイラスト風のRGB画像を作る"""
+    img = Image.new('RGB', size, (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+    step = max(size[0] // 16, 1)
+    for i, x in enumerate(range(0, size[0], step)):
+        draw.rectangle((x, 0, x + step // 2, size[1]), fill=((i * 40) % 256, 80, 160))
+        draw.ellipse((x, x % size[1], x + step, x % size[1] + step), fill=(200, (i * 70) % 256, 40))
+    return img
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分散バッチ変換ベンチマーク (Sharded / claim-based batch benchmark)
+
+複数のホストで1つのバッチを分担する --shard と --claim-dir を、1台の上で
+複数の image_converter.py プロセスを同時に起動して再現する。方式ごとに全体の所要時間と
+プロセスごとの変換数の偏りを計測し、すべての入力がちょうど1回ずつ変換されたことを確認する
+(重複または未変換のファイルがあれば終了コード1)。
+
+使用例:
+  python benchmarks/bench_distributed.py
+  python benchmarks/bench_distributed.py --files 500 --processes 8 --json distributed.json
+"""
+
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import REPO_ROOT, make_graphic, make_photo
+
+SCRIPT = os.path.join(REPO_ROOT, 'image_converter.py')
+
+
+def make_inputs(input_dir, count, size):
+    """写真風とイラスト風の画像を交互に作る (変換時間にばらつきを持たせる)"""
+    os.makedirs(input_dir)
+    photo, graphic = make_photo(size), make_graphic(size)
+    for i in range(count):
+        (photo if i % 2 else graphic).save(os.path.join(input_dir, f'img{i:05d}.png'))
+
+
+def run(mode, input_dir, work_dir, processes, output_format):
+    """プロセスを同時に起動し、(所要時間, プロセスごとに変換した入力のリスト) を返す"""
+    output_dir = os.path.join(work_dir, f'out_{mode}')
+    commands = []
+    for i in range(processes):
+        command = [sys.executable, SCRIPT, '--batch', input_dir, output_dir,
+                   '--format', output_format]
+        if mode == 'shard':
+            command += ['--shard', f'{i + 1}/{processes}']
+        else:
+            command += ['--claim-dir', os.path.join(work_dir, 'claims')]
+        commands.append(command)
+
+    start = time.perf_counter()
+    children = [subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 text=True, encoding='utf-8') for command in commands]
+    outputs = [child.communicate()[0] for child in children]
+    elapsed = time.perf_counter() - start
+
+    converted = []
+    for output in outputs:
+        converted.append([line.split(' -> ')[0][len('変換完了: '):]
+                          for line in output.splitlines() if line.startswith('変換完了: ')])
+    return elapsed, converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分散バッチ変換ベンチマーク')
+    parser.add_argument('--files', type=int, default=200, help='入力ファイル数 (デフォルト: 200)')
+    parser.add_argument('--size', nargs=2, type=int, default=[640, 480],
+                        metavar=('WIDTH', 'HEIGHT'), help='画像サイズ (デフォルト: 640 480)')
+    parser.add_argument('--processes', type=int, default=4, help='同時に起動するプロセス数 (デフォルト: 4)')
+    parser.add_argument('--format', default='WEBP', help='出力形式 (デフォルト: WEBP)')
+    parser.add_argument('--json', metavar='FILE', help='結果をJSONで保存する')
+    args = parser.parse_args()
+
+    results = []
+    ok = True
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_dir = os.path.join(work_dir, 'input')
+        make_inputs(input_dir, args.files, tuple(args.size))
+        expected = sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir))
+        print(f"入力: {args.files}ファイル ({args.size[0]}x{args.size[1]} PNG) -> {args.format}, "
+              f"{args.processes}プロセス")
+        print(f"{'mode':<7} {'time[s]':>8} {'files/s':>8} {'min':>5} {'max':>5} "
+              f"{'duplicated':>11} {'missing':>8}")
+
+        for mode in ('shard', 'claim'):
+            elapsed, converted = run(mode, input_dir, work_dir, args.processes, args.format)
+            counter = collections.Counter(path for paths in converted for path in paths)
+            duplicated = sum(1 for n in counter.values() if n > 1)
+            missing = sum(1 for path in expected if path not in counter)
+            per_process = [len(paths) for paths in converted]
+            ok = ok and duplicated == 0 and missing == 0
+            print(f"{mode:<7} {elapsed:8.2f} {args.files / elapsed:8.1f} {min(per_process):5d} "
+                  f"{max(per_process):5d} {duplicated:11d} {missing:8d}")
+            results.append({'mode': mode, 'seconds': elapsed, 'per_process': per_process,
+                            'duplicated': duplicated, 'missing': missing})
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'files': args.files, 'size': args.size, 'processes': args.processes,
+                       'format': args.format, 'results': results}, f, indent=2)
+    if not ok:
+        print("エラー: 重複して変換された、または変換されなかったファイルがあります")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+圧縮努力度ベンチマーク (Encoder effort benchmark)
+
+--effort の各段階について、出力形式ごとのエンコード時間と出力サイズを計測する。
+写真に近い画像と、単色領域の多いイラスト風の画像の両方で計測する。
+
+使用例:
+  python benchmarks/bench_effort.py
+  python benchmarks/bench_effort.py --size 1920 1080 --repeat 5 --json effort.json
+"""
+
+import argparse
+import io
+import json
+import sys
+import time
+
+from _common import make_graphic, make_photo
+
+from image_converter import ImageConverter, _save_options
+
+
+def measure(img, output_format, quality, effort, repeat):
+    """エンコード時間の最小値 (秒) と出力バイト数を返す"""
+    options = _save_options(output_format, quality, effort)
+    times = []
+    size = 0
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        img.save(buffer, format=output_format, **options)
+        times.append(time.perf_counter() - start)
+        size = buffer.tell()
+    return min(times), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='圧縮努力度ベンチマーク')
+    parser.add_argument('--size', nargs=2, type=int, default=[1600, 1200],
+                        metavar=('WIDTH', 'HEIGHT'), help='画像サイズ (デフォルト: 1600 1200)')
+    parser.add_argument('--quality', type=int, default=85, help='JPEG/WebP品質 (デフォルト: 85)')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数 (最小値を採用)')
+    parser.add_argument('--json', metavar='FILE', help='結果をJSONで保存する')
+    args = parser.parse_args()
+
+    size = tuple(args.size)
+    images = {'photo': make_photo(size), 'graphic': make_graphic(size)}
+    formats = ('JPEG', 'PNG', 'WEBP', 'TIFF')
+
+    results = []
+    print(f"{'image':<8} {'format':<6} {'effort':<8} {'time[ms]':>9} {'size[KB]':>9} {'vs max':>7}")
+    for image_name, img in images.items():
+        for output_format in formats:
+            rows = {}
+            for effort in ImageConverter.EFFORT_LEVELS:
+                elapsed, nbytes = measure(img, output_format, args.quality, effort, args.repeat)
+                rows[effort] = (elapsed, nbytes)
+                results.append({'image': image_name, 'format': output_format, 'effort': effort,
+                                'seconds': elapsed, 'bytes': nbytes})
+            max_bytes = rows['max'][1]
+            for effort, (elapsed, nbytes) in rows.items():
+                print(f"{image_name:<8} {output_format:<6} {effort:<8} {elapsed * 1000:9.1f} "
+                      f"{nbytes / 1024:9.1f} {nbytes / max_bytes:6.2f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'quality': args.quality, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+透明度合成ベンチマーク (Alpha flattening benchmark)
+
+JPEG/BMPへの変換で透明度を背景色と合成する処理 (_prepare_for_format) について、
+画像モードごとの処理時間と、Pillowが確保した画像の数を計測する。
+以前の実装 (パレット画像を帯状にRGBAへ変換して合成) と比較し、結果が一致することも確認する。
+
+使用例:
+  python benchmarks/bench_flatten.py
+  python benchmarks/bench_flatten.py --size 6000 4000 --repeat 5 --json flatten.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from PIL import Image, ImageChops
+
+from _common import make_photo
+
+from image_converter import _prepare_for_format
+
+# 以前の実装で透明度を扱っていたモード
+LEGACY_MODES = ('RGBA', 'LA', 'P')
+
+
+def legacy_flatten(img, background):
+    """以前の実装 (パレット画像は256行ずつRGBAへ変換して合成する)"""
+    flattened = Image.new('RGB', img.size, background)
+    if img.mode == 'P':
+        for top in range(0, img.height, 256):
+            box = (0, top, img.width, min(top + 256, img.height))
+            strip = img.crop(box).convert('RGBA')
+            flattened.paste(strip, box, mask=strip)
+    else:
+        flattened.paste(img, mask=img)
+    return flattened
+
+
+def make_sources(size):
+    """モードごとの半透明な入力画像を作る"""
+    rgba = make_photo(size).convert('RGBA')
+    rgba.putalpha(Image.linear_gradient('L').resize(size))
+    palette = rgba.quantize(256)
+    opaque_palette = make_photo(size).quantize(256)
+    return {
+        'RGBA': rgba,
+        'LA': rgba.convert('LA'),
+        'P': palette,
+        'P(opaque)': opaque_palette,
+        'PA': rgba.convert('PA'),
+        'RGBa': rgba.convert('RGBa'),
+    }
+
+
+def measure(function, img, background, repeat):
+    """処理時間の最小値 (秒)、1回あたりに確保した画像の数、結果を返す"""
+    times = []
+    result = None
+    allocations = 0
+    for _ in range(repeat):
+        before = Image.core.get_stats()['new_count']
+        start = time.perf_counter()
+        result = function(img, background)
+        times.append(time.perf_counter() - start)
+        allocations = Image.core.get_stats()['new_count'] - before
+    return min(times), allocations, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='透明度合成ベンチマーク')
+    parser.add_argument('--size', nargs=2, type=int, default=[4000, 3000],
+                        metavar=('WIDTH', 'HEIGHT'), help='画像サイズ (デフォルト: 4000 3000)')
+    parser.add_argument('--background', nargs=3, type=int, default=[255, 255, 255],
+                        metavar=('R', 'G', 'B'), help='背景色 (デフォルト: 255 255 255)')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数 (最小値を採用)')
+    parser.add_argument('--json', metavar='FILE', help='結果をJSONで保存する')
+    args = parser.parse_args()
+
+    size = tuple(args.size)
+    background = tuple(args.background)
+    sources = make_sources(size)
+
+    results = []
+    print(f"{size[0]}x{size[1]} -> RGB (背景 {background})")
+    print(f"{'mode':<10} {'legacy[ms]':>11} {'current[ms]':>12} {'speedup':>8} "
+          f"{'images':>8} {'max diff':>9}")
+    for mode, img in sources.items():
+        current, current_images, flattened = measure(
+            lambda i, b: _prepare_for_format(i, 'JPEG', b), img, background, args.repeat)
+        row = {'mode': mode, 'current_seconds': current, 'current_images': current_images,
+               'legacy_seconds': None, 'legacy_images': None, 'max_diff': None}
+        if img.mode in LEGACY_MODES:
+            legacy, legacy_images, expected = measure(legacy_flatten, img, background, args.repeat)
+            diff = max(high for _, high in ImageChops.difference(expected, flattened).getextrema())
+            row.update(legacy_seconds=legacy, legacy_images=legacy_images, max_diff=diff)
+            print(f"{mode:<10} {legacy * 1000:11.1f} {current * 1000:12.1f} "
+                  f"{legacy / current:7.2f}x {legacy_images:>3} -> {current_images:<2} {diff:9d}")
+        else:
+            print(f"{mode:<10} {'-':>11} {current * 1000:12.1f} {'-':>8} "
+                  f"{'-':>3} -> {current_images:<2} {'-':>9}")
+        results.append(row)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'background': background, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+縮小戦略ベンチマーク (Resample strategy benchmark)
+
+大きなJPEGを目標サイズへ縮小する際の処理時間とピークメモリを
+--resample-strategy ごとに計測する。ピークメモリを正しく測るため、
+戦略ごとに別プロセスで実行する。
+
+使用例:
+  python benchmarks/bench_resample.py
+  python benchmarks/bench_resample.py --source 6000 4000 --target 800 600 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from _common import make_photo, peak_rss_mb
+
+from image_converter import ImageConverter, _convert_file
+
+
+def make_source(path, size):
+    """カメラ画像に近い圧縮率になる合成JPEGを作成する"""
+    make_photo(size).save(path, quality=90)
+
+
+def run_child(strategy, source, target, repeat):
+    """1つの戦略を計測し、結果をJSONで標準出力に書く"""
+    output = os.path.join(os.path.dirname(source), f'out_{strategy}.jpg')
+    size = tuple(target)
+
+    decode_times = []
+    total_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with Image.open(source) as img:
+            if strategy != 'exact':
+                img.draft(img.mode, size if strategy == 'fast' else (size[0] * 2, size[1] * 2))
+            img.load()
+        decode_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        _convert_file(source, output, 90, size, strategy)
+        total_times.append(time.perf_counter() - start)
+
+    json.dump({
+        'strategy': strategy,
+        'decode_s': min(decode_times),
+        'convert_s': min(total_times),
+        'peak_rss_mb': peak_rss_mb(),
+    }, sys.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='縮小戦略ベンチマーク')
+    parser.add_argument('--source', nargs=2, type=int, default=[6000, 4000],
+                        metavar=('WIDTH', 'HEIGHT'), help='入力画像サイズ (デフォルト: 6000 4000)')
+    parser.add_argument('--target', nargs=2, type=int, default=[800, 600],
+                        metavar=('WIDTH', 'HEIGHT'), help='縮小後のサイズ (デフォルト: 800 600)')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数 (最小値を採用)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--source-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.source_file, args.target, args.repeat)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source.jpg')
+        make_source(source, tuple(args.source))
+        print(f"入力: {args.source[0]}x{args.source[1]} JPEG "
+              f"({os.path.getsize(source) / 1024 / 1024:.1f} MB) -> "
+              f"{args.target[0]}x{args.target[1]}")
+        print(f"{'strategy':<10} {'decode[s]':>10} {'convert[s]':>11} {'peak RSS[MB]':>13}")
+
+        for strategy in ImageConverter.RESAMPLE_STRATEGIES:
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--child', strategy, '--source-file', source,
+                '--target', *map(str, args.target), '--repeat', str(args.repeat),
+            ])
+            result = json.loads(output)
+            rss = result['peak_rss_mb']
+            rss_text = f"{rss:13.1f}" if rss is not None else f"{'-':>13}"
+            print(f"{strategy:<10} {result['decode_s']:10.3f} {result['convert_s']:11.3f} {rss_text}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+起動時間ベンチマーク (Startup time benchmark)
+
+CLIとGUIの入口 (モジュールのインポート、--help、引数の誤り、未対応の拡張子、GUIのインポート) を
+それぞれ新しいプロセスで `python -X importtime` 付きで実行し、インポートにかかった時間を計測する。
+何もしないインタープリタ (`python -c pass`) との差を増分とし、増分が予算を超えた場合や、
+画素に触れない入口でPillowなどの重いモジュールが読み込まれた場合は終了コード1を返す。
+バイトコードのキャッシュがある状態 (通常の起動) を測るため、各入口を1度実行してから計測する。
+
+使用例:
+  python benchmarks/bench_startup.py
+  python benchmarks/bench_startup.py --repeat 10 --cli-budget 60 --gui-budget 120 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import REPO_ROOT
+
+SCRIPT = os.path.join(REPO_ROOT, 'image_converter.py')
+
+# 画素に触れない入口で読み込まれてはならないモジュール
+HEAVY_MODULES = ('PIL.Image', 'PIL.ImageTk', 'asyncio', 'concurrent.futures')
+
+# (名前, 予算の種類, pythonに渡す引数, 読み込まれてはならないモジュール)
+ENTRIES = (
+    ('import', 'cli', ['-c', 'import image_converter'], HEAVY_MODULES + ('argparse',)),
+    ('cli-help', 'cli', [SCRIPT, '--help'], HEAVY_MODULES),
+    # -m ではスクリプト本体もバイトコードのキャッシュから読み込むため、コンパイルの時間がかからない
+    ('module-help', 'cli', ['-m', 'image_converter', '--help'], HEAVY_MODULES),
+    ('cli-error', 'cli', [SCRIPT, '--quality', '0', 'input.png', 'output.png'], HEAVY_MODULES),
+    ('cli-unsupported', 'cli', [SCRIPT, 'input.xyz', 'output.png'], HEAVY_MODULES),
+    ('gui-import', 'gui', ['-c', 'import image_converter_gui'], HEAVY_MODULES),
+)
+
+
+def parse_importtime(stderr):
+    """-X importtime の出力から (トップレベルの累積時間の合計 [秒], {モジュール: 累積時間 [秒]}) を返す"""
+    total = 0.0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        seconds = int(cumulative) / 1e6
+        modules[name.strip()] = seconds
+        # 字下げのないものはトップレベルのインポート (入れ子の時間を含む)
+        if not name[1:].startswith(' '):
+            total += seconds
+    return total, modules
+
+
+def run(arguments, work_dir, env):
+    """1回実行し、(インポート時間 [秒], 経過時間 [秒], {モジュール: 累積時間}) を返す"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', *arguments], cwd=work_dir,
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               text=True, encoding='utf-8', errors='replace')
+    elapsed = time.perf_counter() - start
+    total, modules = parse_importtime(completed.stderr)
+    return total, elapsed, modules
+
+
+def measure(arguments, work_dir, env, repeat):
+    """repeat回実行し、インポート時間と経過時間の最小値、読み込まれたモジュールを返す"""
+    run(arguments, work_dir, env)
+    runs = [run(arguments, work_dir, env) for _ in range(repeat)]
+    imports, elapsed, modules = zip(*runs)
+    return min(imports), min(elapsed), modules[0]
+
+
+def tkinter_available(env):
+    return subprocess.run([sys.executable, '-c', 'import tkinter'], env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='起動時間ベンチマーク')
+    parser.add_argument('--repeat', type=int, default=5, help='繰り返し回数 (最小値を採用)')
+    parser.add_argument('--cli-budget', type=float, default=80.0,
+                        help='CLIの入口のインポート時間の増分の上限 [ms] (デフォルト: 80)')
+    parser.add_argument('--gui-budget', type=float, default=150.0,
+                        help='GUIのインポート時間の増分の上限 [ms] (デフォルト: 150)')
+    parser.add_argument('--json', metavar='FILE', help='結果をJSONで保存する')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # 通常の起動と同じく、バイトコードのキャッシュを使う
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')]))
+    budgets = {'cli': args.cli_budget / 1000, 'gui': args.gui_budget / 1000}
+
+    results = []
+    ok = True
+    with tempfile.TemporaryDirectory() as work_dir:
+        base_import, base_elapsed, base_modules = measure(['-c', 'pass'], work_dir, env, args.repeat)
+        print(f"インタープリタのみ: インポート {base_import * 1000:.1f} ms, "
+              f"起動 {base_elapsed * 1000:.1f} ms")
+        print(f"{'entry':<16} {'import[ms]':>11} {'extra[ms]':>10} {'budget':>7} "
+              f"{'wall[ms]':>9}  slowest")
+
+        for name, kind, arguments, forbidden in ENTRIES:
+            if kind == 'gui' and not tkinter_available(env):
+                print(f"{name:<16} (tkinterが使えないため省略)")
+                continue
+            total, elapsed, modules = measure(arguments, work_dir, env, args.repeat)
+            extra = total - base_import
+            loaded = [module for module in forbidden if module in modules]
+            # インタープリタのみの起動では読み込まれないモジュールのうち、時間のかかったもの
+            slowest = sorted(((seconds, module) for module, seconds in modules.items()
+                              if module not in base_modules and '.' not in module),
+                             reverse=True)[:3]
+            over = extra > budgets[kind]
+            ok = ok and not over and not loaded
+            print(f"{name:<16} {total * 1000:11.1f} {extra * 1000:10.1f} "
+                  f"{budgets[kind] * 1000:7.0f} {elapsed * 1000:9.1f}  "
+                  + ', '.join(f"{module} {seconds * 1000:.1f}" for seconds, module in slowest)
+                  + (" 予算超過" if over else ""))
+            for module in loaded:
+                print(f"  エラー: {module} が読み込まれています ({modules[module] * 1000:.1f} ms)")
+            results.append({'entry': name, 'kind': kind, 'import_seconds': total,
+                            'extra_seconds': extra, 'budget_seconds': budgets[kind],
+                            'wall_seconds': elapsed, 'heavy_modules': loaded})
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'baseline_import_seconds': base_import,
+                       'baseline_wall_seconds': base_elapsed, 'results': results}, f, indent=2)
+    if not ok:
+        print("エラー: 起動時間の予算を超えた、または不要なモジュールを読み込んだ入口があります")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+変換ベンチマークスイート (Conversion benchmark suite)
+
+合成画像のコーパス（サイズ・カラーモード・EXIF回転・SUPPORTED_FORMATSの全形式）を
+生成し、入力形式と出力形式のすべての組み合わせについて、
+デコード・EXIF回転・リサイズ・透明度合成・エンコードの各段階の時間と、
+スループット (images/s, MP/s)、ピークRSSを計測する。
+ピークRSSを正しく測るため、組み合わせごとに別プロセスで実行する。
+
+結果はJSONで保存でき、--baseline で以前の結果と比較して性能低下を検出できる。
+
+使用例:
+  python benchmarks/bench_suite.py --json results.json
+  python benchmarks/bench_suite.py --sizes 640x480 3000x2000 --repeat 3
+  python benchmarks/bench_suite.py --json new.json --baseline old.json --threshold 0.15
+  python benchmarks/bench_suite.py --batch --workers 4
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageOps
+
+from _common import make_photo, peak_rss_mb
+
+from image_converter import (ImageConverter, _RESAMPLE_SETTINGS, _apply_draft,
+                             _prepare_for_format, _save_options)
+
+STAGES = ('decode', 'transpose', 'resize', 'flatten', 'encode')
+MODES = ('RGB', 'RGBA', 'P', 'L')
+ORIENTATIONS = (1, 3, 6, 8)
+
+
+def parse_size(text):
+    """'WIDTHxHEIGHT' 形式のサイズを解析する"""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def make_image(mode, size):
+    """指定モードの合成画像を作る"""
+    img = make_photo(size)
+    if mode == 'RGBA':
+        alpha = Image.linear_gradient('L').resize(size)
+        img.putalpha(alpha)
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.Palette.ADAPTIVE)
+    elif mode == 'L':
+        img = img.convert('L')
+    return img
+
+
+def build_corpus(corpus_dir, sizes):
+    """
+    全形式 x カラーモード x サイズのコーパスを作成する
+
+    形式が扱えないモードはスキップする。EXIF回転は画像ごとに順に割り当てる。
+
+    Returns:
+        dict: 形式名 -> ファイルパスのリスト
+    """
+    corpus = {}
+    index = 0
+    for output_format, extensions in ImageConverter.SUPPORTED_FORMATS.items():
+        files = []
+        for mode in MODES:
+            for size in sizes:
+                orientation = ORIENTATIONS[index % len(ORIENTATIONS)]
+                index += 1
+                path = os.path.join(corpus_dir, f"{mode}_{size[0]}x{size[1]}_o{orientation}{extensions[0]}")
+                img = make_image(mode, size)
+                exif = Image.Exif()
+                exif[0x0112] = orientation
+                try:
+                    try:
+                        img.save(path, format=output_format, exif=exif)
+                    except TypeError:
+                        img.save(path, format=output_format)
+                except (OSError, ValueError, KeyError):
+                    # この形式では保存できないモード (例: RGBAのJPEG)
+                    continue
+                files.append(path)
+        corpus[output_format] = files
+    return corpus
+
+
+def run_pair(files, output_format, args):
+    """
+    1組の入力形式と出力形式について各段階を計測する
+
+    Returns:
+        dict: 段階ごとの合計秒数、画像数、メガピクセル数、ピークRSS
+    """
+    stage_times = dict.fromkeys(STAGES, 0.0)
+    images = 0
+    megapixels = 0.0
+    output_bytes = 0
+    draft_scale, reducing_gap = _RESAMPLE_SETTINGS[args.resample_strategy]
+
+    for _ in range(args.repeat):
+        for path in files:
+            start = time.perf_counter()
+            with Image.open(path) as img:
+                source_size = img.size
+                if args.scale < 1 and draft_scale:
+                    target = (max(1, int(img.width * args.scale)), max(1, int(img.height * args.scale)))
+                    _apply_draft(img, target, draft_scale)
+                img.load()
+                t = time.perf_counter()
+                stage_times['decode'] += t - start
+
+                img = ImageOps.exif_transpose(img)
+                start, t = t, time.perf_counter()
+                stage_times['transpose'] += t - start
+
+                if args.scale < 1:
+                    target = (max(1, int(img.width * args.scale)), max(1, int(img.height * args.scale)))
+                    img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+                start, t = t, time.perf_counter()
+                stage_times['resize'] += t - start
+
+                img = _prepare_for_format(img, output_format)
+                start, t = t, time.perf_counter()
+                stage_times['flatten'] += t - start
+
+                buffer = io.BytesIO()
+                img.save(buffer, format=output_format,
+                         **_save_options(output_format, args.quality, args.effort))
+                start, t = t, time.perf_counter()
+                stage_times['encode'] += t - start
+
+            images += 1
+            megapixels += source_size[0] * source_size[1] / 1e6
+            output_bytes += buffer.tell()
+
+    return {
+        'images': images,
+        'megapixels': megapixels,
+        'output_bytes': output_bytes,
+        'stages': stage_times,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_batch(corpus_dir, output_format, args):
+    """batch_convertでコーパス全体を変換し、全体の時間を計測する"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        converter = ImageConverter()
+        devnull = open(os.devnull, 'w')
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            start = time.perf_counter()
+            converter.batch_convert(corpus_dir, output_dir, output_format, args.quality,
+                                    workers=args.workers, resample_strategy=args.resample_strategy,
+                                    effort=args.effort)
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+            devnull.close()
+    return {
+        'images': converter.processed_files,
+        'failed': converter.failed_files,
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def summarize(result):
+    """スループットを計算して結果に追加する"""
+    total = sum(result['stages'].values())
+    result['total_s'] = total
+    result['images_per_s'] = result['images'] / total if total else 0.0
+    result['mp_per_s'] = result['megapixels'] / total if total else 0.0
+    return result
+
+
+def compare(results, baseline_path, threshold):
+    """
+    以前の結果と比較し、スループットがthreshold以上低下した組み合わせを返す
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['input_format'], r['output_format']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['input_format'], result['output_format']))
+        if not old or not old.get('mp_per_s'):
+            continue
+        ratio = result['mp_per_s'] / old['mp_per_s']
+        if ratio < 1 - threshold:
+            regressions.append((result['input_format'], result['output_format'], ratio))
+    return regressions
+
+
+def child_main(args):
+    """子プロセス: 1組を計測してJSONを標準出力に書く"""
+    with open(args.corpus_index, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    if args.child_batch:
+        result = run_batch(args.child_batch, args.child_output, args)
+    else:
+        result = run_pair(corpus[args.child_input], args.child_output, args)
+    json.dump(result, sys.stdout)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='変換ベンチマークスイート')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[(640, 480), (1920, 1080)],
+                        metavar='WxH', help='コーパスの画像サイズ (デフォルト: 640x480 1920x1080)')
+    parser.add_argument('--scale', type=float, default=0.5,
+                        help='リサイズ段階の縮小率 (1で縮小なし、デフォルト: 0.5)')
+    parser.add_argument('--quality', type=int, default=85, help='JPEG/WebP品質 (デフォルト: 85)')
+    parser.add_argument('--effort', default='default', choices=ImageConverter.EFFORT_LEVELS,
+                        help='圧縮努力度 (デフォルト: default)')
+    parser.add_argument('--resample-strategy', default='exact',
+                        choices=ImageConverter.RESAMPLE_STRATEGIES, help='縮小戦略 (デフォルト: exact)')
+    parser.add_argument('--repeat', type=int, default=1, help='コーパスの繰り返し回数')
+    parser.add_argument('--input-formats', nargs='+', metavar='FORMAT',
+                        help='計測する入力形式 (デフォルト: すべて)')
+    parser.add_argument('--output-formats', nargs='+', metavar='FORMAT',
+                        help='計測する出力形式 (デフォルト: すべて)')
+    parser.add_argument('--batch', action='store_true',
+                        help='段階別の計測に加え、batch_convertの全体時間も計測する')
+    parser.add_argument('--workers', type=int, default=1, help='--batch時の並列数')
+    parser.add_argument('--corpus', metavar='DIR', help='コーパスの保存先 (省略時は一時ディレクトリ)')
+    parser.add_argument('--json', metavar='FILE', help='結果をJSONで保存する')
+    parser.add_argument('--baseline', metavar='FILE', help='比較する以前の結果 (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='性能低下とみなすMP/sの低下率 (デフォルト: 0.1)')
+    parser.add_argument('--child-input', help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    parser.add_argument('--child-batch', help=argparse.SUPPRESS)
+    parser.add_argument('--corpus-index', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.corpus_index:
+        return child_main(args)
+
+    formats = list(ImageConverter.SUPPORTED_FORMATS)
+    input_formats = [f.upper() for f in args.input_formats] if args.input_formats else formats
+    output_formats = [f.upper() for f in args.output_formats] if args.output_formats else formats
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = args.corpus or os.path.join(tmp_dir, 'corpus')
+        os.makedirs(corpus_dir, exist_ok=True)
+        corpus = build_corpus(corpus_dir, args.sizes)
+        corpus_index = os.path.join(tmp_dir, 'corpus.json')
+        with open(corpus_index, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f)
+        print(f"コーパス: {sum(len(v) for v in corpus.values())}ファイル ({corpus_dir})")
+
+        child_args = [
+            sys.executable, os.path.abspath(__file__), '--corpus-index', corpus_index,
+            '--scale', str(args.scale), '--quality', str(args.quality), '--effort', args.effort,
+            '--resample-strategy', args.resample_strategy, '--repeat', str(args.repeat),
+            '--workers', str(args.workers),
+        ]
+
+        header = (f"{'input':<5} {'output':<6} {'img/s':>8} {'MP/s':>8} "
+                  + ' '.join(f"{stage + '[ms]':>14}" for stage in STAGES) + f" {'RSS[MB]':>8}")
+        print(header)
+        results = []
+        for input_format in input_formats:
+            if not corpus.get(input_format):
+                continue
+            for output_format in output_formats:
+                output = subprocess.check_output(child_args + [
+                    '--child-input', input_format, '--child-output', output_format])
+                result = summarize(json.loads(output))
+                result.update(input_format=input_format, output_format=output_format)
+                results.append(result)
+                stage_ms = ' '.join(f"{result['stages'][stage] * 1000:14.1f}" for stage in STAGES)
+                rss = result['peak_rss_mb']
+                print(f"{input_format:<5} {output_format:<6} {result['images_per_s']:8.1f} "
+                      f"{result['mp_per_s']:8.1f} {stage_ms} "
+                      + (f"{rss:8.1f}" if rss is not None else f"{'-':>8}"))
+
+        batch_results = []
+        if args.batch:
+            for output_format in output_formats:
+                output = subprocess.check_output(child_args + [
+                    '--child-batch', corpus_dir, '--child-output', output_format])
+                result = json.loads(output)
+                result.update(output_format=output_format, workers=args.workers)
+                batch_results.append(result)
+                print(f"batch -> {output_format:<5} {result['images']}ファイル "
+                      f"{result['seconds']:.2f}s ({result['images'] / result['seconds']:.1f} img/s)")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pillow': Image.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items()
+                     if not key.startswith(('child', 'corpus_index'))},
+        },
+        'results': results,
+        'batch': batch_results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"結果を保存しました: {args.json}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        for input_format, output_format, ratio in regressions:
+            print(f"性能低下: {input_format} -> {output_format}: MP/s {ratio:.2f}倍")
+        if regressions:
+            return 1
+        print("性能低下は検出されませんでした")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,12 +7,58 @@ Windows用Python画像変換ツール
 対応フォーマット: JPEG, PNG, BMP, GIF, TIFF, WebP
 """
 
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import os
+import re
+import shutil
 import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional, Tuple
-from PIL import Image, ImageOps
-import argparse
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+# asyncio・concurrent.futures・csv・socket・argparseは使う関数の中で読み込む
+# (フックスクリプト等から何度も起動されるため、起動時に読み込むモジュールを最小にする)
+
+
+class _LazyModule:
+    """
+    最初に属性を参照したときに読み込むモジュールの代理
+    
+    Pillowの読み込みは起動時間の大半を占めるため、--helpや引数の誤り、
+    未対応の拡張子など画素に触れない実行では読み込まない。読み込んだ後は
+    このモジュールのグローバル名を本物のモジュールに置き換えるため、以降の参照は遅くならない。
+    """
+    
+    def __init__(self, name: str, alias: str):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_alias', alias)
+    
+    def _load(self):
+        # importはモジュール単位のロックで保護されるため、複数スレッドから呼んでもよい
+        # (importlib.import_moduleでは -X importtime に記録されないため __import__ を使う)
+        __import__(self._name)
+        module = sys.modules[self._name]
+        globals()[self._alias] = module
+        return module
+    
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+    
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._load(), name, value)
+
+
+Image = _LazyModule('PIL.Image', 'Image')
+ImageColor = _LazyModule('PIL.ImageColor', 'ImageColor')
+ImageOps = _LazyModule('PIL.ImageOps', 'ImageOps')
 
 
 class ImageConverter:
@@ -27,9 +73,55 @@ class ImageConverter:
         'WEBP': ['.webp']
     }
     
-    def __init__(self):
+    # 出力形式ごとの出力拡張子
+    OUTPUT_EXTENSIONS = {
+        'JPEG': '.jpg',
+        'PNG': '.png',
+        'BMP': '.bmp',
+        'GIF': '.gif',
+        'TIFF': '.tiff',
+        'WEBP': '.webp'
+    }
+    
+    # 縮小時の速度と品質のトレードオフ
+    RESAMPLE_STRATEGIES = ('fast', 'balanced', 'exact')
+    
+    # エンコード時の圧縮努力度（速度と出力サイズのトレードオフ）
+    EFFORT_LEVELS = ('fast', 'default', 'max')
+    
+    # resizeの解釈（縦横比を保つかどうか）
+    RESIZE_MODES = ('stretch', 'fit', 'fill', 'thumbnail')
+    
+    # 複数フレームの画像 (アニメーションGIF/WebP/PNG、複数ページのTIFF) の扱い
+    FRAME_MODES = ('all', 'first', 'split')
+    
+    def __init__(self, cache: Optional['OutputCache'] = None):
+        """
+        Args:
+            cache: 指定時は同じ入力内容・変換パラメータの変換をキャッシュから再利用する
+        """
+        self.processed_files = 0
+        self.failed_files = 0
+        self.skipped_files = 0
+        self.metrics = ConversionMetrics()
+        self.hooks = []
+        self.cache = cache
+        if cache is not None:
+            self.metrics.cache_stats = cache.stats
+    
+    def reset_stats(self) -> None:
+        """
+        変換統計とメトリクスを0に戻す
+        
+        同じインスタンスで複数回のバッチ変換を行う場合 (GUIなど) に、実行ごとの集計にする。
+        キャッシュのヒット・ミス統計はキャッシュ全体のものなので戻さない。
+        """
         self.processed_files = 0
         self.failed_files = 0
+        self.skipped_files = 0
+        self.metrics = ConversionMetrics()
+        if self.cache is not None:
+            self.metrics.cache_stats = self.cache.stats
         
     def get_supported_extensions(self) -> List[str]:
         """サポートされている拡張子のリストを取得"""
@@ -43,8 +135,125 @@ class ImageConverter:
         ext = Path(file_path).suffix.lower()
         return ext in self.get_supported_extensions()
     
+    def probe(self, file_path: str) -> dict:
+        """
+        ヘッダのみを読み、実際の形式・サイズ・モード・フレーム数・EXIFの向きを返す
+        
+        全体をデコードせずに、拡張子の誤り・未対応の形式・途中で切れたファイルを検出する。
+        
+        Returns:
+            dict: path, ok (変換できる場合True), error, warnings, format, width, height,
+                  mode, frames, orientation, bytes, pixels
+        """
+        return _probe_file(file_path)
+    
+    def probe_files(self, file_paths: List[str], workers: int = 0) -> List[dict]:
+        """
+        複数のファイルを並列に調べ、入力と同じ順で結果を返す
+        
+        ヘッダの読み込みは主にファイルI/Oのため、スレッドで並列化する。
+        workersが0の場合はCPUコア数の4倍 (最大32) のスレッドを使う。
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        workers = workers if workers > 0 else min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_probe_file, file_paths))
+    
+    def make_thumbnail(self, file_path: str, size: Tuple[int, int]):
+        """
+        一覧表示用のサムネイル (RGBまたはRGBA、size以内) を作る
+        
+        JPEGは縮小デコードするため、全体をデコードするより大幅に速い。
+        複数フレームの画像は先頭フレームを使う。
+        """
+        return _make_thumbnail(file_path, size)
+    
+    def preview(self, input_path: str, output_format: str, quality: int = 95,
+                box: Tuple[int, int] = (320, 240), **options) -> dict:
+        """
+        変換結果をメモリ上で作り、出力サイズと変換前後の見た目を返す
+        
+        出力は実際の変換と同じ処理で作るため、バイト数は保存した場合と一致する。
+        変換前後の画像は、出力の解像度で中央をboxの大きさに切り出したもの
+        (圧縮による劣化を等倍で比べられる)。
+        
+        Args:
+            options: _convert_streamのキーワード引数 (resize, resize_mode, effort, background等)
+        
+        Returns:
+            dict: before, after (PIL画像), input_bytes, output_bytes, size (出力の幅と高さ)
+        """
+        return _preview_conversion(input_path, output_format, quality, box, options)
+    
+    def iter_image_files(self, input_dir: str, recursive: bool = False,
+                         exclude_dir: Optional[str] = None,
+                         on_event: Optional[Callable[[dict], None]] = None) -> Iterator[str]:
+        """
+        ディレクトリ内の画像ファイルを1回の走査で順に返すジェネレータ
+        
+        os.scandirでディレクトリごとに1度だけ一覧を取得し、拡張子は集合で判定する。
+        各ディレクトリ内は名前順で返すため、結果の順序は決定的になる。
+        ディレクトリへのシンボリックリンクは循環を避けるため辿らない。
+        
+        Args:
+            input_dir: 入力ディレクトリ
+            recursive: Trueの場合、サブディレクトリも走査する
+            exclude_dir: 走査しないディレクトリ（入力内に置かれた出力先など）
+            on_event: 読み込めないディレクトリの警告 (messageイベント) を受け取るコールバック
+                      (省略時は標準出力に表示)
+        """
+        emit = on_event or self.print_event
+        extensions = set(self.get_supported_extensions())
+        excluded = os.path.normcase(os.path.abspath(exclude_dir)) if exclude_dir else None
+        seen = set()
+        stack = [input_dir]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                emit({'type': 'message', 'message': f"警告: ディレクトリを読み込めません: {directory} ({e})"})
+                continue
+            
+            subdirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and os.path.normcase(os.path.abspath(entry.path)) != excluded:
+                            subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                # 書き込み中 (または中断で残った) 一時ファイルは変換しない
+                if _TEMP_OUTPUT_NAME.match(entry.name):
+                    continue
+                # 大文字小文字を区別しないファイルシステムでの重複を除く
+                key = os.path.normcase(entry.path)
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield entry.path
+            
+            # 名前順に処理されるよう逆順で積む
+            stack.extend(reversed(subdirs))
+    
     def convert_image(self, input_path: str, output_path: str, 
-                     quality: int = 95, resize: Optional[Tuple[int, int]] = None) -> bool:
+                     quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                     resample_strategy: str = 'exact', effort: str = 'default',
+                     on_event: Optional[Callable[[dict], None]] = None,
+                     max_memory: Optional[int] = None,
+                     max_pixels: Optional[int] = None,
+                     passthrough: bool = False,
+                     resize_mode: str = 'stretch',
+                     frames: str = 'all',
+                     background: Tuple[int, int, int] = (255, 255, 255),
+                     target_size: Optional[int] = None) -> bool:
         """
         画像を変換する
         
@@ -53,69 +262,382 @@ class ImageConverter:
             output_path: 出力ファイルパス
             quality: JPEG品質 (1-100)
             resize: リサイズサイズ (width, height) またはNone
+                    (resize_modeがstretch以外では縦横比を保つための枠)
+            resample_strategy: 縮小戦略 ('fast', 'balanced', 'exact')
+            effort: 圧縮努力度 ('fast', 'default', 'max')
+            on_event: 進捗イベントを受け取るコールバック (省略時は標準出力に表示)
+            max_memory: 1ファイルの変換に使うメモリの上限 (バイト、Noneで無制限)
+            max_pixels: 画素数の上限 (Noneで Pillow の既定値、0で無制限)
+            passthrough: Trueの場合、入力が出力と同じ形式で向きとサイズの変更も
+                         不要なら再エンコードせずにコピーする
+                         (向きだけが異なるJPEGはjpegtranがあれば可逆に回転する)
+            resize_mode: リサイズ方法
+                         stretch: resizeのサイズにする (縦横比は保たない)
+                         fit: 縦横比を保ってresizeに収める (拡大しない)
+                         fill: 縦横比を保ってresizeを覆うように縮小し、中央を切り取る
+                         thumbnail: fitと同じサイズを、縮小デコードとその場での縮小で作る
+            frames: 複数フレームの画像の扱い
+                    all: 全フレームを変換する。出力形式が複数フレームを保存できない場合
+                         (JPEG, BMP) は「名前_p001.拡張子」のようにフレームごとに保存する
+                    first: 先頭フレームのみを変換する
+                    split: 出力形式によらず、フレームごとのファイルに保存する
+            background: 透明度を扱えない形式 (JPEG, BMP) で透明部分に合成する背景色 (R, G, B)
+            target_size: 出力の上限 (バイト、JPEG/WebPのみ)。1度だけデコードし、
+                         メモリ上でエンコードしながら上限に収まる最大の品質 (quality以下) を
+                         二分探索する。探索の記録は結果のquality_searchに入る
             
         Returns:
             bool: 変換成功時True、失敗時False
         """
-        try:
-            # 入力ファイルの存在確認
-            if not os.path.exists(input_path):
-                print(f"エラー: 入力ファイルが見つかりません: {input_path}")
-                return False
-            
-            # 出力ディレクトリの作成
-            output_dir = os.path.dirname(output_path)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+        options = {'quality': quality, 'resize': resize,
+                   'resample_strategy': resample_strategy,
+                   'effort': effort, 'max_memory': max_memory,
+                   'max_pixels': max_pixels, 'passthrough': passthrough,
+                   'resize_mode': resize_mode, 'frames': frames,
+                   'background': background, 'target_size': target_size}
+        params = OutputManifest.make_params(_format_for_path(output_path) or '', options)
+        result = self._convert_cached((input_path, output_path, options), params)
+        self._report(result)
+        self._emit_result(on_event, result, completed=1, total=1)
+        return result['success']
+    
+    def add_hook(self, callback: Callable[[dict], None]) -> None:
+        """
+        ファイルごとの変換完了時に呼ばれるコールバックを登録する
+        
+        コールバックには変換結果の辞書 (input, output, outputs, success, error,
+        timings, elapsed, input_bytes, output_bytes) が渡される。
+        並列実行時も親プロセスで入力順に呼ばれる。
+        """
+        self.hooks.append(callback)
+    
+    @staticmethod
+    def load_preset(preset_path: str) -> List[dict]:
+        """
+        レンディションのプリセットファイル (JSON) を読み込む
+        
+        形式はレンディションのリスト、または {"renditions": [...]}。
+        各レンディションは format (必須), quality, size ([幅, 高さ]), name, effort を持つ。
+        
+        Returns:
+            List[dict]: name, format, quality, size, effort を持つ正規化済みのリスト
+            (effortが省略された場合はNoneで、変換時の指定に従う)
             
-            # 画像を開く
-            with Image.open(input_path) as img:
-                # EXIF情報に基づく自動回転
-                img = ImageOps.exif_transpose(img)
-                
-                # リサイズ処理
-                if resize:
-                    img = img.resize(resize, Image.Resampling.LANCZOS)
-                
-                # 出力形式の決定
-                output_ext = Path(output_path).suffix.lower()
-                
-                # PNG以外の場合、透明度を処理
-                if output_ext in ['.jpg', '.jpeg', '.bmp']:
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        # 白背景で透明度を合成
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                        img = background
-                
-                # 保存設定
-                save_kwargs = {}
-                if output_ext in ['.jpg', '.jpeg']:
-                    save_kwargs['quality'] = quality
-                    save_kwargs['optimize'] = True
-                elif output_ext == '.png':
-                    save_kwargs['optimize'] = True
-                elif output_ext == '.webp':
-                    save_kwargs['quality'] = quality
-                    save_kwargs['method'] = 6  # 最高品質の圧縮
-                
-                # 画像を保存
-                img.save(output_path, **save_kwargs)
-                
-            print(f"変換完了: {input_path} -> {output_path}")
-            self.processed_files += 1
-            return True
+        Raises:
+            ValueError: プリセットの内容が不正な場合
+        """
+        with open(preset_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get('renditions')
+        if not isinstance(data, list) or not data:
+            raise ValueError(f"プリセットにレンディションがありません: {preset_path}")
+        
+        renditions = []
+        for entry in data:
+            output_format = str(entry.get('format', '')).upper()
+            if output_format not in ImageConverter.OUTPUT_EXTENSIONS:
+                raise ValueError(f"プリセットの出力形式が不正です: {entry.get('format')}")
+            quality = int(entry.get('quality', 95))
+            if quality < 1 or quality > 100:
+                raise ValueError(f"プリセットの品質は1-100の間で指定してください: {quality}")
+            size = entry.get('size')
+            if size is not None:
+                if len(size) != 2 or min(size) < 1:
+                    raise ValueError(f"プリセットのサイズが不正です: {size}")
+                size = [int(size[0]), int(size[1])]
+            effort = entry.get('effort')
+            if effort is not None and effort not in ImageConverter.EFFORT_LEVELS:
+                raise ValueError(f"プリセットの圧縮努力度が不正です: {effort}")
+            name = entry.get('name') or (f"{size[0]}x{size[1]}" if size else 'full')
+            renditions.append({'name': name, 'format': output_format,
+                               'quality': quality, 'size': size, 'effort': effort})
+        
+        keys = [(r['name'], r['format']) for r in renditions]
+        if len(set(keys)) != len(keys):
+            raise ValueError("プリセットのレンディション名と形式の組み合わせが重複しています")
+        return renditions
+    
+    def convert_renditions(self, input_path: str, output_dir: str, renditions: List[dict],
+                           resample_strategy: str = 'exact', effort: str = 'default',
+                           on_event: Optional[Callable[[dict], None]] = None,
+                           max_memory: Optional[int] = None,
+                           max_pixels: Optional[int] = None,
+                           background: Tuple[int, int, int] = (255, 255, 255)) -> bool:
+        """
+        1つの画像から複数の形式・サイズの出力を作成する
+        
+        入力は1度だけデコードし、すべての出力で共有する。
+        出力ファイル名は "{元のファイル名}_{レンディション名}{拡張子}"。
+        
+        Args:
+            input_path: 入力ファイルパス
+            output_dir: 出力ディレクトリ
+            renditions: load_presetで読み込んだレンディションのリスト
+            resample_strategy: 縮小戦略 ('fast', 'balanced', 'exact')
+            effort: 圧縮努力度 (レンディションでeffortが省略された場合に使用)
+            on_event: 進捗イベントを受け取るコールバック (省略時は標準出力に表示)
+            max_memory: 1ファイルの変換に使うメモリの上限 (バイト、Noneで無制限)
+            max_pixels: 画素数の上限 (Noneで Pillow の既定値、0で無制限)
+            background: JPEG/BMPの出力で透明部分に合成する背景色 (R, G, B)
             
+        Returns:
+            bool: 変換成功時True、失敗時False
+        """
+        output_base = os.path.join(output_dir, Path(input_path).stem)
+        options = {'renditions': renditions,
+                   'resample_strategy': resample_strategy,
+                   'effort': effort, 'max_memory': max_memory,
+                   'max_pixels': max_pixels, 'background': background}
+        params = OutputManifest.make_params('', options)
+        result = self._convert_cached((input_path, output_base, options), params)
+        self._report(result)
+        self._emit_result(on_event, result, completed=1, total=1)
+        return result['success']
+    
+    def convert_stream(self, source: BinaryIO, destination: BinaryIO, output_format: str,
+                       quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                       resample_strategy: str = 'exact', effort: str = 'default',
+                       max_memory: Optional[int] = None,
+                       max_pixels: Optional[int] = None,
+                       resize_mode: str = 'stretch', frames: str = 'all',
+                       background: Tuple[int, int, int] = (255, 255, 255),
+                       target_size: Optional[int] = None) -> None:
+        """
+        ファイルライクオブジェクト間で画像を変換する
+        
+        一時ファイルを使わずに、読み込み可能なsourceから書き込み可能なdestinationへ
+        output_format形式で書き出す。ファイル単位の統計・フック・イベントは扱わない。
+        複数フレームの画像は、出力形式が複数フレームを保存できない場合は先頭フレームのみを
+        変換する (framesに'split'は指定できない)。
+        
+        Raises:
+            ValueError: 出力形式が未対応の場合、または画像が上限を超える場合
+            OSError: 画像として読み込めない、または書き込めない場合
+        """
+        _convert_stream(source, destination, _normalize_format(output_format),
+                        quality, resize, resample_strategy, effort, max_memory, max_pixels,
+                        resize_mode, frames, background, target_size=target_size)
+    
+    def convert_bytes(self, data: bytes, output_format: str,
+                      quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                      resample_strategy: str = 'exact', effort: str = 'default',
+                      max_memory: Optional[int] = None,
+                      max_pixels: Optional[int] = None,
+                      resize_mode: str = 'stretch', frames: str = 'all',
+                      background: Tuple[int, int, int] = (255, 255, 255),
+                      target_size: Optional[int] = None) -> bytes:
+        """
+        メモリ上の画像データを変換し、変換後のデータを返す
+        
+        引数と例外はconvert_streamと同じ。
+        """
+        return _convert_bytes(data, _normalize_format(output_format), {
+            'quality': quality, 'resize': resize, 'resample_strategy': resample_strategy,
+            'effort': effort, 'max_memory': max_memory, 'max_pixels': max_pixels,
+            'resize_mode': resize_mode, 'frames': frames, 'background': background,
+            'target_size': target_size})
+    
+    def combine_images(self, input_dir: str, output_path: str,
+                       quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                       resample_strategy: str = 'exact', effort: str = 'default',
+                       on_event: Optional[Callable[[dict], None]] = None,
+                       max_memory: Optional[int] = None,
+                       max_pixels: Optional[int] = None,
+                       resize_mode: str = 'stretch') -> bool:
+        """
+        ディレクトリ内の画像をファイル名順に1つの複数ページTIFFやアニメーションにまとめる
+        
+        フレームごとのファイルを複数フレームの形式 (TIFF, GIF, WebP, PNG) に戻す用途を想定する。
+        入力は1枚ずつ開いて変換し、保存した後に閉じる。各入力は先頭フレームのみを使う。
+        アニメーションにまとめる場合、サイズの異なる画像は1枚目のサイズの透明な余白の中央に置く。
+        引数はconvert_imageと同じ。
+        
+        Returns:
+            bool: 変換成功時True、失敗時False
+        """
+        input_paths = list(self.iter_image_files(input_dir, on_event=on_event))
+        result = _new_result(input_dir, output_path)
+        timer = _StageTimer()
+        start = time.perf_counter()
+        try:
+            result['input_bytes'] = sum(os.path.getsize(path) for path in input_paths)
+            _combine_files(input_paths, output_path, quality, resize, resample_strategy, effort,
+                           max_memory, max_pixels, resize_mode, timer=timer)
+            result['outputs'] = [output_path]
+            result['output_bytes'] = os.path.getsize(output_path)
+            result['success'] = True
         except Exception as e:
-            print(f"変換エラー ({input_path}): {str(e)}")
+            result['error'] = f"変換エラー ({input_dir}): {str(e)}"
+        result['elapsed'] = time.perf_counter() - start
+        result['timings'] = timer.timings
+        self._report(result)
+        self._emit_result(on_event, result, completed=1, total=1)
+        return result['success']
+    
+    def _cache_key(self, input_path: str, params: dict) -> Optional[str]:
+        """キャッシュキーを返す (キャッシュを使わない場合や入力を読めない場合はNone)"""
+        if self.cache is None:
+            return None
+        try:
+            return OutputCache.make_key(input_path, params)
+        except OSError:
+            return None
+    
+    def _fetch_cached(self, input_path: str, output_path: str, outputs: List[str],
+                      key: str) -> Optional[dict]:
+        """キャッシュにあれば出力先へ配置し、変換結果と同じ形式の辞書を返す"""
+        start = time.perf_counter()
+        if not self.cache.fetch(key, outputs):
+            return None
+        return {
+            'input': input_path, 'output': output_path, 'outputs': outputs,
+            'success': True, 'error': None, 'cached': True, 'timings': {},
+            'elapsed': time.perf_counter() - start,
+            'input_bytes': os.path.getsize(input_path),
+            'output_bytes': sum(os.path.getsize(path) for path in outputs),
+        }
+    
+    def _convert_cached(self, task: tuple, params: dict) -> dict:
+        """キャッシュにあれば再利用し、なければ変換してキャッシュに追加する"""
+        input_path, output_path, _ = task
+        key = self._cache_key(input_path, params)
+        result = self._fetch_cached(input_path, output_path, _task_outputs(task), key) if key else None
+        if result is None:
+            result = _convert_task(task)
+            if key and result['success']:
+                self.cache.store(key, result['outputs'])
+        return result
+    
+    def _report(self, result: dict, manifest: Optional['OutputManifest'] = None,
+                params: Optional[dict] = None) -> None:
+        """変換結果を統計・メトリクス・マニフェストに反映してフックを呼ぶ"""
+        self.metrics.add(result)
+        for hook in self.hooks:
+            hook(result)
+        
+        if result['success']:
+            self.processed_files += 1
+            if manifest:
+                manifest.record(result['input'], result['output'], params, result['outputs'])
+        else:
             self.failed_files += 1
-            return False
+    
+    @staticmethod
+    def format_event(event: dict) -> Optional[str]:
+        """進捗イベントを表示用の文字列にする (表示しないイベントはNone)"""
+        event_type = event['type']
+        if event_type == 'start':
+            total = event.get('total')
+            lines = [f"バッチ変換開始: {event['input_dir']}"
+                     + (f" ({total}ファイル)" if total is not None else "")]
+            renditions = event.get('renditions')
+            if renditions:
+                lines.append("レンディション: " + ', '.join(
+                    f"{r['name']} ({r['format']}"
+                    + (f" {r['size'][0]}x{r['size'][1]})" if r['size'] else ")")
+                    for r in renditions))
+            else:
+                lines.append(f"出力形式: {event['output_format']}")
+                resize = event.get('resize')
+                if resize:
+                    mode = event.get('resize_mode', 'stretch')
+                    lines.append(f"リサイズ: {resize[0]}x{resize[1]}"
+                                 + (f" ({mode})" if mode != 'stretch' else ""))
+            if event.get('workers', 1) > 1:
+                lines.append(f"並列数: {event['workers']}")
+            if event.get('shard'):
+                lines.append(f"シャード: {event['shard'][0]}/{event['shard'][1]}")
+            return '\n'.join(lines)
+        if event_type == 'file_done':
+            result = event['result']
+            note = ''
+            if result.get('cached'):
+                note = " (キャッシュ)"
+            elif result.get('passthrough'):
+                note = " (無変換コピー)" if result['passthrough'] == 'copy' else " (可逆回転)"
+            elif result.get('quality_search'):
+                search = result['quality_search']
+                note = (f" (品質 {search['quality']}, {search['bytes'] / 1024:.1f} KB, "
+                        f"エンコード{search['encodes']}回)")
+            return f"変換完了: {result['input']} -> {', '.join(result['outputs'])}{note}"
+        if event_type == 'file_failed':
+            return event['result']['error']
+        if event_type in ('message', 'error'):
+            return event['message']
+        if event_type == 'probe':
+            return ImageConverter.format_probe(event['probe'])
+        if event_type == 'preflight':
+            text = (f"事前確認: {event['files']}ファイル (読み込めないファイル: {event['rejected']}), "
+                    f"合計 {event['megapixels']:.1f} メガピクセル")
+            if event['estimated_seconds'] is not None:
+                text += f", 推定所要時間: 約{event['estimated_seconds']:.1f}秒 (並列数 {event['workers']})"
+            return text
+        if event_type == 'summary':
+            title = "バッチ変換を中止しました" if event.get('cancelled') else "バッチ変換完了!"
+            lines = ["\n" + title, f"成功: {event['processed']}ファイル"]
+            if event['skipped'] > 0:
+                lines.append(f"スキップ (変更なし): {event['skipped']}ファイル")
+            if event.get('claimed'):
+                lines.append(f"変換済み・他のプロセスが担当: {event['claimed']}ファイル")
+            if event['failed'] > 0:
+                lines.append(f"失敗: {event['failed']}ファイル")
+            return '\n'.join(lines)
+        return None
+    
+    @staticmethod
+    def format_probe(probe: dict) -> str:
+        """probeの結果を表示用の1行にする"""
+        if not probe['ok'] and probe['format'] is None:
+            return f"NG {probe['path']}: {probe['error']}"
+        text = (f"{'OK' if probe['ok'] else 'NG'} {probe['path']}: {probe['format']} "
+                f"{probe['width']}x{probe['height']} {probe['mode']}")
+        if probe['frames'] > 1:
+            text += f" {probe['frames']}フレーム"
+        if probe['orientation'] != 1:
+            text += f" 向き={probe['orientation']}"
+        notes = ([probe['error']] if probe['error'] else []) + probe['warnings']
+        if notes:
+            text += f" ({'; '.join(notes)})"
+        return text
+    
+    @staticmethod
+    def print_event(event: dict) -> None:
+        """進捗イベントを標準出力に表示する (on_event省略時の動作)"""
+        text = ImageConverter.format_event(event)
+        if text is not None:
+            print(text)
+    
+    def _emit_result(self, on_event: Optional[Callable[[dict], None]], result: dict,
+                     completed: int, total: Optional[int]) -> None:
+        """変換結果をfile_done/file_failedイベントとして通知する"""
+        (on_event or self.print_event)({
+            'type': 'file_done' if result['success'] else 'file_failed',
+            'result': result, 'completed': completed, 'total': total,
+        })
     
     def batch_convert(self, input_dir: str, output_dir: str, 
                      output_format: str, quality: int = 95,
-                     resize: Optional[Tuple[int, int]] = None) -> None:
+                     resize: Optional[Tuple[int, int]] = None,
+                     workers: int = 1, incremental: bool = False,
+                     resample_strategy: str = 'exact',
+                     recursive: bool = False,
+                     renditions: Optional[List[dict]] = None,
+                     effort: str = 'default',
+                     metrics_files: Optional[List[str]] = None,
+                     on_event: Optional[Callable[[dict], None]] = None,
+                     prescan: bool = False,
+                     max_memory: Optional[int] = None,
+                     max_pixels: Optional[int] = None,
+                     preflight: bool = False, dry_run: bool = False,
+                     passthrough: bool = False, resize_mode: str = 'stretch',
+                     frames: str = 'all',
+                     background: Tuple[int, int, int] = (255, 255, 255),
+                     resume: bool = False,
+                     control: Optional['BatchControl'] = None,
+                     target_size: Optional[int] = None,
+                     shard: Optional[Tuple[int, int]] = None,
+                     claim_dir: Optional[str] = None, durable: bool = False) -> None:
         """
         バッチ変換
         
@@ -125,99 +647,3148 @@ class ImageConverter:
             output_format: 出力形式 (例: 'PNG', 'JPEG')
             quality: JPEG品質
             resize: リサイズサイズ
+            workers: 並列実行するプロセス数 (1で逐次実行、0でCPUコア数)
+            incremental: Trueの場合、前回から入力と変換パラメータが
+                         変わっていないファイルをスキップする
+            resample_strategy: 縮小戦略 ('fast', 'balanced', 'exact')
+            recursive: Trueの場合、サブディレクトリも変換し、
+                       出力ディレクトリに同じ構成で保存する
+            renditions: 指定時は各ファイルからこれらのレンディションを作成する
+                        (output_format, quality, resizeは使用しない)
+            effort: 圧縮努力度 ('fast', 'default', 'max')
+            metrics_files: 終了時にメトリクスを書き出すファイル
+                           (拡張子 .json / .csv / .prom で形式を指定)
+            on_event: 進捗イベントを受け取るコールバック (省略時は標準出力に表示)
+            prescan: Trueの場合、変換前にファイル一覧を作成し、
+                     startイベントで総数 (total) を通知する
+            max_memory: 1ファイルの変換に使うメモリの上限 (バイト、Noneで無制限)。
+                        並列実行時のピークはおよそ workers 倍になる
+            max_pixels: 画素数の上限 (Noneで Pillow の既定値、0で無制限)
+            preflight: Trueの場合、変換前に全ファイルのヘッダを並列に調べ、
+                       読み込めないファイルをデコードせずに失敗とし、
+                       大きい画像から順に変換して、全体の所要時間を見積もる
+            dry_run: Trueの場合、ヘッダの調査と見積もりのみを行い、変換しない
+            passthrough: Trueの場合、画素を変える必要のないファイルは再エンコードせずに
+                         コピーする (convert_imageと同じ、レンディションでは使用しない)
+            resize_mode: リサイズ方法 ('stretch', 'fit', 'fill', 'thumbnail'、convert_imageと同じ)
+            frames: 複数フレームの画像の扱い ('all', 'first', 'split'、convert_imageと同じ、
+                    レンディションでは先頭フレームのみを使う)
+            background: JPEG/BMPの出力で透明部分に合成する背景色 (R, G, B)
+            resume: Trueの場合、同じパラメータで中断したバッチのジャーナルを読み込み、
+                    変換済みのファイルをスキップして続きから変換する
+            control: 別スレッドから中止・一時停止するためのBatchControl。
+                     一時停止中は新しいファイルの変換を始めず、中止時は変換中のファイルの
+                     完了を待って終了する (ジャーナルは残るため、resumeで再開できる)
+            target_size: 出力の上限 (バイト、JPEG/WebPのみ、convert_imageと同じ、レンディションとは併用不可)。
+                         直近のファイルで見つかった品質の中央値を次のファイルの探索の
+                         初期値にするため、似た画像が続くと1ファイルあたり2回程度のエンコードで済む
+            shard: (番号, 総数) を指定すると、入力ディレクトリからの相対パスのハッシュで
+                   入力を総数個に分け、番号 (1から総数) のものだけを変換する。
+                   ホストごとに番号を変えて実行すると、1つのバッチを重複なく分担できる
+            claim_dir: 指定すると、共有ディレクトリのクレームファイル (WorkClaims) で
+                       ファイルごとに担当を取得し、他のプロセスが取得済みのファイルは変換しない。
+                       同じ設定で複数のホストから実行すると、コーディネーターなしで分担できる。
+                       ジャーナルは使わず、resume時は終了したプロセスが残したクレームと
+                       失敗したファイルのクレームを解放してから変換する
+            durable: Trueの場合、ジャーナルに完了を記録した出力ファイルを記録の書き出し前にfsyncし、
+                     電源断でも変換済みの出力を失わないようにする (出力1件ごとにfsyncが1回増える)
+        
+        出力は一時ファイルに書いてから置き換えるため、中断しても途中まで書かれた出力は残らない。
+        変換の進み具合は出力ディレクトリのジャーナル (BatchJournal、シャードごとに別のファイル) に
+        記録し、すべてのファイルが成功した場合は削除する。
+        
+        進捗イベントはtypeキーを持つ辞書で、親プロセスから順に通知される:
+            start: input_dir, output_dir, output_format, resize, resize_mode, renditions,
+                   workers, total (prescan時のみ、それ以外はNone)
+            probe: probe (ImageConverter.probeの結果、dry_run時のみ)
+            preflight: files, rejected, megapixels, estimated_seconds (preflight/dry_run時)
+            file_done / file_failed: result (変換結果), completed (処理済み数), total
+            file_skipped: input, output, completed, total
+            message / error: message
+            summary: processed, failed, skipped (今回の実行分の件数)、
+                     claimed (claim_dir指定時、変換済みまたは他のプロセスが担当していたファイルの数)、
+                     cancelled (controlで中止した場合True)
         """
+        emit = on_event or self.print_event
+        
         if not os.path.exists(input_dir):
-            print(f"エラー: 入力ディレクトリが見つかりません: {input_dir}")
+            emit({'type': 'error', 'message': f"エラー: 入力ディレクトリが見つかりません: {input_dir}"})
+            return
+        if incremental and (shard or claim_dir):
+            # マニフェストは1つのプロセスが書き直す前提のため、複数のプロセスで共有できない
+            emit({'type': 'error', 'message':
+                  "エラー: インクリメンタル変換はシャード・クレームと同時に使えません"})
+            return
+        if renditions and target_size:
+            # レンディションはそれぞれの品質で保存するため、目標サイズの探索を行わない
+            emit({'type': 'error', 'message': "エラー: 目標サイズはレンディションと同時に使えません"})
             return
         
-        # 出力拡張子を決定
-        format_extensions = {
-            'JPEG': '.jpg',
-            'PNG': '.png',
-            'BMP': '.bmp',
-            'GIF': '.gif',
-            'TIFF': '.tiff',
-            'WEBP': '.webp'
-        }
+        # 出力拡張子を決定 (レンディション指定時は拡張子なしの基準パスを渡す)
+        if renditions:
+            output_ext = ''
+        else:
+            output_ext = self.OUTPUT_EXTENSIONS.get(output_format.upper(), '.png')
         
-        output_ext = format_extensions.get(output_format.upper(), '.png')
+        if workers < 1:
+            workers = os.cpu_count() or 1
         
-        # 入力ディレクトリ内の画像ファイルを取得
-        input_files = []
-        for ext in self.get_supported_extensions():
-            pattern = f"*{ext}"
-            input_files.extend(Path(input_dir).glob(pattern))
-            input_files.extend(Path(input_dir).glob(pattern.upper()))
+        input_files = self.iter_image_files(input_dir, recursive, exclude_dir=output_dir,
+                                            on_event=emit)
+        if shard:
+            index, count = shard
+            input_files = (path for path in input_files
+                           if _shard_of(_work_key(path, input_dir), count) == index)
+        total = None
+        if prescan or preflight or dry_run:
+            input_files = list(input_files)
+            total = len(input_files)
         
-        if not input_files:
-            print(f"変換対象の画像ファイルが見つかりません: {input_dir}")
-            return
+        probes = {}
+        if preflight or dry_run:
+            probe_results = self.probe_files(input_files)
+            probes = {probe['path']: probe for probe in probe_results}
+            # 読み込めないファイルを先に報告し、残りは大きい画像から変換する
+            # (並列実行の最後に大きな画像が1つだけ残るのを避ける)
+            input_files.sort(key=lambda path: (probes[path]['ok'], -probes[path]['pixels']))
         
-        print(f"バッチ変換開始: {len(input_files)}ファイル")
-        print(f"出力形式: {output_format.upper()}")
-        if resize:
-            print(f"リサイズ: {resize[0]}x{resize[1]}")
+        emit({'type': 'start', 'input_dir': input_dir, 'output_dir': output_dir,
+              'output_format': output_format.upper(), 'resize': resize,
+              'resize_mode': resize_mode,
+              'renditions': renditions, 'workers': workers, 'total': total, 'shard': shard})
+        
+        if renditions:
+            options = {'renditions': renditions, 'resample_strategy': resample_strategy,
+                       'effort': effort}
+        else:
+            options = {'quality': quality, 'resize': resize,
+                       'resample_strategy': resample_strategy, 'effort': effort,
+                       'passthrough': passthrough, 'resize_mode': resize_mode,
+                       'frames': frames, 'target_size': target_size}
+        options.update(max_memory=max_memory, max_pixels=max_pixels, background=background)
+        
+        if probes:
+            if dry_run:
+                for input_file in input_files:
+                    emit({'type': 'probe', 'probe': probes[input_file]})
+            else:
+                for probe in probe_results:
+                    for warning in probe['warnings']:
+                        emit({'type': 'message', 'message': f"警告: {probe['path']}: {warning}"})
+            emit({'type': 'preflight', 'files': total,
+                  'rejected': sum(1 for probe in probe_results if not probe['ok']),
+                  'megapixels': sum(probe['pixels'] for probe in probe_results) / 1e6,
+                  'estimated_seconds': _estimate_runtime(probe_results, options,
+                                                         output_format, workers),
+                  'workers': workers})
+            if dry_run:
+                return
+        
+        manifest = OutputManifest(output_dir) if incremental else None
+        params = OutputManifest.make_params(output_format, options)
+        journal = claims = None
+        if claim_dir:
+            try:
+                claims = WorkClaims(claim_dir, {'recursive': recursive, 'params': params},
+                                    release=resume)
+            except (OSError, ValueError) as e:
+                emit({'type': 'error', 'message': f"エラー: クレームを使えません: {e}"})
+                return
+            if claims.released:
+                emit({'type': 'message', 'message':
+                      f"終了したプロセス・失敗したファイルのクレームを解放しました: {claims.released}ファイル"})
+            if claims.release_skipped:
+                emit({'type': 'message', 'message':
+                      f"警告: 他のプロセスがクレームを解放中のため省略しました "
+                      f"(そのプロセスが終了している場合は削除してください: {claims.lock_path})"})
+        else:
+            journal = BatchJournal(output_dir, {'input_dir': os.path.abspath(input_dir),
+                                                'recursive': recursive, 'params': params},
+                                   resume, shard, durable)
+            if journal.resumed:
+                emit({'type': 'message', 'message':
+                      f"前回の続きから再開します (記録済み: {len(journal.entries)}ファイル)"})
+            elif journal.mismatched:
+                emit({'type': 'message', 'message':
+                      "警告: ジャーナルの変換パラメータが異なるため、最初から変換します"})
+            if journal.removed_temp_files:
+                emit({'type': 'message', 'message':
+                      f"中断時の一時ファイルを削除しました: {journal.removed_temp_files}ファイル"})
+        
+        found = 0
+        counts = {'processed': 0, 'failed': 0, 'skipped': 0}
+        if claims is not None:
+            counts['claimed'] = 0
+        # 目標サイズの探索で直近に見つかった品質 (後のファイルの探索の初期値にする)
+        found_qualities = deque(maxlen=16)
+        
+        def completed():
+            return sum(counts.values())
+        
+        def iter_tasks():
+            # 入力ディレクトリを走査しながら、見つかった順に変換へ渡す
+            nonlocal found
+            for input_file in input_files:
+                yield from drain_retry()
+                if control is not None and not control.wait():
+                    break
+                found += 1
+                relative_dir = os.path.relpath(os.path.dirname(input_file), input_dir)
+                output_name = os.path.splitext(os.path.basename(input_file))[0] + output_ext
+                output_path = os.path.normpath(os.path.join(output_dir, relative_dir, output_name))
+                # 他のプロセスが変換済み・変換中のファイルは担当しない
+                if claims is not None and not claims.acquire(_work_key(input_file, input_dir)):
+                    counts['claimed'] += 1
+                    emit({'type': 'file_skipped', 'input': input_file, 'output': output_path,
+                          'completed': completed(), 'total': total})
+                    continue
+                probe = probes.get(input_file)
+                if probe and not probe['ok']:
+                    result = _new_result(input_file, output_path)
+                    result['error'] = f"変換エラー ({input_file}): {probe['error']}"
+                    handle(result)
+                    continue
+                # 変更のないファイルは画像を開かずにスキップ
+                # (出力の一覧は前回の記録を使うため、フレームごとに分けた出力もヘッダを読まない)
+                if ((manifest and manifest.is_up_to_date(input_file, output_path, params))
+                        or (journal and journal.is_done(input_file))):
+                    self.skipped_files += 1
+                    self.metrics.add_skipped()
+                    counts['skipped'] += 1
+                    emit({'type': 'file_skipped', 'input': input_file, 'output': output_path,
+                          'completed': completed(), 'total': total})
+                    continue
+                # 同じ内容・パラメータの変換結果があれば、変換せずにキャッシュから配置
+                task_options = options
+                if found_qualities:
+                    qualities = sorted(found_qualities)
+                    task_options = dict(options, quality_hint=qualities[len(qualities) // 2])
+                task = (input_file, output_path, task_options)
+                key = self._cache_key(input_file, params)
+                if key:
+                    # 同じ内容のファイルを変換中なら、その結果を待ってキャッシュから配置する
+                    if key in waiting:
+                        waiting[key].append(task)
+                        continue
+                    cached = self._fetch_cached(input_file, output_path, _task_outputs(task), key)
+                    if cached:
+                        handle(cached)
+                        continue
+                    waiting[key] = []
+                    cache_keys[output_path] = key
+                yield task
+        
+        def drain_retry():
+            while retry:
+                if control is not None and not control.wait():
+                    # 中止した場合は変換しない (ジャーナル・クレーム上は未変換のまま残る)
+                    retry.clear()
+                    return
+                yield retry.popleft()
+        
+        tasks = iter_tasks()
+        # 変換中の出力パス -> キャッシュキー、キャッシュキー -> 同じ内容で待機中のタスク
+        cache_keys = {}
+        waiting = {}
+        # 待機していた変換が失敗したため、自分で変換するタスク (他のタスクと同じく並列に変換する)
+        retry = deque()
         
         # 各ファイルを変換
-        for input_file in input_files:
-            output_filename = input_file.stem + output_ext
-            output_path = os.path.join(output_dir, output_filename)
-            self.convert_image(str(input_file), output_path, quality, resize)
+        # 子プロセスは結果を返すだけにし、表示と集計は親プロセスで入力順に行う
+        def handle(result):
+            key = cache_keys.pop(result['output'], None)
+            if key and result['success']:
+                self.cache.store(key, result['outputs'])
+            self._report(result, manifest, params)
+            if journal:
+                journal.record(result)
+            if claims:
+                claims.finish(_work_key(result['input'], input_dir), result)
+            if result.get('quality_search'):
+                found_qualities.append(result['quality_search']['quality'])
+            counts['processed' if result['success'] else 'failed'] += 1
+            self._emit_result(emit, result, completed(), total)
+            for task in waiting.pop(key, []):
+                cached = None
+                if result['success']:
+                    cached = self._fetch_cached(task[0], task[1], _task_outputs(task), key)
+                if cached:
+                    handle(cached)
+                else:
+                    retry.append(task)
+        
+        finished = False
+        try:
+            if workers > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # 最後の方の結果で待機中のタスクが変換に回ることがあるため、なくなるまで繰り返す
+                    while tasks is not None:
+                        for result in _ordered_pool_map(executor, _convert_task, tasks,
+                                                        workers * 4, control):
+                            handle(result)
+                        tasks = drain_retry() if retry else None
+            else:
+                for task in itertools.chain(tasks, drain_retry()):
+                    handle(_convert_task(task))
+            finished = control is None or not control.cancelled
+        finally:
+            if manifest:
+                manifest.close()
+            # 中断した場合や失敗したファイルがある場合はジャーナルを残し、
+            # --resumeで残りのファイルだけを変換できるようにする
+            if journal:
+                journal.close(remove=finished and counts['failed'] == 0)
+            # 中断で変換しなかったファイルのクレームは解放し、他のプロセスが変換できるようにする
+            if claims:
+                claims.close()
+        
+        if not finished:
+            emit(dict(counts, type='summary', cancelled=True))
+            if journal:
+                emit({'type': 'message', 'message':
+                      "続きから変換するには、同じ設定で再開 (--resume) を指定してください"})
+            return
+        if found == 0:
+            if shard:
+                emit({'type': 'message', 'message':
+                      f"シャード {shard[0]}/{shard[1]} に割り当てられた画像ファイルはありません: {input_dir}"})
+            else:
+                emit({'type': 'error', 'message': f"変換対象の画像ファイルが見つかりません: {input_dir}"})
+            return
+        
+        emit(dict(counts, type='summary'))
+        search = self.metrics.quality_search
+        if search['files']:
+            emit({'type': 'message', 'message':
+                  f"目標サイズ: 平均品質 {search['quality'] / search['files']:.1f}, "
+                  f"1ファイルあたり平均 {search['encodes'] / search['files']:.1f}回エンコード"})
+        if self.cache is not None:
+            emit({'type': 'message', 'message': self.cache.format_stats()})
+        
+        for path in metrics_files or []:
+            self.metrics.write(path)
+            emit({'type': 'message', 'message': f"メトリクスを保存しました: {path}"})
+    
+    def convert_manifest(self, lines: Iterable[str], output_format: str = 'PNG',
+                         options: Optional[dict] = None, workers: int = 1,
+                         on_result: Optional[Callable[[dict], None]] = None,
+                         on_event: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        ジョブの一覧 (JSON LinesまたはCSV) に従ってファイルを変換する
+        
+        ディレクトリを走査せず、1行1件のジョブを読みながら変換し、結果をジョブの順に
+        on_resultへ渡す。読み込みと変換は逐次 (並列時は同時にworkers * 4件まで) 行うため、
+        ジョブ数が多くてもメモリ使用量は増えない。
+        
+        各ジョブは input, output (必須) と format, quality, resize, resize_mode,
+        target_size, effort (省略時はoptionsの値) を持つ。JSON Linesは1行1オブジェクト、
+        CSVは1行目を列名とする (resizeは "800x600"、target_sizeは "200K" の形式も可)。
+        形式は最初の空でない行が '{' で始まるかで判別する。出力に拡張子がない場合は
+        formatまたはoutput_formatの拡張子を付ける。
+        キャッシュを使う場合は、変換に渡す前に親プロセスでキャッシュを調べ、あれば変換せずに配置する
+        (結果の順序を保つため、配置済みの結果も変換の結果と同じ順に渡す)。
+        
+        Args:
+            lines: ジョブの一覧の各行 (ファイルや標準入力をそのまま渡せる)
+            output_format: 出力に拡張子がなくformatも指定されていない場合の出力形式
+            options: 全ジョブに共通の変換オプション (_convert_fileのキーワード引数)
+            workers: 並列実行するプロセス数 (1で逐次実行、0でCPUコア数)
+            on_result: ジョブごとの結果 (manifest_recordの辞書) を受け取るコールバック
+            on_event: 進捗イベントを受け取るコールバック (summaryとキャッシュの統計のmessage、
+                      省略時は標準出力に表示)
+        
+        Returns:
+            dict: processed, failed (件数)
+        """
+        emit = on_event or self.print_event
+        if workers < 1:
+            workers = os.cpu_count() or 1
+        defaults = dict(options or {}, format=output_format)
+        # 変換中のジョブの行番号 -> キャッシュキー (成功したらキャッシュに追加する)
+        cache_keys = {}
+        
+        def iter_jobs():
+            for line, record in _iter_manifest(lines):
+                cached = None
+                if self.cache is not None and isinstance(record, dict):
+                    cached = self._fetch_manifest_cached(line, record, defaults, cache_keys)
+                yield line, record, defaults, cached
+        
+        jobs = iter_jobs()
+        counts = {'processed': 0, 'failed': 0}
+        
+        def handle(result):
+            key = cache_keys.pop(result['line'], None)
+            if key and result['success']:
+                self.cache.store(key, result['outputs'])
+            self._report(result)
+            counts['processed' if result['success'] else 'failed'] += 1
+            if on_result:
+                on_result(self.manifest_record(result))
+        
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for result in _ordered_pool_map(executor, _convert_manifest_job, jobs, workers * 4):
+                    handle(result)
+        else:
+            for job in jobs:
+                handle(_convert_manifest_job(job))
+        
+        emit(dict(counts, skipped=0, type='summary'))
+        if self.cache is not None:
+            emit({'type': 'message', 'message': self.cache.format_stats()})
+        return counts
+    
+    def _fetch_manifest_cached(self, line: int, record: dict, defaults: dict,
+                               cache_keys: dict) -> Optional[dict]:
+        """
+        ジョブの変換結果がキャッシュにあれば配置して結果を返す
         
-        print(f"\nバッチ変換完了!")
-        print(f"成功: {self.processed_files}ファイル")
-        if self.failed_files > 0:
-            print(f"失敗: {self.failed_files}ファイル")
+        なければキャッシュキーをcache_keysに記録してNoneを返す。不正なジョブや読めない入力は
+        変換側でエラーとして報告するため、ここでは何もしない。
+        """
+        try:
+            task = _manifest_task(record, defaults)
+        except (ValueError, TypeError):
+            return None
+        input_path, output_path, options = task
+        params = OutputManifest.make_params(_format_for_path(output_path) or '', options)
+        key = self._cache_key(input_path, params)
+        if key is None:
+            return None
+        cached = self._fetch_cached(input_path, output_path, _task_outputs(task), key)
+        if cached is None:
+            cache_keys[line] = key
+        return cached
+    
+    @staticmethod
+    def manifest_record(result: dict) -> dict:
+        """変換結果をジョブの一覧の結果 (JSONに変換できる辞書) にする"""
+        record = {
+            'line': result.get('line'),
+            'input': result['input'], 'output': result['output'], 'outputs': result['outputs'],
+            'status': 'done' if result['success'] else 'failed', 'error': result['error'],
+            'elapsed': round(result['elapsed'], 6),
+            'timings': {stage: round(seconds, 6) for stage, seconds in result['timings'].items()},
+            'input_bytes': result['input_bytes'], 'output_bytes': result['output_bytes'],
+        }
+        if result.get('quality_search'):
+            record['quality_search'] = result['quality_search']
+        if result.get('cached'):
+            record['cached'] = True
+        return record
 
 
-def main():
-    """コマンドライン実行用メイン関数"""
-    parser = argparse.ArgumentParser(
-        description='画像ファイル変換ソフト - Image File Converter',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-使用例:
-  # 単一ファイル変換
-  python image_converter.py input.jpg output.png
-  
-  # バッチ変換
-  python image_converter.py --batch input_dir output_dir --format PNG
-  
-  # リサイズ付き変換
-  python image_converter.py input.jpg output.jpg --resize 800 600
-  
-  # 品質指定変換
-  python image_converter.py input.png output.jpg --quality 85
+class BatchControl:
+    """
+    実行中のバッチ変換を別スレッドから中止・一時停止する
+    
+    batch_convertのcontrolに渡す。一時停止中は新しいファイルの変換を始めず、
+    並列実行中のファイルの結果だけを通知する。中止後は再開できない。
+    """
+    
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+    
+    def cancel(self) -> None:
+        """中止する (一時停止中でも待機を解除する)"""
+        self._cancelled.set()
+        self._running.set()
+    
+    def pause(self) -> None:
+        """一時停止する"""
+        if not self.cancelled:
+            self._running.clear()
+    
+    def resume(self) -> None:
+        """一時停止を解除する"""
+        self._running.set()
+    
+    def wait(self) -> bool:
+        """一時停止中は解除されるまで待ち、続けてよければTrue、中止されていればFalseを返す"""
+        self._running.wait()
+        return not self.cancelled
+
+
+class OutputManifest:
+    """
+    インクリメンタル変換用のマニフェスト
+    
+    出力ディレクトリにJSON Lines形式で保存し、出力ファイルごとに
+    入力のパス・サイズ・更新時刻・内容ハッシュと変換パラメータ、作成した出力ファイルの一覧を記録する。
+    追記のみで更新し、同じ出力の記録は後の行が優先される。
+    """
+    
+    FILENAME = '.image_converter_manifest.jsonl'
+    
+    # 出力内容に影響しないため比較から除くオプション
+    IGNORED_OPTIONS = ('max_memory', 'max_pixels', 'quality_hint')
+    
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.entries = {}
+        self._lines = 0
+        self._file = None
+        self._load()
+    
+    @staticmethod
+    def make_params(output_format: str, options: dict) -> dict:
+        """比較用に正規化した変換パラメータを返す"""
+        params = {key: value for key, value in options.items()
+                  if key not in OutputManifest.IGNORED_OPTIONS}
+        params['format'] = output_format.upper()
+        # タプルとリストの違いをなくすためJSONで往復させる
+        return json.loads(json.dumps(params, sort_keys=True))
+    
+    @staticmethod
+    def file_digest(path: str) -> str:
+        """ファイル内容のSHA-256を返す"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _key(self, output_path: str) -> str:
+        return Path(os.path.relpath(output_path, self.output_dir)).as_posix()
+    
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry['output']] = entry
+                except (ValueError, KeyError):
+                    # 中断により途中で切れた行は無視する
+                    continue
+                self._lines += 1
+    
+    def is_up_to_date(self, input_path: str, output_path: str, params: dict) -> bool:
         """
-    )
+        入力と変換パラメータが前回の記録と一致し、記録した出力がすべて存在すればTrue
+        
+        出力の一覧を記録していない古い形式の記録は、output_pathのみを確認する。
+        """
+        entry = self.entries.get(self._key(output_path))
+        if entry is None or entry['params'] != params:
+            return False
+        if entry['source'] != os.path.abspath(input_path):
+            return False
+        outputs = [os.path.join(self.output_dir, key)
+                   for key in entry.get('outputs', [entry['output']])]
+        if not all(os.path.exists(path) for path in outputs):
+            return False
+        
+        st = os.stat(input_path)
+        if st.st_size != entry['size']:
+            return False
+        if st.st_mtime_ns == entry['mtime_ns']:
+            return True
+        
+        # 更新時刻だけが変わった場合は内容ハッシュで判定する
+        if self.file_digest(input_path) != entry['sha256']:
+            return False
+        self.record(input_path, output_path, params, outputs)
+        return True
     
-    parser.add_argument('input', help='入力ファイルまたはディレクトリ')
-    parser.add_argument('output', help='出力ファイルまたはディレクトリ')
-    parser.add_argument('--batch', action='store_true', 
-                       help='バッチ変換モード')
-    parser.add_argument('--format', default='PNG',
-                       choices=['JPEG', 'PNG', 'BMP', 'GIF', 'TIFF', 'WEBP'],
-                       help='出力形式 (バッチモード時)')
-    parser.add_argument('--quality', type=int, default=95, 
-                       help='JPEG品質 (1-100)')
-    parser.add_argument('--resize', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'),
-                       help='リサイズサイズ (幅 高さ)')
+    def record(self, input_path: str, output_path: str, params: dict,
+               outputs: Optional[List[str]] = None) -> None:
+        """変換済みの出力を記録する (outputsは作成した出力ファイル、省略時はoutput_pathのみ)"""
+        st = os.stat(input_path)
+        entry = {
+            'output': self._key(output_path),
+            'outputs': [self._key(path) for path in outputs or [output_path]],
+            'source': os.path.abspath(input_path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': self.file_digest(input_path),
+            'params': params,
+        }
+        self.entries[entry['output']] = entry
+        
+        if self._file is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._lines += 1
     
-    args = parser.parse_args()
+    def close(self) -> None:
+        """マニフェストを閉じ、重複行が多ければ書き直す"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lines > 2 * len(self.entries) + 100:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+            self._lines = len(self.entries)
+
+
+class BatchJournal:
+    """
+    中断したバッチ変換を再開するためのジャーナル
     
-    # 引数の検証
-    if args.quality < 1 or args.quality > 100:
-        print("エラー: 品質は1-100の間で指定してください")
-        return 1
+    出力ディレクトリにJSON Lines形式で保存する。先頭行に入力ディレクトリと変換パラメータ、
+    以降は入力ファイルごとに結果 (done/failed)・出力・入力のサイズと更新時刻を追記する。
+    1件ごとにfsyncするとファイル数の多いバッチで遅くなるため、SYNC_EVERY件または
+    SYNC_INTERVAL秒ごとにまとめてディスクへ書き出す。最後の書き出し以降の記録は電源断などで
+    失われることがあるが、その分のファイルは再開時に変換し直すだけで済む。
+    出力ファイル自体はfsyncしないため、電源断では完了と記録した出力が欠けることがある。再開時は
+    記録した出力のバイト数と比べ、一致しないファイルを変換し直す。durableを指定すると、書き出しの
+    前に記録した出力ファイルとそのディレクトリもfsyncする (出力1件ごとにfsyncが1回増える)。
+    ジャーナルのファイルは最初の記録で作成するため、何も変換しなければ出力ディレクトリも作らない。
+    シャードごとの実行では、同じ出力ディレクトリを共有するためシャードごとに別のファイルにする。
+    """
     
-    converter = ImageConverter()
+    FILENAME = '.image_converter_journal.jsonl'
+    SHARD_FILENAME = '.image_converter_journal.shard-{}-of-{}.jsonl'
+    VERSION = 1
+    SYNC_EVERY = 256
+    SYNC_INTERVAL = 5.0
     
-    try:
-        if args.batch:
+    def __init__(self, output_dir: str, params: dict, resume: bool = False,
+                 shard: Optional[Tuple[int, int]] = None, durable: bool = False):
+        self.output_dir = output_dir
+        self.durable = durable
+        self.path = os.path.join(output_dir, self.SHARD_FILENAME.format(*shard) if shard
+                                 else self.FILENAME)
+        self.params = json.loads(json.dumps(params, sort_keys=True))
+        self.entries = {}
+        # 再開時に前回のジャーナルを使えたか (パラメータが異なる場合はFalse)
+        self.resumed = False
+        self.mismatched = False
+        self.removed_temp_files = 0
+        self._pending = 0
+        # 前回の書き出し以降に記録した、まだfsyncしていない出力ファイル (durable時のみ)
+        self._unsynced_outputs = []
+        self._file = None
+        self._last_sync = time.monotonic()
+        
+        if resume:
+            self._load()
+            # 他のシャードが書き込み中の一時ファイルは区別できないため、シャードでは削除しない
+            # (一時ファイルは入力の走査で無視される)
+            if shard is None:
+                self.removed_temp_files = self._remove_temp_files()
+    
+    def _open(self) -> None:
+        """ジャーナルのファイルを開く (再開時は追記、それ以外は先頭行から書き直す)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.resumed:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(json.dumps({'journal': self.VERSION, 'params': self.params},
+                                        ensure_ascii=False) + '\n')
+    
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+            if (not isinstance(header, dict) or header.get('journal') != self.VERSION
+                    or header.get('params') != self.params):
+                self.mismatched = True
+                return
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry['input']] = entry
+                except (ValueError, KeyError):
+                    # 中断により途中で切れた行は無視する
+                    continue
+        self.resumed = True
+    
+    def _remove_temp_files(self) -> int:
+        """中断した変換が出力ディレクトリに残した一時ファイルを削除し、その数を返す"""
+        removed = 0
+        for directory, _, names in os.walk(self.output_dir):
+            for name in names:
+                if _TEMP_OUTPUT_NAME.match(name):
+                    try:
+                        os.unlink(os.path.join(directory, name))
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+    
+    def is_done(self, input_path: str) -> bool:
+        """前回の実行で変換が完了しており、入力が変わらず記録した出力が揃っていればTrue"""
+        entry = self.entries.get(os.path.abspath(input_path))
+        if entry is None or entry['status'] != 'done':
+            return False
+        try:
+            st = os.stat(input_path)
+        except OSError:
+            return False
+        if st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+            return False
+        try:
+            output_bytes = sum(os.path.getsize(path) for path in entry['outputs'])
+        except OSError:
+            return False
+        # 電源断で書き込みが失われた出力 (空や途中までのファイル) は変換し直す
+        return entry.get('output_bytes') in (None, output_bytes)
+    
+    def record(self, result: dict) -> None:
+        """変換結果を追記する (失敗したファイルは再開時に変換し直す)"""
+        try:
+            st = os.stat(result['input'])
+        except OSError:
+            return
+        entry = {
+            'input': os.path.abspath(result['input']),
+            'status': 'done' if result['success'] else 'failed',
+            'outputs': result['outputs'],
+            'output_bytes': result['output_bytes'],
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'error': result['error'],
+        }
+        self.entries[entry['input']] = entry
+        if self._file is None:
+            self._open()
+        # プロセスが強制終了しても記録が残るよう毎回OSへ渡し、fsyncはまとめて行う
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if self.durable and result['success']:
+            self._unsynced_outputs.extend(result['outputs'])
+        self._pending += 1
+        if (self._pending >= self.SYNC_EVERY
+                or time.monotonic() - self._last_sync >= self.SYNC_INTERVAL):
+            self.sync()
+    
+    def sync(self) -> None:
+        """
+        記録をディスクへ書き出す
+        
+        durableの場合は、記録済みの出力がジャーナルより後にディスクへ届くことのないよう、
+        先に記録した出力ファイルと (置き換えを確定させるため) それらのディレクトリをfsyncする。
+        """
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._unsynced_outputs:
+            directories = {os.path.abspath(self.output_dir)}
+            for path in self._unsynced_outputs:
+                _fsync_path(path)
+                directories.add(os.path.dirname(os.path.abspath(path)))
+            for directory in directories:
+                _fsync_path(directory)
+            self._unsynced_outputs = []
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+    
+    def close(self, remove: bool = False) -> None:
+        """ジャーナルを書き出して閉じる (removeがTrueなら、前回のジャーナルも含めて削除する)"""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class WorkClaims:
+    """
+    共有ディレクトリのクレームファイルで、複数のホスト・プロセスが1つのバッチを分担する
+    
+    入力ファイルごとに、入力ディレクトリからの相対パスのハッシュを名前とするクレームファイルを
+    O_CREAT | O_EXCL で作成し、作成できたプロセスだけがそのファイルを変換する。作成は
+    1つのプロセスしか成功しないため、コーディネーターなしで同じファイルを2度変換することがない
+    (NFSではv3以降が必要)。クレームには取得したホスト名・プロセスID・時刻を書き、変換が
+    終わると結果を同じ名前の .done に書く。変換が終わってもクレームは削除しない
+    (削除すると、完了の確認と取得の間に別のプロセスが取得し直せてしまうため)。
+    
+    クレームを解放するのは、中断で変換しなかった自分のクレーム (close) と、
+    releaseを指定した場合の、同じホストの終了したプロセスのクレームおよび
+    失敗したファイルのクレームのみ。解放は解放用のロックファイルを取得した1つの
+    プロセスだけが行う。他のホストで強制終了したプロセスのクレームは生存を確認できないため、
+    そのホストで再開 (release) するか、.claim ファイルを削除する。
+    """
+    
+    HEADER = 'job.json'
+    LOCK = 'release.lock'
+    VERSION = 1
+    
+    def __init__(self, claim_dir: str, params: dict, release: bool = False):
+        """
+        Args:
+            claim_dir: 共有ディレクトリ (参加するすべてのプロセスで同じものを指定する)
+            params: バッチの設定。最初のプロセスが記録し、異なる設定のプロセスは参加できない
+            release: Trueの場合、終了したプロセスと失敗したファイルのクレームを解放する
+        
+        Raises:
+            ValueError: 共有ディレクトリが別の設定のバッチに使われている場合
+        """
+        import socket
+        
+        self.claim_dir = claim_dir
+        self.params = json.loads(json.dumps(params, sort_keys=True))
+        self.lock_path = os.path.join(claim_dir, self.LOCK)
+        self.owner = {'host': socket.gethostname(), 'pid': os.getpid()}
+        self.released = 0
+        # 解放用のロックを他のプロセスが持っていたため解放しなかった場合True
+        self.release_skipped = False
+        # 相対パス -> 取得して変換が終わっていないクレームのパス
+        self._held = {}
+        self._dirs = set()
+        
+        os.makedirs(claim_dir, exist_ok=True)
+        self._check_header()
+        if release:
+            self._release()
+    
+    def _check_header(self) -> None:
+        header_path = os.path.join(self.claim_dir, self.HEADER)
+        header = {'claims': self.VERSION, 'params': self.params}
+        try:
+            fd = os.open(header_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(header, f, ensure_ascii=False)
+            return
+        # 同時に起動した他のプロセスが書き込み中の場合は、書き終わるまで待つ
+        for _ in range(50):
+            try:
+                with open(header_path, 'r', encoding='utf-8') as f:
+                    existing = json.load(f)
+                break
+            except ValueError:
+                time.sleep(0.1)
+        else:
+            raise ValueError(f"設定を読み込めません: {header_path}")
+        if existing != header:
+            raise ValueError(f"共有ディレクトリは別の設定のバッチに使われています: {self.claim_dir}")
+    
+    def _paths(self, work_key: str) -> Tuple[str, str]:
+        """クレームと完了記録のパスを返す (1ディレクトリのファイル数を抑えるため2階層にする)"""
+        digest = hashlib.sha1(work_key.encode('utf-8')).hexdigest()
+        base = os.path.join(self.claim_dir, digest[:2], digest)
+        return base + '.claim', base + '.done'
+    
+    def acquire(self, work_key: str) -> bool:
+        """ファイルの担当を取得する。他のプロセスが取得済みならFalse"""
+        claim_path, _ = self._paths(work_key)
+        directory = os.path.dirname(claim_path)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        try:
+            fd = os.open(claim_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.owner, input=work_key, time=time.time()), f, ensure_ascii=False)
+        self._held[work_key] = claim_path
+        return True
+    
+    def finish(self, work_key: str, result: dict) -> None:
+        """取得したファイルの変換結果を記録する"""
+        if self._held.pop(work_key, None) is None:
+            return
+        entry = dict(self.owner, input=work_key,
+                     status='done' if result['success'] else 'failed',
+                     outputs=result['outputs'], error=result['error'], time=time.time())
+        with _atomic_output(self._paths(work_key)[1]) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+    
+    def _is_dead_owner(self, claim_path: str) -> bool:
+        """同じホストの終了したプロセスのクレームならTrue"""
+        try:
+            with open(claim_path, 'r', encoding='utf-8') as f:
+                owner = json.load(f)
+            pid = int(owner['pid'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        # Windowsのos.killはシグナル0でもプロセスを終了させるため、POSIXのみで確認する
+        if owner.get('host') != self.owner['host'] or os.name != 'posix' or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            return False
+        return False
+    
+    def _release(self) -> None:
+        try:
+            fd = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            self.release_skipped = True
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.owner, f)
+            for directory, _, names in os.walk(self.claim_dir):
+                names = set(names)
+                for name in names:
+                    if not name.endswith('.claim'):
+                        continue
+                    claim_path = os.path.join(directory, name)
+                    done_path = claim_path[:-len('.claim')] + '.done'
+                    if os.path.basename(done_path) in names:
+                        try:
+                            with open(done_path, 'r', encoding='utf-8') as f:
+                                failed = json.load(f).get('status') == 'failed'
+                        except (OSError, ValueError):
+                            continue
+                        if not failed:
+                            continue
+                        # 完了記録を先に消し、クレームが残っている間は他のプロセスに取得させない
+                        os.unlink(done_path)
+                    elif not self._is_dead_owner(claim_path):
+                        continue
+                    os.unlink(claim_path)
+                    self.released += 1
+        finally:
+            os.unlink(self.lock_path)
+    
+    def close(self) -> int:
+        """変換が終わっていない自分のクレームを解放し、その数を返す"""
+        released = 0
+        for claim_path in self._held.values():
+            try:
+                os.unlink(claim_path)
+                released += 1
+            except OSError:
+                pass
+        self._held.clear()
+        return released
+
+
+class OutputCache:
+    """
+    入力内容と変換パラメータをキーにした変換結果のキャッシュ
+    
+    ファイル名や場所が違っても、同じ内容の入力を同じパラメータで変換する場合は
+    デコードとエンコードを行わず、キャッシュからコピー (またはハードリンク) する。
+    キャッシュは "{キーの先頭2文字}/{キー}-{出力番号}{拡張子}" に保存し、
+    合計サイズがmax_bytesを超えると最後に使われた時刻が古いものから削除する。
+    使用時刻はファイルの更新時刻で記録するため、複数のプロセスで共有できる。
+    """
+    
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 ** 3, link: bool = False):
+        """
+        Args:
+            cache_dir: キャッシュディレクトリ
+            max_bytes: キャッシュの合計サイズの上限 (バイト)
+            link: Trueの場合、コピーの代わりにハードリンクを作る
+                  (同じファイルシステム上でのみ有効、失敗時はコピー)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.link = link
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_saved': 0}
+        # キャッシュファイルのパス -> サイズ (使用時刻の古い順)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._load()
+    
+    def _load(self) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        with os.scandir(self.cache_dir) as shards:
+            for shard in shards:
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False) and not entry.name.endswith('.tmp'):
+                            st = entry.stat()
+                            found.append((st.st_mtime_ns, entry.path, st.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+    
+    @staticmethod
+    def make_key(input_path: str, params: dict) -> str:
+        """入力内容のハッシュと正規化した変換パラメータからキャッシュキーを作る"""
+        digest = hashlib.sha256(OutputManifest.file_digest(input_path).encode('ascii'))
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _object_paths(self, key: str, outputs: List[str]) -> List[str]:
+        return [os.path.join(self.cache_dir, key[:2], f"{key}-{index}{Path(output).suffix.lower()}")
+                for index, output in enumerate(outputs)]
+    
+    def _place(self, source: str, destination: str) -> None:
+        """sourceをdestinationへリンクまたはコピーする (既存のdestinationは置き換える)"""
+        destination_dir = os.path.dirname(destination)
+        if destination_dir:
+            os.makedirs(destination_dir, exist_ok=True)
+        tmp_path = destination + '.tmp'
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        if self.link:
+            try:
+                os.link(source, tmp_path)
+                os.replace(tmp_path, destination)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    
+    def fetch(self, key: str, outputs: List[str]) -> bool:
+        """
+        キャッシュにあれば出力先へ配置してTrueを返す
+        
+        別のプロセスが削除した場合などで配置できなければ、ミスとして扱う。
+        """
+        objects = self._object_paths(key, outputs)
+        try:
+            for cached, output in zip(objects, outputs):
+                self._place(cached, output)
+                os.utime(cached)
+        except OSError:
+            for cached in objects:
+                self._forget(cached)
+            self.stats['misses'] += 1
+            return False
+        for cached in objects:
+            if cached not in self._entries:
+                # 別のプロセスが追加したファイル
+                self._entries[cached] = os.path.getsize(cached)
+                self._total_bytes += self._entries[cached]
+            self._entries.move_to_end(cached)
+        self.stats['hits'] += 1
+        self.stats['bytes_saved'] += sum(self._entries[cached] for cached in objects)
+        return True
+    
+    def store(self, key: str, outputs: List[str]) -> None:
+        """変換済みの出力をキャッシュに追加し、上限を超えた分を削除する"""
+        for cached, output in zip(self._object_paths(key, outputs), outputs):
+            try:
+                self._place(output, cached)
+            except OSError:
+                continue
+            self._forget(cached)
+            self._entries[cached] = os.path.getsize(cached)
+            self._total_bytes += self._entries[cached]
+        self.stats['stores'] += 1
+        self._evict()
+    
+    def _forget(self, cached: str) -> None:
+        size = self._entries.pop(cached, None)
+        if size is not None:
+            self._total_bytes -= size
+    
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            cached, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(cached)
+            except FileNotFoundError:
+                pass
+            self.stats['evictions'] += 1
+    
+    def format_stats(self) -> str:
+        """ヒット・ミスの統計を表示用の文字列にする"""
+        stats = self.stats
+        lookups = stats['hits'] + stats['misses']
+        rate = stats['hits'] / lookups * 100 if lookups else 0.0
+        return (f"キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']} ({rate:.1f}%), "
+                f"削除 {stats['evictions']}, 使用量 {self._total_bytes / 1024 / 1024:.1f} MB"
+                f" / {self.max_bytes / 1024 / 1024:.1f} MB")
+
+
+class ConversionMetrics:
+    """
+    変換メトリクスの集計
+    
+    ファイルごとの変換結果から、処理段階ごとの時間と入出力バイト数を集計し、
+    JSON・CSV・Prometheusテキスト形式で書き出す。外れ値を探せるよう、
+    時間のかかったファイルを上位 slowest 件保持する。
+    """
+    
+    STAGES = ('open', 'decode', 'transpose', 'resize', 'flatten', 'save')
+    
+    # 書き出しに対応する拡張子
+    FILE_EXTENSIONS = ('.json', '.csv', '.prom', '.txt')
+    
+    def __init__(self, slowest: int = 10):
+        self.files = {'success': 0, 'failed': 0, 'skipped': 0}
+        self.stage_seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.stage_max_seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.elapsed = 0.0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self._slowest_count = slowest
+        self._slowest = []
+        self._sequence = 0
+        # キャッシュ使用時のヒット・ミス統計 (OutputCache.stats)
+        self.cache_stats = None
+        # 目標サイズの探索 (ファイル数、見つかった品質の合計、エンコード回数の合計)
+        self.quality_search = {'files': 0, 'quality': 0, 'encodes': 0}
+    
+    def add(self, result: dict) -> None:
+        """1ファイルの変換結果を集計に加える"""
+        self.files['success' if result['success'] else 'failed'] += 1
+        for stage, seconds in result['timings'].items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            self.stage_max_seconds[stage] = max(self.stage_max_seconds.get(stage, 0.0), seconds)
+        self.elapsed += result['elapsed']
+        self.input_bytes += result['input_bytes']
+        self.output_bytes += result['output_bytes']
+        search = result.get('quality_search')
+        if search:
+            self.quality_search['files'] += 1
+            self.quality_search['quality'] += search['quality']
+            self.quality_search['encodes'] += search['encodes']
+        
+        # (経過時間, 追加順, 記録) の最小ヒープで上位N件を保持する
+        record = {key: result[key] for key in ('input', 'elapsed', 'timings',
+                                               'input_bytes', 'output_bytes', 'success')}
+        entry = (result['elapsed'], self._sequence, record)
+        self._sequence += 1
+        if len(self._slowest) < self._slowest_count:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest_count:
+            heapq.heappushpop(self._slowest, entry)
+    
+    def add_skipped(self) -> None:
+        """スキップしたファイルを集計に加える"""
+        self.files['skipped'] += 1
+    
+    def summary(self) -> dict:
+        """集計結果を辞書で返す"""
+        stage_total = sum(self.stage_seconds.values())
+        return {
+            'files': dict(self.files),
+            'elapsed_seconds': self.elapsed,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'stages': {
+                stage: {
+                    'seconds': seconds,
+                    'max_seconds': self.stage_max_seconds.get(stage, 0.0),
+                    'share': seconds / stage_total if stage_total else 0.0,
+                }
+                for stage, seconds in self.stage_seconds.items()
+            },
+            'slowest': [record for _, _, record in sorted(self._slowest, reverse=True)],
+            'cache': dict(self.cache_stats) if self.cache_stats is not None else None,
+            'quality_search': dict(self.quality_search),
+        }
+    
+    def write(self, path: str) -> None:
+        """
+        集計結果をファイルに書き出す
+        
+        形式は拡張子で決める: .json (JSON), .csv (段階ごとのCSV),
+        .prom/.txt (Prometheusテキスト形式)
+        """
+        ext = Path(path).suffix.lower()
+        writers = {'.json': self._write_json, '.csv': self._write_csv,
+                   '.prom': self._write_prometheus, '.txt': self._write_prometheus}
+        if ext not in writers:
+            raise ValueError(f"メトリクスの形式が不明です ({'/'.join(self.FILE_EXTENSIONS)}): {path}")
+        
+        # 読み取り側が書きかけのファイルを見ないよう、一時ファイルから置き換える
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writers[ext](f)
+        os.replace(tmp_path, path)
+    
+    def _write_json(self, f) -> None:
+        json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+    
+    def _write_csv(self, f) -> None:
+        import csv
+        
+        summary = self.summary()
+        writer = csv.writer(f)
+        writer.writerow(['stage', 'seconds', 'max_seconds', 'share'])
+        for stage, values in summary['stages'].items():
+            writer.writerow([stage, f"{values['seconds']:.6f}",
+                             f"{values['max_seconds']:.6f}", f"{values['share']:.4f}"])
+        writer.writerow(['total', f"{summary['elapsed_seconds']:.6f}", '', ''])
+    
+    def _write_prometheus(self, f) -> None:
+        lines = [
+            '# HELP image_converter_files_total Number of files by conversion status.',
+            '# TYPE image_converter_files_total counter',
+        ]
+        for status, count in self.files.items():
+            lines.append(f'image_converter_files_total{{status="{status}"}} {count}')
+        lines += [
+            '# HELP image_converter_stage_seconds_total Time spent in each conversion stage.',
+            '# TYPE image_converter_stage_seconds_total counter',
+        ]
+        for stage, seconds in self.stage_seconds.items():
+            lines.append(f'image_converter_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            '# HELP image_converter_stage_max_seconds Slowest single file in each conversion stage.',
+            '# TYPE image_converter_stage_max_seconds gauge',
+        ]
+        for stage, seconds in self.stage_max_seconds.items():
+            lines.append(f'image_converter_stage_max_seconds{{stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            '# HELP image_converter_input_bytes_total Bytes read from input files.',
+            '# TYPE image_converter_input_bytes_total counter',
+            f'image_converter_input_bytes_total {self.input_bytes}',
+            '# HELP image_converter_output_bytes_total Bytes written to output files.',
+            '# TYPE image_converter_output_bytes_total counter',
+            f'image_converter_output_bytes_total {self.output_bytes}',
+        ]
+        if self.cache_stats is not None:
+            lines += [
+                '# HELP image_converter_cache_events_total Output cache lookups and maintenance.',
+                '# TYPE image_converter_cache_events_total counter',
+            ]
+            for event in ('hits', 'misses', 'stores', 'evictions'):
+                lines.append(f'image_converter_cache_events_total{{event="{event}"}} '
+                             f'{self.cache_stats[event]}')
+        f.write('\n'.join(lines) + '\n')
+
+
+class AsyncImageConverter:
+    """
+    asyncio向けの画像変換クラス
+    
+    変換は上限付きのエグゼキュータで実行し、イベントループをブロックしない。
+    実行中と待機中の変換の合計がmax_pendingに達すると、以降の呼び出しは
+    空きが出るまでawaitで待たされる (バックプレッシャー)。
+    
+    使用例:
+        async with AsyncImageConverter(max_workers=4) as converter:
+            data = await converter.convert_bytes(upload, 'WEBP', quality=80)
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 use_processes: bool = False):
+        """
+        Args:
+            max_workers: 同時に変換する数 (省略時はCPUコア数)
+            max_pending: エグゼキュータに渡す変換の上限 (省略時はmax_workersの2倍)
+            use_processes: Trueの場合はプロセスプールで実行する。
+                           Pillowはデコード・縮小・エンコード中にGILを解放するため、
+                           通常はスレッドで十分並列に動作する
+        """
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._executor = executor_class(max_workers=self.max_workers)
+        # Python 3.9以前はSemaphoreが作成時のイベントループに結び付くため、使用時に作成する
+        self._semaphore = None
+    
+    @property
+    def saturated(self) -> bool:
+        """変換が上限まで詰まっている場合True (呼び出し側で受付を断る判断に使う)"""
+        return self._semaphore is not None and self._semaphore.locked()
+    
+    async def convert_bytes(self, data: bytes, output_format: str,
+                            quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                            resample_strategy: str = 'exact', effort: str = 'default',
+                            max_memory: Optional[int] = None,
+                            max_pixels: Optional[int] = None,
+                            resize_mode: str = 'stretch', frames: str = 'all',
+                            background: Tuple[int, int, int] = (255, 255, 255),
+                            target_size: Optional[int] = None) -> bytes:
+        """
+        メモリ上の画像データを変換し、変換後のデータを返す
+        
+        引数と例外はImageConverter.convert_bytesと同じ。
+        呼び出し側がキャンセルされても、開始済みの変換が終わるまで枠は解放されない。
+        """
+        import asyncio
+        
+        output_format = _normalize_format(output_format)
+        options = {'quality': quality, 'resize': resize, 'resample_strategy': resample_strategy,
+                   'effort': effort, 'max_memory': max_memory, 'max_pixels': max_pixels,
+                   'resize_mode': resize_mode, 'frames': frames, 'background': background,
+                   'target_size': target_size}
+        
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        semaphore = self._semaphore
+        await semaphore.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, _convert_bytes, data, output_format, options)
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(lambda _: semaphore.release())
+        return await asyncio.shield(future)
+    
+    async def close(self) -> None:
+        """実行中の変換の終了を待ってエグゼキュータを停止する"""
+        import asyncio
+        
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+    
+    async def __aenter__(self) -> 'AsyncImageConverter':
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+# 縮小戦略ごとの設定: (draftで要求する目標サイズの倍率, reducing_gap)
+# fast: JPEGを目標サイズ近くまでDCT縮小デコードし、粗い縮小を多めに使う
+# balanced: 目標の2倍以上でデコードし、最終段のLANCZOSで品質を保つ
+# exact: 元解像度でデコードし、全体をLANCZOSで縮小する（従来動作）
+_RESAMPLE_SETTINGS = {
+    'fast': (1, 2.0),
+    'balanced': (2, 3.0),
+    'exact': (None, None),
+}
+
+# EXIFのOrientationのうち、幅と高さが入れ替わる値
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def _apply_draft(img, size: Tuple[int, int], scale: int) -> None:
+    """
+    デコード前の画像にdraftを設定し、目標サイズ近くで読み込ませる
+    
+    JPEG以外ではdraftは何もしない。EXIF回転前に呼ぶため、
+    縦横が入れ替わる場合は目標サイズも入れ替える。
+    """
+    width, height = size
+    if img.getexif().get(0x0112, 1) in _TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    img.draft(img.mode, (width * scale, height * scale))
+
+
+class _StageTimer:
+    """変換の処理段階ごとの経過時間 (秒) を記録する"""
+    
+    def __init__(self):
+        self.timings = {}
+        # 目標サイズに合わせて品質を探索した場合の記録 (_encode_to_size)
+        self.quality_search = None
+    
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+# Pillow内部での1画素あたりのバイト数 (RGBなど3バンドの画像も4バイトで保持される)
+_MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16L': 2, 'I;16B': 2}
+
+
+# Image.openの間だけPillowの画素数の確認を外すためのロック (他のスレッドの読み込みと重ならないようにする)
+_PIXEL_LIMIT_LOCK = threading.Lock()
+
+
+def _estimate_memory(img, resize: Optional[Tuple[int, int]], output_format: Optional[str]) -> int:
+    """
+    デコード前のヘッダ情報から、変換時のピークメモリ (バイト) を見積もる
+    
+    デコード後の画像、EXIF回転による複製、リサイズ後の画像、
+    透明度合成用のRGB背景を合計する。
+    """
+    pixels = img.width * img.height
+    estimate = pixels * _MODE_BYTES.get(img.mode, 4)
+    if img.getexif().get(0x0112, 1) != 1:
+        estimate *= 2
+    output_pixels = pixels
+    if resize:
+        output_pixels = resize[0] * resize[1]
+        estimate += output_pixels * 4
+    if output_format in ('JPEG', 'BMP') and img.mode in ('RGBA', 'LA', 'P', 'PA', 'RGBa', 'La'):
+        estimate += output_pixels * 4
+    return estimate
+
+
+def _open_image(source: Union[str, BinaryIO], max_pixels: Optional[int] = None):
+    """
+    画像を開く。Pillowの画素数上限による拒否は他の変換エラーと同じ形式で送出する
+    
+    max_pixelsを指定した場合は、ヘッダの読み込みの間だけPillowのMAX_IMAGE_PIXELSによる確認を外し、
+    呼び出し側が_check_image_limitsでその呼び出しの上限と比べる。MAX_IMAGE_PIXELSは
+    プロセス全体で共有されるため、変更はロックの中に限り、開いた直後に元へ戻す。
+    """
+    with _PIXEL_LIMIT_LOCK:
+        saved = Image.MAX_IMAGE_PIXELS
+        if max_pixels is not None:
+            Image.MAX_IMAGE_PIXELS = None
+        try:
+            return Image.open(source)
+        except Image.DecompressionBombError as e:
+            raise ValueError(f"画素数が上限を超えています (展開爆弾の可能性): {e}") from e
+        finally:
+            Image.MAX_IMAGE_PIXELS = saved
+
+
+def _check_image_limits(img, max_pixels: Optional[int]) -> None:
+    """画素数が上限を超える画像をデコード前に拒否する"""
+    pixels = img.width * img.height
+    if max_pixels and pixels > max_pixels:
+        raise ValueError(f"画素数が上限を超えています: {img.width}x{img.height} "
+                         f"({pixels:,} > {max_pixels:,})")
+
+
+def _fit_memory_budget(img, resize: Optional[Tuple[int, int]], output_format: Optional[str],
+                       max_memory: int, drafted: bool) -> None:
+    """
+    見積もりがmax_memoryを超える場合に、可能なら縮小デコードで収める
+    
+    縮小デコードはJPEGをリサイズする場合のみ行える。収まらない場合は
+    デコード前にValueErrorを送出する。
+    """
+    estimate = _estimate_memory(img, resize, output_format)
+    if estimate > max_memory and resize and not drafted and img.format == 'JPEG':
+        _apply_draft(img, resize, 1)
+        estimate = _estimate_memory(img, resize, output_format)
+    if estimate > max_memory:
+        raise ValueError(f"メモリ上限を超えるため変換できません: {img.width}x{img.height} {img.mode} "
+                         f"(推定 {estimate / 1024 / 1024:.0f} MB > 上限 {max_memory / 1024 / 1024:.0f} MB)")
+
+
+def parse_byte_size(text: str) -> int:
+    """
+    '512M' や '2G' 形式のサイズをバイト数に変換する (K/M/Gは1024倍単位)
+    
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().rstrip('B')
+    multiplier = 1
+    if text and text[-1] in units:
+        multiplier = units[text[-1]]
+        text = text[:-1]
+    value = float(text)
+    if value <= 0:
+        raise ValueError(f"サイズは正の値で指定してください: {text}")
+    return int(value * multiplier)
+
+
+def parse_color(text: str) -> Tuple[int, int, int]:
+    """
+    'white' や '#f0f0f0'、'rgb(0,0,0)' 形式の色を (R, G, B) に変換する
+    
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    return ImageColor.getrgb(text.strip())[:3]
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """
+    '2/8' 形式のシャード指定を (番号, 総数) に変換する (番号は1から総数)
+    
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    index, _, count = text.partition('/')
+    index, count = int(index), int(count)
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"シャードは 1/N から N/N の形式で指定してください: {text}")
+    return index, count
+
+
+def _convert_file(input_path: str, output_path: str,
+                  quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                  resample_strategy: str = 'exact', effort: str = 'default',
+                  max_memory: Optional[int] = None, max_pixels: Optional[int] = None,
+                  passthrough: bool = False, resize_mode: str = 'stretch',
+                  frames: str = 'all', background: Tuple[int, int, int] = (255, 255, 255),
+                  target_size: Optional[int] = None, quality_hint: Optional[int] = None,
+                  timer: Optional[_StageTimer] = None) -> Optional[str]:
+    """
+    1ファイルを変換する（失敗時は例外を送出）
+    
+    プロセスプールの子プロセスからも呼ばれるため、インスタンス状態には触れない。
+    timerを渡すと、open/decode/transpose/resize/flatten/saveの各段階の時間を記録する。
+    max_memory (バイト) を指定すると、ヘッダから見積もったメモリが上限を超える画像は
+    縮小デコードで収めるか、デコード前に拒否する。max_pixelsは画素数の上限 (0で無制限)。
+    passthroughがTrueの場合、画素を変える必要のない入力は再エンコードせずにコピーし、
+    向きだけが異なるJPEGはjpegtranで可逆に回転する。
+    resize_modeはresizeの解釈 ('stretch', 'fit', 'fill', 'thumbnail')。
+    framesは複数フレームの画像の扱い ('all', 'first', 'split')。フレームごとに分ける場合の
+    出力先は_page_outputsが返すパスになる。backgroundはJPEG/BMPで透明部分に合成する背景色。
+    target_sizeを指定すると、出力がそのバイト数以下になる最大の品質を探して保存する
+    (quality_hintは探索で最初に試す品質)。
+    
+    Returns:
+        Optional[str]: 再エンコードしなかった場合の方法 ('copy' または 'lossless')
+    """
+    timer = timer or _StageTimer()
+    
+    # 出力ディレクトリの作成
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # 出力形式の決定
+    output_format = _format_for_path(output_path)
+    
+    # 全フレームを変換する場合のみ、コピーでフレーム数が変わらない
+    # (目標サイズの指定時は、入力が上限を超える場合があるためコピーしない)
+    if passthrough and frames == 'all' and not target_size:
+        with timer.stage('open'):
+            plan = _passthrough_plan(input_path, output_format, resize, max_pixels, resize_mode)
+        if plan is not None:
+            with timer.stage('save'):
+                method = plan[0]
+                if method == 'copy':
+                    with _atomic_output(output_path) as tmp_path:
+                        _copy_file(input_path, tmp_path)
+                    return method
+                if _jpegtran_orient(input_path, output_path, plan[1]):
+                    return method
+    
+    _convert_stream(input_path, output_path, output_format, quality, resize,
+                    resample_strategy, effort, max_memory, max_pixels,
+                    resize_mode=resize_mode, frames=frames, background=background,
+                    target_size=target_size, quality_hint=quality_hint, timer=timer)
+    return None
+
+
+# jpegtranでEXIFの向きを可逆に適用するための引数
+_JPEGTRAN_TRANSFORMS = {
+    2: ['-flip', 'horizontal'],
+    3: ['-rotate', '180'],
+    4: ['-flip', 'vertical'],
+    5: ['-transpose'],
+    6: ['-rotate', '90'],
+    7: ['-transverse'],
+    8: ['-rotate', '270'],
+}
+
+
+def _passthrough_plan(input_path: str, output_format: Optional[str],
+                      resize: Optional[Tuple[int, int]],
+                      max_pixels: Optional[int],
+                      resize_mode: str = 'stretch') -> Optional[Tuple[str, int]]:
+    """
+    再エンコードせずに出力できるかをヘッダから判定する
+    
+    Returns:
+        ('copy', 1): 同じ形式で向きも正しく、サイズの変更がない場合
+        ('lossless', 向き): 向きだけが異なるJPEGで、jpegtranが使える場合
+        None: 通常の変換が必要な場合
+    """
+    with _open_image(input_path, max_pixels) as img:
+        _check_image_limits(img, max_pixels)
+        if img.format != output_format:
+            return None
+        orientation = img.getexif().get(0x0112, 1)
+        size = _oriented_size(img)
+    if resize and _target_size(size, resize, resize_mode) != size:
+        return None
+    if orientation not in _JPEGTRAN_TRANSFORMS:
+        return 'copy', 1
+    if output_format == 'JPEG' and shutil.which('jpegtran'):
+        return 'lossless', orientation
+    return None
+
+
+def _copy_file(source: str, destination: str) -> None:
+    """
+    ファイルの内容をそのままコピーする
+    
+    Linuxではcopy_file_rangeでカーネル内 (対応するファイルシステムではreflink) で
+    コピーし、使えない場合はshutil.copyfile (sendfile等を使用) に任せる。
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+
+
+def _jpegtran_orient(input_path: str, output_path: str, orientation: int) -> bool:
+    """
+    jpegtranでEXIFの向きを可逆に適用し、出力のOrientationを1にする
+    
+    MCU境界の都合で完全に可逆に変換できない画像 (-perfectで失敗) はFalseを返す。
+    """
+    import subprocess
+    
+    try:
+        with _atomic_output(output_path) as tmp_path:
+            command = (['jpegtran', '-copy', 'all', '-perfect'] + _JPEGTRAN_TRANSFORMS[orientation]
+                       + ['-outfile', tmp_path, input_path])
+            subprocess.run(command, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not _reset_jpeg_orientation(tmp_path):
+                raise OSError("EXIFのOrientationを更新できません")
+        return True
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+
+def _reset_jpeg_orientation(path: str) -> bool:
+    """
+    JPEGのEXIF (APP1) にあるOrientationの値をその場で1に書き換える
+    
+    画素データは変更しない。Orientationが見つからない場合はFalseを返す。
+    """
+    import struct
+    
+    with open(path, 'r+b') as f:
+        if f.read(2) != b'\xff\xd8':
+            return False
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+                return False
+            segment_start = f.tell()
+            length = struct.unpack('>H', f.read(2))[0]
+            if marker[1] == 0xE1 and f.read(6) == b'Exif\x00\x00':
+                tiff_start = f.tell()
+                header = f.read(8)
+                endian = '<' if header[:2] == b'II' else '>'
+                f.seek(tiff_start + struct.unpack(endian + 'I', header[4:8])[0])
+                count = struct.unpack(endian + 'H', f.read(2))[0]
+                for _ in range(count):
+                    entry_start = f.tell()
+                    tag, field_type = struct.unpack(endian + 'HH', f.read(4))
+                    if tag == 0x0112 and field_type == 3:
+                        # SHORT型の値はエントリ内の値フィールドの先頭2バイト
+                        f.seek(entry_start + 8)
+                        f.write(struct.pack(endian + 'H', 1))
+                        return True
+                    f.seek(entry_start + 12)
+                return False
+            f.seek(segment_start + length)
+
+
+def _convert_stream(source: Union[str, BinaryIO], destination: Union[str, BinaryIO],
+                    output_format: Optional[str],
+                    quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                    resample_strategy: str = 'exact', effort: str = 'default',
+                    max_memory: Optional[int] = None, max_pixels: Optional[int] = None,
+                    resize_mode: str = 'stretch', frames: str = 'all',
+                    background: Tuple[int, int, int] = (255, 255, 255),
+                    target_size: Optional[int] = None, quality_hint: Optional[int] = None,
+                    timer: Optional[_StageTimer] = None) -> None:
+    """
+    パスまたはファイルライクオブジェクトの画像を変換する（失敗時は例外を送出）
+    
+    output_formatがNoneの場合、Pillowがdestinationの拡張子から形式を決める。
+    resize_modeによる実際の出力サイズは、デコード前にヘッダのサイズから求める。
+    複数フレームの画像はframesに従って_convert_framesで1フレームずつ変換する。
+    target_sizeを指定した場合は_encode_to_sizeで品質を探して保存する (1フレームの出力のみ)。
+    """
+    timer = timer or _StageTimer()
+    if target_size and output_format not in _TARGET_SIZE_FORMATS:
+        raise ValueError(f"目標サイズは {'/'.join(_TARGET_SIZE_FORMATS)} の出力でのみ指定できます: "
+                         f"{output_format}")
+    
+    # 画像を開く
+    draft_scale, reducing_gap = _RESAMPLE_SETTINGS[resample_strategy]
+    
+    with timer.stage('open'):
+        image_file = _open_image(source, max_pixels)
+    
+    with image_file as img:
+        plan = _frame_plan(img, output_format, frames, isinstance(destination, str))
+        if plan and target_size:
+            raise ValueError("目標サイズは複数フレームの画像には指定できません "
+                             "(先頭フレームのみを変換する場合は frames='first')")
+        if plan:
+            transform = _frame_transform(output_format, resize, resize_mode, resample_strategy,
+                                         max_memory, max_pixels, background, timer)
+            _convert_frames(img, destination, output_format, plan, transform,
+                            quality, effort, timer)
+            return
+        
+        target = None
+        if resize:
+            target = _target_size(_oriented_size(img), resize, resize_mode)
+        
+        # 縮小時は目標サイズ近くでデコードする
+        with timer.stage('decode'):
+            _check_image_limits(img, max_pixels)
+            if resize_mode == 'thumbnail' and target:
+                # サムネイルはdraftによる縮小デコードとその場での縮小をPillowに任せる
+                box = target
+                if img.getexif().get(0x0112, 1) in _TRANSPOSED_ORIENTATIONS:
+                    box = (box[1], box[0])
+                gap = reducing_gap or 2.0
+                if max_memory:
+                    # thumbnailと同じ縮小デコードを先に設定し、縮小後のサイズで見積もる
+                    img.draft(None, (int(box[0] * gap), int(box[1] * gap)))
+                    _fit_memory_budget(img, target, output_format, max_memory, True)
+                img.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=gap)
+                # 縮小済みのため、丸め誤差による1画素の再縮小はしない
+                target = None
+            else:
+                decode_size = target
+                if target and resize_mode == 'fill':
+                    decode_size = _cover_size(_oriented_size(img), target)
+                drafted = bool(decode_size and draft_scale)
+                if drafted:
+                    _apply_draft(img, decode_size, draft_scale)
+                if max_memory:
+                    _fit_memory_budget(img, decode_size, output_format, max_memory, drafted)
+                img.load()
+        
+        # EXIF情報に基づく自動回転
+        with timer.stage('transpose'):
+            img = ImageOps.exif_transpose(img)
+        
+        # リサイズ処理 (既に目標サイズの場合は行わない)
+        if target and target != img.size:
+            with timer.stage('resize'):
+                box = _crop_box(img.size, target) if resize_mode == 'fill' else None
+                img = img.resize(target, Image.Resampling.LANCZOS, box=box,
+                                 reducing_gap=reducing_gap)
+        
+        # PNG以外の場合、透明度を処理
+        with timer.stage('flatten'):
+            img = _prepare_for_format(img, output_format, background)
+        
+        # 画像を保存 (パスの場合は一時ファイルに書いてから置き換える)
+        with timer.stage('save'):
+            if target_size:
+                data = _encode_to_size(img, output_format, target_size, quality, effort,
+                                       quality_hint, timer)
+                if isinstance(destination, str):
+                    with _atomic_output(destination) as tmp_path, open(tmp_path, 'wb') as f:
+                        f.write(data)
+                else:
+                    destination.write(data)
+            elif isinstance(destination, str):
+                with _atomic_output(destination) as tmp_path:
+                    img.save(tmp_path, format=output_format,
+                             **_save_options(output_format, quality, effort))
+            else:
+                img.save(destination, format=output_format,
+                         **_save_options(output_format, quality, effort))
+
+
+# 目標サイズに合わせて品質を探索できる出力形式
+_TARGET_SIZE_FORMATS = ('JPEG', 'WEBP')
+
+
+def _encode_to_size(img, output_format: str, target_size: int, max_quality: int,
+                    effort: str, quality_hint: Optional[int], timer: _StageTimer) -> bytes:
+    """
+    エンコード後がtarget_sizeバイト以下になる最大の品質 (max_quality以下) を二分探索し、
+    その品質のデータを返す
+    
+    デコード済みの画像をメモリ上で繰り返しエンコードするため、ファイルは最後に1度だけ書く。
+    最初はmax_quality (quality_hintの指定時はその品質) を試すため、上限に余裕がある場合は
+    1回、似た画像が続くバッチでは2回程度で決まる。
+    探索の記録 (quality, encodes, bytes, target) はtimer.quality_searchに残す。
+    
+    Raises:
+        ValueError: 品質1でも上限を超える場合
+    """
+    low, high = 1, max_quality
+    best, best_data, encodes = None, None, 0
+    quality = min(max(quality_hint or max_quality, low), high)
+    # 初期値の指定時は、1, 2, 4, ...と幅を広げながら上限をまたぐまで進み (指数探索)、
+    # またいだ後は二分探索にする。初期値が合っていれば2回で決まる
+    galloping, step, last_fits = bool(quality_hint), 1, None
+    while low <= high:
+        buffer = io.BytesIO()
+        img.save(buffer, format=output_format, **_save_options(output_format, quality, effort))
+        encodes += 1
+        fits = buffer.tell() <= target_size
+        if fits:
+            best, best_data, low = quality, buffer.getvalue(), quality + 1
+        else:
+            high = quality - 1
+        if galloping and last_fits in (None, fits):
+            quality = quality + step if fits else quality - step
+            step, last_fits = step * 2, fits
+            if low <= quality <= high:
+                continue
+        galloping = False
+        quality = (low + high) // 2
+    
+    if best is None:
+        raise ValueError(f"品質1でも目標サイズを超えます ({buffer.tell() / 1024:.1f} KB > "
+                         f"{target_size / 1024:.1f} KB)。リサイズを指定してください")
+    timer.quality_search = {'quality': best, 'encodes': encodes,
+                            'bytes': len(best_data), 'target': target_size}
+    return best_data
+
+
+# 複数フレームとして読む入力形式 (JPEGのMPOに含まれる付属画像などは対象外)
+_MULTI_FRAME_FORMATS = ('GIF', 'PNG', 'WEBP', 'TIFF')
+
+# 複数フレームのまま保存できる出力形式
+_ANIMATED_OUTPUT_FORMATS = ('GIF', 'PNG', 'WEBP', 'TIFF')
+
+# アニメーションとして読む入力形式 (複数ページTIFFのページはアニメーションにせず、ページごとに分ける)
+_ANIMATED_SOURCE_FORMATS = ('GIF', 'PNG', 'WEBP')
+
+# 複数フレームを持ちうる入力の拡張子 (それ以外はヘッダを開かずに1フレームとみなす)
+_MULTI_FRAME_EXTENSIONS = tuple(ext for name in _MULTI_FRAME_FORMATS
+                                for ext in ImageConverter.SUPPORTED_FORMATS[name])
+
+# 表示時間を持たないフレーム (TIFFのページなど) をアニメーションにする際の表示時間 (ミリ秒)
+_DEFAULT_FRAME_DURATION = 100
+
+# APNGの破棄方法 (0: なし, 1: 背景, 2: 直前) とGIFの破棄方法 (1: なし, 2: 背景, 3: 直前) の対応
+_APNG_TO_GIF_DISPOSAL = {0: 1, 1: 2, 2: 3}
+_GIF_TO_APNG_DISPOSAL = {0: 0, 1: 0, 2: 1, 3: 2}
+
+
+def _frame_count(img) -> int:
+    """複数フレームとして扱う画像のフレーム数 (それ以外は1)"""
+    if img.format not in _MULTI_FRAME_FORMATS:
+        return 1
+    return getattr(img, 'n_frames', 1)
+
+
+def _frame_plan(img, output_format: Optional[str], frames: str, to_path: bool) -> Optional[str]:
+    """
+    複数フレームの画像の保存方法を返す
+    
+    frames='all'では、アニメーション (GIF・APNG・WebP) を複数フレームを保存できる形式へ、
+    複数ページTIFFをTIFFへ出力する場合に1つのファイルにまとめ、それ以外はフレームごとに分ける。
+    
+    Returns:
+        'animate': 全フレームを1つのファイルに保存する
+        'split': フレームごとのファイルに保存する
+        None: 先頭フレームのみを変換する (1フレームの画像、frames='first'、
+              または1つのファイルにまとめない入力をストリームへ出力する場合)
+    """
+    if frames not in ImageConverter.FRAME_MODES:
+        raise ValueError(f"不明なフレームの扱いです: {frames}")
+    if frames == 'first' or _frame_count(img) < 2:
+        return None
+    if frames == 'all' and _keeps_frames(img.format, output_format):
+        return 'animate'
+    if not to_path:
+        if frames == 'split':
+            raise ValueError("フレームごとのファイルに分けるには出力先をパスで指定してください")
+        return None
+    return 'split'
+
+
+def _keeps_frames(input_format: Optional[str], output_format: Optional[str]) -> bool:
+    """frames='all'で全フレームを1つのファイルに保存する入力形式と出力形式の組み合わせならTrue"""
+    if output_format == 'TIFF':
+        return True
+    return output_format in _ANIMATED_OUTPUT_FORMATS and input_format in _ANIMATED_SOURCE_FORMATS
+
+
+def _page_paths(output_path: str, count: int) -> List[str]:
+    """フレームごとの出力パス (名前_p001.拡張子 の形式)"""
+    stem, ext = os.path.splitext(output_path)
+    width = max(3, len(str(count)))
+    return [f"{stem}_p{index:0{width}d}{ext}" for index in range(1, count + 1)]
+
+
+def _page_outputs(input_path: str, output_path: str, frames: str = 'all',
+                  max_pixels: Optional[int] = None) -> Optional[List[str]]:
+    """
+    フレームごとのファイルに分けて出力する場合の出力パスのリスト (分けない場合はNone)
+    
+    複数フレームを持ちうる拡張子の入力のみ、ヘッダを開いてフレーム数を調べる。
+    max_pixelsは変換と同じ画素数の上限 (_open_imageに渡す)。
+    """
+    if frames == 'first' or Path(input_path).suffix.lower() not in _MULTI_FRAME_EXTENSIONS:
+        return None
+    output_format = _format_for_path(output_path)
+    if frames == 'all' and _keeps_frames(_format_for_path(input_path), output_format):
+        return None
+    try:
+        with _open_image(input_path, max_pixels) as img:
+            if _frame_plan(img, output_format, frames, True) != 'split':
+                return None
+            return _page_paths(output_path, img.n_frames)
+    except (OSError, ValueError):
+        # 読み込めない入力は変換時にエラーとして報告する
+        return None
+
+
+def _gif_disposal(frame) -> int:
+    """フレームの破棄方法をGIFの値で返す"""
+    if frame.format == 'GIF':
+        return frame.disposal_method
+    if frame.format == 'PNG':
+        return _APNG_TO_GIF_DISPOSAL.get(frame.info.get('disposal', 0), 1)
+    # WebPやTIFFのフレームは合成済みのため、透明部分に前のフレームが残らないよう背景に戻す
+    return 2 if frame.mode in ('RGBA', 'LA', 'PA') else 1
+
+
+class _FrameValues(list):
+    """
+    フレームごとの値を読んだ順に埋めていくリスト
+    
+    Pillowのsave_allは、各フレームを読んだ後にduration[i]などを参照するため、
+    全フレームを先に読まなくても表示時間や破棄方法を渡せる。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._values = {}
+    
+    def __setitem__(self, index, value):
+        self._values[index] = value
+    
+    def __getitem__(self, index):
+        return self._values[index]
+    
+    def __int__(self):
+        # GIFの全フレームが同じ内容の場合、Pillowは1フレームとして保存し、破棄方法をint()で読む
+        return int(self._values.get(0, 0))
+
+
+@functools.lru_cache(maxsize=None)
+def _frame_stream_class() -> type:
+    """
+    _FrameStreamクラスを返す
+    
+    Image.Imageを継承するため、モジュールの読み込み時にPillowを読み込まないよう、
+    最初に使うときに定義する。
+    """
+    class _FrameStream(Image.Image):
+        """
+        seekされたフレームだけを読み込んで変換する、保存用の複数フレーム画像
+    
+        Pillowのsave_allは保存する画像をseekしながら1フレームずつ読むため、
+        変換済みのフレームを同時に1つしか持たない。ただしGIFとAPNGの保存処理は、
+        フレーム間の差分を求めるためにPillow内部で全フレームを保持する。
+        """
+    
+        def __init__(self, n_frames: int, read_frame: Callable[[int], tuple], output_format: str):
+            """
+            Args:
+                n_frames: フレーム数
+                read_frame: フレーム番号から (変換済みの画像, 表示時間, GIFの破棄方法) を返す関数
+                output_format: 出力形式 (破棄方法の値をAPNG用に変換するため)
+            """
+            super().__init__()
+            self.n_frames = n_frames
+            self.is_animated = n_frames > 1
+            self.durations = _FrameValues()
+            self.disposals = _FrameValues()
+            self._read_frame = read_frame
+            self._apng = output_format == 'PNG'
+            # TIFF以外はすべてのフレームが同じサイズでなければならないため、
+            # サイズの異なるフレームは1枚目のサイズの透明な余白の中央に置く
+            self._same_size = output_format != 'TIFF'
+            self._frame = -1
+            self.seek(0)
+    
+        def seek(self, frame: int) -> None:
+            if frame == self._frame:
+                return
+            if not 0 <= frame < self.n_frames:
+                raise EOFError("フレームの範囲外です")
+            image, duration, disposal = self._read_frame(frame)
+            if self._same_size and self._frame >= 0 and image.size != self.size:
+                image = _pad_frame(image, self.size)
+            self.im = image.im
+            self._mode = image.mode
+            self._size = image.size
+            self._frame = frame
+            self.durations[frame] = duration
+            self.disposals[frame] = _GIF_TO_APNG_DISPOSAL[disposal] if self._apng else disposal
+    
+        def tell(self) -> int:
+            return self._frame
+    
+    return _FrameStream
+
+
+def _pad_frame(image, size: Tuple[int, int]):
+    """画像を透明な余白でsizeに揃える (中央に置き、はみ出す部分は切り取る)"""
+    canvas = Image.new('RGBA', size, (0, 0, 0, 0))
+    canvas.paste(image.convert('RGBA'),
+                 ((size[0] - image.width) // 2, (size[1] - image.height) // 2))
+    return canvas
+
+
+def _frame_transform(output_format: Optional[str], resize: Optional[Tuple[int, int]],
+                     resize_mode: str, resample_strategy: str,
+                     max_memory: Optional[int], max_pixels: Optional[int],
+                     background: Tuple[int, int, int], timer: _StageTimer) -> Callable:
+    """
+    複数フレームの1フレームをデコード・回転・リサイズ・透明度処理する関数を返す
+    
+    出力サイズはフレームごとにヘッダから求める (ページごとにサイズの異なるTIFFのため)。
+    thumbnailはfitと同じサイズに縮小する。
+    """
+    draft_scale, reducing_gap = _RESAMPLE_SETTINGS[resample_strategy]
+    
+    def transform(frame):
+        target = _target_size(_oriented_size(frame), resize, resize_mode) if resize else None
+        with timer.stage('decode'):
+            _check_image_limits(frame, max_pixels)
+            decode_size = target
+            if target and resize_mode == 'fill':
+                decode_size = _cover_size(_oriented_size(frame), target)
+            drafted = bool(decode_size and draft_scale)
+            if drafted:
+                _apply_draft(frame, decode_size, draft_scale)
+            if max_memory:
+                _fit_memory_budget(frame, decode_size, output_format, max_memory, drafted)
+            frame.load()
+        with timer.stage('transpose'):
+            image = ImageOps.exif_transpose(frame)
+            if image.mode == 'P':
+                # フレームごとにパレットが異なりうるため、LANCZOSで縮小できるよう展開する
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        if target and target != image.size:
+            with timer.stage('resize'):
+                box = _crop_box(image.size, target) if resize_mode == 'fill' else None
+                image = image.resize(target, Image.Resampling.LANCZOS, box=box,
+                                     reducing_gap=reducing_gap)
+        with timer.stage('flatten'):
+            return _prepare_for_format(image, output_format, background)
+    
+    return transform
+
+
+def _convert_frames(img, destination: Union[str, BinaryIO], output_format: Optional[str],
+                    plan: str, transform: Callable, quality: int, effort: str,
+                    timer: _StageTimer) -> None:
+    """
+    複数フレームの画像を1フレームずつ変換して保存する（失敗時は例外を送出）
+    
+    planが'animate'の場合は表示時間・ループ回数・破棄方法を保って1つのファイルに、
+    'split'の場合はフレームごとのファイル (_page_pathsのパス) に保存する。
+    """
+    if plan == 'split':
+        for index, path in enumerate(_page_paths(destination, img.n_frames)):
+            img.seek(index)
+            page = transform(img)
+            with timer.stage('save'), _atomic_output(path) as tmp_path:
+                page.save(tmp_path, format=output_format,
+                          **_save_options(output_format, quality, effort))
+        return
+    
+    def read_frame(index):
+        img.seek(index)
+        frame = transform(img)
+        # WebPの表示時間はフレームの読み込み後に設定される
+        return frame, img.info.get('duration', _DEFAULT_FRAME_DURATION), _gif_disposal(img)
+    
+    _save_frames(_frame_stream_class()(img.n_frames, read_frame, output_format), destination,
+                 output_format, quality, effort, img.info.get('loop'), timer)
+
+
+def _save_frames(stream, destination: Union[str, BinaryIO],
+                 output_format: Optional[str], quality: int, effort: str,
+                 loop: Optional[int], timer: _StageTimer) -> None:
+    """
+    _FrameStreamの全フレームを1つのファイルに保存する
+    
+    loopは入力のループ回数 (Noneはループしない入力で、1回だけ再生する)。
+    """
+    options = _save_options(output_format, quality, effort)
+    if output_format in ('GIF', 'PNG', 'WEBP'):
+        options['duration'] = stream.durations
+        if loop is not None:
+            options['loop'] = loop
+        elif output_format != 'GIF':
+            # GIFはループ回数を書かなければ1回だけ再生される
+            options['loop'] = 1
+    if output_format in ('GIF', 'PNG'):
+        options['disposal'] = stream.disposals
+    
+    # フレームの変換は保存中に行われるため、その時間を除いた分を保存の時間とする
+    converted = sum(timer.timings.values())
+    start = time.perf_counter()
+    if isinstance(destination, str):
+        with _atomic_output(destination) as tmp_path:
+            stream.save(tmp_path, format=output_format, save_all=True, **options)
+    else:
+        stream.save(destination, format=output_format, save_all=True, **options)
+    converted = sum(timer.timings.values()) - converted
+    timer.timings['save'] = (timer.timings.get('save', 0.0)
+                             + time.perf_counter() - start - converted)
+
+
+def _combine_files(input_paths: List[str], output_path: str,
+                   quality: int = 95, resize: Optional[Tuple[int, int]] = None,
+                   resample_strategy: str = 'exact', effort: str = 'default',
+                   max_memory: Optional[int] = None, max_pixels: Optional[int] = None,
+                   resize_mode: str = 'stretch',
+                   timer: Optional[_StageTimer] = None) -> None:
+    """
+    複数の画像を1つの複数フレームのファイルにまとめる（失敗時は例外を送出）
+    
+    入力は保存処理が読む順に1枚ずつ開き、変換した後に閉じる。
+    """
+    timer = timer or _StageTimer()
+    output_format = _format_for_path(output_path)
+    if output_format not in _ANIMATED_OUTPUT_FORMATS:
+        raise ValueError(f"複数フレームを保存できない出力形式です: {output_path}")
+    if not input_paths:
+        raise ValueError("まとめる画像がありません")
+    transform = _frame_transform(output_format, resize, resize_mode, resample_strategy,
+                                 max_memory, max_pixels, (255, 255, 255), timer)
+    
+    def read_frame(index):
+        with timer.stage('open'):
+            image_file = _open_image(input_paths[index], max_pixels)
+        with image_file as img:
+            frame = transform(img)
+            return frame, img.info.get('duration', _DEFAULT_FRAME_DURATION), _gif_disposal(img)
+    
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    _save_frames(_frame_stream_class()(len(input_paths), read_frame, output_format), output_path,
+                 output_format, quality, effort, None, timer)
+
+
+# サムネイルの縮小デコードで、目標サイズの何倍まで粗く読むか (縮小後の画質のため2倍)
+_THUMBNAIL_DRAFT_SCALE = 2
+
+
+def _display_image(img):
+    """表示用にRGBまたはRGBA (透明度がある場合) へ変換する"""
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    if img.mode in ('P', 'PA', 'LA', 'La', 'RGBa') or 'transparency' in img.info:
+        return img.convert('RGBA')
+    if img.mode.startswith('I;16') or img.mode == 'I':
+        # 16bitの画素値を8bitへ (そのまま変換すると255で飽和するため)
+        img = img.convert('I').point(lambda value: value / 256)
+    return img.convert('RGB')
+
+
+def _make_thumbnail(path: str, size: Tuple[int, int]):
+    """縮小デコードでEXIFの向きを反映したサムネイルを作る"""
+    with _open_image(path) as img:
+        _apply_draft(img, size, _THUMBNAIL_DRAFT_SCALE)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size, Image.Resampling.BILINEAR)
+        return _display_image(img)
+
+
+def _center_crop(img, box: Tuple[int, int]):
+    """中央をboxの大きさ (画像より大きい場合は画像全体) で切り出す"""
+    width, height = min(box[0], img.width), min(box[1], img.height)
+    left, top = (img.width - width) // 2, (img.height - height) // 2
+    return img.crop((left, top, left + width, top + height))
+
+
+def _preview_conversion(input_path: str, output_format: str, quality: int,
+                        box: Tuple[int, int], options: dict) -> dict:
+    """
+    ImageConverter.previewの本体
+    
+    変換前の画像は同じ設定で無圧縮に近いPNGへ変換して得る (向き・リサイズ・切り抜きが
+    出力と一致する)。複数フレームの画像は、出力サイズは全フレーム、見た目は先頭フレームで比べる。
+    """
+    output_format = _normalize_format(output_format)
+    output = io.BytesIO()
+    _convert_stream(input_path, output, output_format, quality, **options)
+    reference = io.BytesIO()
+    _convert_stream(input_path, reference, 'PNG', frames='first',
+                    **dict(options, effort='fast'))
+    
+    output_bytes = output.tell()
+    output.seek(0)
+    reference.seek(0)
+    max_pixels = options.get('max_pixels')
+    with _open_image(output, max_pixels) as after, _open_image(reference, max_pixels) as before:
+        return {
+            'before': _display_image(_center_crop(before, box)),
+            'after': _display_image(_center_crop(after, box)),
+            'input_bytes': os.path.getsize(input_path),
+            'output_bytes': output_bytes,
+            'size': after.size,
+        }
+
+
+def _oriented_size(img) -> Tuple[int, int]:
+    """EXIFの向きを適用した後の画像サイズ (デコード前のヘッダから求める)"""
+    if img.getexif().get(0x0112, 1) in _TRANSPOSED_ORIENTATIONS:
+        return img.height, img.width
+    return img.size
+
+
+def _target_size(size: Tuple[int, int], resize: Tuple[int, int], mode: str) -> Tuple[int, int]:
+    """
+    リサイズ方法に応じた出力サイズを返す
+    
+    stretch: resizeそのまま (縦横比は保たない)
+    fit / thumbnail: 縦横比を保ってresizeに収まる最大のサイズ (拡大はしない)
+    fill: resizeそのまま (縦横比を保って覆うように縮小し、はみ出た部分を中央で切り取る)
+    """
+    if mode in ('stretch', 'fill'):
+        return tuple(resize)
+    if mode not in ImageConverter.RESIZE_MODES:
+        raise ValueError(f"不明なリサイズ方法です: {mode}")
+    width, height = size
+    scale = min(resize[0] / width, resize[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _cover_size(size: Tuple[int, int], target: Tuple[int, int]) -> Tuple[int, int]:
+    """縦横比を保ってtargetを覆う最小のサイズ (fillで切り取る前のサイズ)"""
+    scale = max(target[0] / size[0], target[1] / size[1])
+    return max(target[0], round(size[0] * scale)), max(target[1], round(size[1] * scale))
+
+
+def _crop_box(size: Tuple[int, int], target: Tuple[int, int]) -> Tuple[float, float, float, float]:
+    """fillで使う、sizeの画像からtargetと同じ縦横比で中央を切り取る範囲"""
+    width, height = size
+    target_ratio = target[0] / target[1]
+    if width / height > target_ratio:
+        crop_width = height * target_ratio
+        left = (width - crop_width) / 2
+        return left, 0, left + crop_width, height
+    crop_height = width / target_ratio
+    top = (height - crop_height) / 2
+    return 0, top, width, top + crop_height
+
+
+def _convert_bytes(data: bytes, output_format: str, options: dict) -> bytes:
+    """
+    メモリ上の画像データを変換して返す（失敗時は例外を送出）
+    
+    プロセスプールへ渡せるよう、引数はすべてpickle可能な値にする。
+    optionsは_convert_streamのキーワード引数。
+    """
+    output = io.BytesIO()
+    _convert_stream(io.BytesIO(data), output, output_format, **options)
+    return output.getvalue()
+
+
+def _normalize_format(output_format: str) -> str:
+    """出力形式名を正規化する（'jpg' などの別名も受け付ける）"""
+    name = output_format.upper().lstrip('.')
+    for format_name, format_exts in ImageConverter.SUPPORTED_FORMATS.items():
+        if name == format_name or f'.{name.lower()}' in format_exts:
+            return format_name
+    raise ValueError(f"サポートされていない出力形式です: {output_format}")
+
+
+def _convert_renditions(input_path: str, output_base: str, renditions: List[dict],
+                        resample_strategy: str = 'exact',
+                        effort: str = 'default',
+                        max_memory: Optional[int] = None, max_pixels: Optional[int] = None,
+                        background: Tuple[int, int, int] = (255, 255, 255),
+                        timer: Optional[_StageTimer] = None) -> List[str]:
+    """
+    1ファイルから複数のレンディションを作成する（失敗時は例外を送出）
+    
+    入力は1度だけデコード・EXIF回転し、縮小は大きいサイズから順に行って、
+    小さいサイズは既に作成した1段大きい画像から縮小する。
+    
+    Args:
+        input_path: 入力ファイルパス
+        output_base: 出力パスの拡張子を除いた部分 (各出力は "{output_base}_{name}{ext}")
+        renditions: ImageConverter.load_presetで正規化したレンディションのリスト
+        resample_strategy: 縮小戦略 ('fast', 'balanced', 'exact')
+        effort: 圧縮努力度 (レンディションでeffortが省略された場合に使用)
+        max_memory: メモリ上限 (バイト)。最大のレンディションを基準に見積もる
+        max_pixels: 画素数の上限 (0で無制限)
+        background: JPEG/BMPの出力で透明部分に合成する背景色 (R, G, B)
+        timer: 処理段階ごとの時間の記録先 (resize/flatten/saveは全出力の合計)
+        
+    Returns:
+        List[str]: 作成した出力ファイルパス（renditionsの順）
+    """
+    timer = timer or _StageTimer()
+    output_dir = os.path.dirname(output_base)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    draft_scale, reducing_gap = _RESAMPLE_SETTINGS[resample_strategy]
+    sizes = [tuple(r['size']) for r in renditions if r['size']]
+    
+    with timer.stage('open'):
+        image_file = _open_image(input_path, max_pixels)
+    
+    with image_file as img:
+        # すべて縮小出力の場合は、最大のサイズに合わせてデコードする
+        with timer.stage('decode'):
+            _check_image_limits(img, max_pixels)
+            largest = None
+            if len(sizes) == len(renditions):
+                largest = (max(w for w, _ in sizes), max(h for _, h in sizes))
+            drafted = bool(largest and draft_scale)
+            if drafted:
+                _apply_draft(img, largest, draft_scale)
+            if max_memory:
+                flatten_format = 'JPEG' if any(r['format'] in ('JPEG', 'BMP') for r in renditions) else None
+                _fit_memory_budget(img, largest, flatten_format, max_memory, drafted)
+            img.load()
+        
+        with timer.stage('transpose'):
+            base = ImageOps.exif_transpose(img)
+        
+        # 大きいサイズから順に、作成済みの最小の十分な画像から縮小する
+        resized = {}
+        for size in sorted(set(sizes), key=lambda s: s[0] * s[1], reverse=True):
+            source = base
+            for done_size, done_img in resized.items():
+                if (done_size[0] >= size[0] and done_size[1] >= size[1]
+                        and done_size[0] * done_size[1] < source.width * source.height):
+                    source = done_img
+            if size == base.size:
+                resized[size] = base
+                continue
+            with timer.stage('resize'):
+                resized[size] = source.resize(size, Image.Resampling.LANCZOS,
+                                              reducing_gap=reducing_gap)
+        
+        outputs = []
+        for rendition, output_path in zip(renditions, _rendition_outputs(output_base, renditions)):
+            target = resized[tuple(rendition['size'])] if rendition['size'] else base
+            with timer.stage('flatten'):
+                target = _prepare_for_format(target, rendition['format'], background)
+            with timer.stage('save'), _atomic_output(output_path) as tmp_path:
+                target.save(tmp_path, format=rendition['format'],
+                            **_save_options(rendition['format'], rendition['quality'],
+                                            rendition.get('effort') or effort))
+            outputs.append(output_path)
+    return outputs
+
+
+# ジョブの一覧 (convert_manifest) の各ジョブで指定できる項目
+_MANIFEST_FIELDS = ('input', 'output', 'format', 'quality', 'resize', 'resize_mode',
+                    'target_size', 'effort')
+
+
+def _iter_manifest(lines: Iterable[str]) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """
+    ジョブの一覧を1件ずつ (行番号, ジョブの辞書) として返す
+    
+    JSON LinesかCSVかは最初の空でない行で判別する。読み込めない行は
+    ジョブの代わりにエラーメッセージの文字列を返す (ジョブの順を保つため)。
+    """
+    lines = iter(lines)
+    first = ''
+    line_number = 0
+    for first in lines:
+        line_number += 1
+        if first.strip():
+            break
+    else:
+        return
+    
+    if first.lstrip().startswith('{'):
+        for line_number, line in enumerate(itertools.chain([first], lines), line_number):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"JSONとして読み込めません: {e}"
+                continue
+            yield line_number, record if isinstance(record, dict) else "ジョブはオブジェクトで指定してください"
+        return
+    
+    # CSVは1行目を列名とする (空のセルは省略とみなす)
+    import csv
+    
+    header_line = line_number
+    row_start = 1
+    header = next(csv.reader([first]))
+    reader = csv.reader(lines)
+    for row in reader:
+        # 改行を含むセルがあっても、行の開始位置を行番号とする
+        line_number = header_line + row_start
+        row_start = reader.line_num + 1
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) > len(header):
+            yield line_number, f"列の数が列名より多くなっています: {len(row)} > {len(header)}"
+            continue
+        yield line_number, {key.strip(): value.strip()
+                            for key, value in zip(header, row) if value.strip()}
+
+
+def _manifest_task(record: dict, defaults: dict) -> tuple:
+    """ジョブの辞書を検証し、_convert_taskのタスク (input, output, options) にする"""
+    unknown = sorted(set(record) - set(_MANIFEST_FIELDS))
+    if unknown:
+        raise ValueError(f"不明な項目です ({', '.join(_MANIFEST_FIELDS)}): {', '.join(unknown)}")
+    if not record.get('input') or not record.get('output'):
+        raise ValueError("input と output を指定してください")
+    
+    options = {key: value for key, value in defaults.items() if key != 'format'}
+    output_path = str(record['output'])
+    path_format = _format_for_path(output_path)
+    if record.get('format'):
+        output_format = _normalize_format(str(record['format']))
+        if path_format is None and not Path(output_path).suffix:
+            output_path += ImageConverter.OUTPUT_EXTENSIONS[output_format]
+        elif path_format != output_format:
+            raise ValueError(f"出力の拡張子が形式 ({output_format}) と一致しません: {output_path}")
+    elif path_format is None:
+        if Path(output_path).suffix:
+            raise ValueError(f"出力の拡張子が未対応です: {output_path}")
+        output_path += ImageConverter.OUTPUT_EXTENSIONS[_normalize_format(defaults['format'])]
+    
+    if record.get('quality') is not None:
+        try:
+            quality = int(record['quality'])
+        except (TypeError, ValueError):
+            raise ValueError(f"品質が不正です: {record['quality']}") from None
+        if not 1 <= quality <= 100:
+            raise ValueError(f"品質は1-100の間で指定してください: {quality}")
+        options['quality'] = quality
+    if record.get('resize') is not None:
+        resize = record['resize']
+        if isinstance(resize, str):
+            resize = resize.lower().replace('x', ' ').replace(',', ' ').split()
+        if len(resize) != 2 or min(int(value) for value in resize) < 1:
+            raise ValueError(f"リサイズのサイズが不正です: {record['resize']}")
+        options['resize'] = (int(resize[0]), int(resize[1]))
+    if record.get('resize_mode') is not None:
+        if record['resize_mode'] not in ImageConverter.RESIZE_MODES:
+            raise ValueError(f"リサイズ方法が不正です ({', '.join(ImageConverter.RESIZE_MODES)}): "
+                             f"{record['resize_mode']}")
+        options['resize_mode'] = record['resize_mode']
+    if record.get('target_size') is not None:
+        target_size = record['target_size']
+        try:
+            if isinstance(target_size, str):
+                target_size = parse_byte_size(target_size)
+            elif isinstance(target_size, (int, float)) and not isinstance(target_size, bool):
+                target_size = int(target_size)
+            else:
+                raise ValueError
+        except (ValueError, OverflowError):
+            raise ValueError(f"目標サイズが不正です: {record['target_size']}") from None
+        if target_size < 1:
+            raise ValueError(f"目標サイズは1バイト以上で指定してください: {record['target_size']}")
+        options['target_size'] = target_size
+    if record.get('effort') is not None:
+        if record['effort'] not in ImageConverter.EFFORT_LEVELS:
+            raise ValueError(f"圧縮努力度が不正です ({', '.join(ImageConverter.EFFORT_LEVELS)}): "
+                             f"{record['effort']}")
+        options['effort'] = record['effort']
+    return str(record['input']), output_path, options
+
+
+def _convert_manifest_job(job: tuple) -> dict:
+    """
+    ジョブの一覧の1件を変換し、行番号 (line) を付けた結果を返す
+    
+    プロセスプールの子プロセスで実行されるため、ジョブの検証もここで行い、
+    不正なジョブは失敗の結果として順番どおりに返す。
+    
+    Args:
+        job: (行番号, ジョブの辞書またはエラーメッセージ, 共通のオプション,
+              親プロセスがキャッシュから配置した結果 (あればそのまま返す))
+    """
+    line, record, defaults, cached = job
+    if cached is not None:
+        cached['line'] = line
+        return cached
+    try:
+        if isinstance(record, str):
+            raise ValueError(record)
+        task = _manifest_task(record, defaults)
+    except (ValueError, TypeError) as e:
+        input_path = record.get('input') if isinstance(record, dict) else None
+        output_path = record.get('output') if isinstance(record, dict) else None
+        result = _new_result(input_path, output_path)
+        result['error'] = f"ジョブのエラー ({line}行目): {e}"
+    else:
+        result = _convert_task(task)
+    result['line'] = line
+    return result
+
+
+def _work_key(input_path: str, input_dir: str) -> str:
+    """入力ディレクトリからの相対パス (区切りは/)。ホストごとにマウント先が違っても同じになる"""
+    return Path(os.path.relpath(input_path, input_dir)).as_posix()
+
+
+def _shard_of(work_key: str, count: int) -> int:
+    """相対パスのハッシュから、ファイルを担当するシャードの番号 (1からcount) を決める"""
+    digest = hashlib.sha1(work_key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def _rendition_outputs(output_base: str, renditions: List[dict]) -> List[str]:
+    """レンディションごとの出力ファイルパスを返す"""
+    return [f"{output_base}_{r['name']}{ImageConverter.OUTPUT_EXTENSIONS[r['format']]}"
+            for r in renditions]
+
+
+# 末尾の確認で読むバイト数
+_PROBE_TAIL_BYTES = 1024
+
+
+def _probe_file(path: str) -> dict:
+    """
+    ヘッダのみを読み、画像の情報と変換できるかどうかを返す（例外は送出しない）
+    
+    Returns:
+        dict: path, ok, error, warnings, format, width, height, mode, frames,
+              orientation, bytes, pixels
+    """
+    info = {'path': path, 'ok': False, 'error': None, 'warnings': [],
+            'format': None, 'width': 0, 'height': 0, 'mode': None,
+            'frames': 1, 'orientation': 1, 'bytes': 0, 'pixels': 0}
+    try:
+        info['bytes'] = os.path.getsize(path)
+        image_file = _open_image(path)
+    except ValueError as e:
+        # Pillowの画素数上限による拒否 (展開爆弾の可能性)
+        info['error'] = str(e)
+        return info
+    except Exception as e:
+        info['error'] = f"画像として読み込めません: {e}"
+        return info
+    try:
+        with image_file as img:
+            info.update(format=img.format, width=img.width, height=img.height, mode=img.mode,
+                        frames=getattr(img, 'n_frames', 1),
+                        orientation=img.getexif().get(0x0112, 1))
+    except Exception as e:
+        info['error'] = f"画像として読み込めません: {e}"
+        return info
+    
+    info['pixels'] = info['width'] * info['height']
+    if info['format'] not in ImageConverter.SUPPORTED_FORMATS:
+        info['error'] = f"未対応の形式です: {info['format']}"
+        return info
+    if _format_for_path(path) != info['format']:
+        info['warnings'].append(f"拡張子と実際の形式 ({info['format']}) が異なります")
+    
+    # 末尾の終端マーカーで途中で切れたファイルを見つける
+    with open(path, 'rb') as f:
+        f.seek(max(info['bytes'] - _PROBE_TAIL_BYTES, 0))
+        tail = f.read()
+    if info['format'] == 'PNG' and b'IEND' not in tail:
+        info['error'] = "ファイルが途中で切れています (IENDがありません)"
+        return info
+    if info['format'] == 'JPEG' and b'\xff\xd9' not in tail:
+        # 末尾に別のデータを付加したJPEGもあるため、警告に留める
+        info['warnings'].append("ファイルが途中で切れている可能性があります (EOIがありません)")
+    
+    info['ok'] = True
+    return info
+
+
+def _estimate_runtime(probes: List[dict], options: dict, output_format: str,
+                      workers: int) -> Optional[float]:
+    """
+    中央値の大きさの画像を実際にメモリ上で変換して1メガピクセルあたりの時間を測り、
+    全体の変換時間 (秒) を見積もる
+    """
+    probes = sorted((probe for probe in probes if probe['ok']), key=lambda probe: probe['pixels'])
+    if not probes:
+        return None
+    sample = probes[len(probes) // 2]
+    if options.get('renditions'):
+        targets = [(r['format'], {'quality': r['quality'], 'resize': r['size'],
+                                  'effort': r.get('effort') or options.get('effort', 'default')})
+                   for r in options['renditions']]
+    else:
+        targets = [(output_format.upper(), {'quality': options.get('quality', 95),
+                                            'resize': options.get('resize'),
+                                            'resize_mode': options.get('resize_mode', 'stretch'),
+                                            'effort': options.get('effort', 'default'),
+                                            'target_size': options.get('target_size')})]
+    for _, target_options in targets:
+        target_options['background'] = options.get('background', (255, 255, 255))
+    
+    start = time.perf_counter()
+    try:
+        for target_format, target_options in targets:
+            _convert_stream(sample['path'], io.BytesIO(), target_format,
+                            resample_strategy=options.get('resample_strategy', 'exact'),
+                            **target_options)
+    except Exception:
+        return None
+    seconds_per_pixel = (time.perf_counter() - start) / max(sample['pixels'], 1)
+    return seconds_per_pixel * sum(probe['pixels'] for probe in probes) / max(workers, 1)
+
+
+# _atomic_outputが作る一時ファイルの名前 (.{元の名前}.{pid}-{スレッドID}.tmp{拡張子})
+_TEMP_OUTPUT_NAME = re.compile(r'^\..+\.\d+-\d+\.tmp(\.[^.]*)?$')
+
+
+@contextmanager
+def _atomic_output(path: str) -> Iterator[str]:
+    """
+    出力先と同じディレクトリの一時ファイルのパスを渡し、正常に終われば出力先へ置き換える
+    
+    中断や失敗で途中まで書かれたファイルが出力先に残らない。置き換えは新しいファイルとして
+    行うため、キャッシュからハードリンクで配置した出力や、入力自体を上書きする場合も
+    元のファイルの内容は変わらない。一時ファイルは拡張子を保った隠しファイルにする。
+    """
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    tmp_path = os.path.join(directory, f".{stem}.{os.getpid()}-{threading.get_ident()}.tmp{ext}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _fsync_path(path: str) -> None:
+    """
+    ファイルまたはディレクトリをfsyncする
+    
+    ディレクトリを開けない環境 (Windows) や、記録後に削除されたファイルは何もしない。
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # ディレクトリのfsyncに対応しないファイルシステムもある
+        pass
+    finally:
+        os.close(fd)
+
+
+def _format_for_path(path: str) -> Optional[str]:
+    """拡張子から出力形式名を返す（未対応の拡張子はNone）"""
+    ext = Path(path).suffix.lower()
+    for format_name, format_exts in ImageConverter.SUPPORTED_FORMATS.items():
+        if ext in format_exts:
+            return format_name
+    return None
+
+
+def _prepare_for_format(img, output_format: Optional[str],
+                        background: Tuple[int, int, int] = (255, 255, 255)):
+    """
+    透明度を扱えない形式 (JPEG, BMP) 向けに、背景色 (既定は白) で透明度を合成する
+    
+    RGBA/LAはアルファバンドを分離せずそのままマスクに使い、背景の画像だけを確保する。
+    乗算済みアルファ (RGBa, La) とPAは、先に通常のアルファを持つ形式に戻す。
+    パレット画像は_flatten_paletteで画素ごとの合成をせずにRGBへ変換する。
+    """
+    if output_format not in ('JPEG', 'BMP'):
+        return img
+    if img.mode == 'P':
+        return _flatten_palette(img, background)
+    if img.mode in ('RGBa', 'La', 'PA'):
+        img = img.convert('LA' if img.mode == 'La' else 'RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        flattened = Image.new('RGB', img.size, tuple(background))
+        flattened.paste(img, mask=img)
+        return flattened
+    return img
+
+
+def _flatten_palette(img, background: Tuple[int, int, int]):
+    """
+    パレット画像の透明度を、パレットの各色と背景色の合成で処理してRGBにする
+    
+    透明度はパレットの色ごとに決まるため、最大256色の合成だけで画素ごとの合成と
+    同じ結果になる。透明な色がなければパレットを変えずにそのまま変換する。
+    """
+    colors = img.getpalette('RGBA') or []
+    transparency = img.info.get('transparency')
+    if isinstance(transparency, int):
+        transparency = bytes([255] * transparency + [0])
+    if isinstance(transparency, bytes):
+        for index, alpha in enumerate(transparency[:len(colors) // 4]):
+            colors[index * 4 + 3] = min(colors[index * 4 + 3], alpha)
+    if all(alpha == 255 for alpha in colors[3::4]):
+        return img.convert('RGB')
+    
+    palette = []
+    for index in range(0, len(colors), 4):
+        alpha = colors[index + 3]
+        for color, back in zip(colors[index:index + 3], background):
+            palette.append((color * alpha + back * (255 - alpha) + 127) // 255)
+    flattened = img.copy()
+    flattened.info.pop('transparency', None)
+    flattened.putpalette(palette)
+    return flattened.convert('RGB')
+
+
+# 圧縮努力度ごとのエンコーダ設定
+# fast: 圧縮率より速度を優先する
+# default: 速度と圧縮率の釣り合いを取る
+# max: 時間をかけて出力サイズを最小化する（WebP method=6、PNG optimize等）
+_EFFORT_SETTINGS = {
+    'fast': {
+        'JPEG': {'optimize': False, 'subsampling': '4:2:0'},
+        'PNG': {'compress_level': 1},
+        'WEBP': {'method': 0},
+        'TIFF': {'compression': 'raw'},
+    },
+    'default': {
+        'JPEG': {'optimize': True},
+        'PNG': {'compress_level': 6},
+        'WEBP': {'method': 4},
+        'TIFF': {'compression': 'raw'},
+    },
+    'max': {
+        'JPEG': {'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'WEBP': {'method': 6},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+    },
+}
+
+
+def _save_options(output_format: Optional[str], quality: int, effort: str = 'default') -> dict:
+    """出力形式と圧縮努力度ごとの保存設定を返す"""
+    save_kwargs = dict(_EFFORT_SETTINGS[effort].get(output_format, {}))
+    if output_format in ('JPEG', 'WEBP'):
+        save_kwargs['quality'] = quality
+    return save_kwargs
+
+
+def _task_outputs(task: tuple) -> List[str]:
+    """
+    変換タスクが作成する出力ファイルのリスト
+    
+    フレームごとのファイルに分ける場合はページ数を知るためにヘッダを読むため、
+    実際に変換する (またはキャッシュから配置する) ファイルにのみ使う。
+    """
+    input_path, output_path, options = task
+    if options.get('renditions'):
+        return _rendition_outputs(output_path, options['renditions'])
+    return _page_outputs(input_path, output_path, options.get('frames', 'all'),
+                         options.get('max_pixels')) or [output_path]
+
+
+def _new_result(input_path: str, output_path: str) -> dict:
+    """未実行 (失敗扱い、出力なし) の変換結果を作る"""
+    return {'input': input_path, 'output': output_path,
+            'success': False, 'error': None, 'outputs': [],
+            'timings': {}, 'elapsed': 0.0, 'input_bytes': 0, 'output_bytes': 0}
+
+
+def _convert_task(task: tuple) -> dict:
+    """
+    変換タスクを実行し、結果を辞書で返す
+    
+    Args:
+        task: (input_path, output_path, options)
+              optionsは_convert_fileのキーワード引数
+        
+    Returns:
+        dict: 次のキーを持つ結果
+            input, output: 入力と出力のパス
+            outputs: 作成した出力ファイルのリスト
+            success, error: 成否とエラーメッセージ
+            timings: 処理段階ごとの秒数 (open, decode, transpose, resize, flatten, save)
+            elapsed: 全体の秒数
+            input_bytes, output_bytes: 入力と出力のバイト数
+    """
+    input_path, output_path, options = task
+    result = _new_result(input_path, output_path)
+    
+    # 入力ファイルの存在確認
+    if not os.path.exists(input_path):
+        result['error'] = f"エラー: 入力ファイルが見つかりません: {input_path}"
+        return result
+    
+    timer = _StageTimer()
+    start = time.perf_counter()
+    try:
+        result['input_bytes'] = os.path.getsize(input_path)
+        if options.get('renditions'):
+            result['outputs'] = _convert_renditions(input_path, output_path, timer=timer, **options)
+        else:
+            pages = _page_outputs(input_path, output_path, options.get('frames', 'all'),
+                                  options.get('max_pixels'))
+            result['passthrough'] = _convert_file(input_path, output_path, timer=timer, **options)
+            result['outputs'] = pages or [output_path]
+        if timer.quality_search:
+            result['quality_search'] = timer.quality_search
+        result['output_bytes'] = sum(os.path.getsize(path) for path in result['outputs'])
+        result['success'] = True
+    except Exception as e:
+        result['error'] = f"変換エラー ({input_path}): {str(e)}"
+    result['elapsed'] = time.perf_counter() - start
+    result['timings'] = timer.timings
+    return result
+
+
+def _ordered_pool_map(executor, func, iterable, window: int,
+                      control: Optional[BatchControl] = None):
+    """
+    executor上でfuncを並列実行し、入力順に結果を返すジェネレータ
+    
+    同時に投入するタスク数をwindowに制限し、入力を遅延評価する。
+    controlを指定した場合、一時停止中は新しいタスクを投入する前に実行中の結果を返し、
+    中止時はまだ始まっていないタスクを取り消して、実行中のタスクの結果だけを返す。
+    """
+    pending = deque()
+    iterator = iter(iterable)
+    while True:
+        if control is not None:
+            if control.paused:
+                while pending:
+                    yield pending.popleft().result()
+            if not control.wait():
+                break
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    if control is not None and control.cancelled:
+        pending = deque(future for future in pending if not future.cancel())
+    while pending:
+        yield pending.popleft().result()
+
+
+def main():
+    """コマンドライン実行用メイン関数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description='画像ファイル変換ソフト - Image File Converter',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 単一ファイル変換
+  python image_converter.py input.jpg output.png
+  
+  # バッチ変換
+  python image_converter.py --batch input_dir output_dir --format PNG
+  
+  # リサイズ付き変換
+  python image_converter.py input.jpg output.jpg --resize 800 600
+  
+  # 高速な縮小 (JPEGは目標サイズ付近で縮小デコード)
+  python image_converter.py input.jpg output.jpg --resize 800 600 --resample-strategy balanced
+  
+  # 品質指定変換
+  python image_converter.py input.png output.jpg --quality 85
+  
+  # 200KB以下に収まる最大の品質で変換 (品質はメモリ上で二分探索)
+  python image_converter.py --batch input_dir output_dir --format JPEG --target-size 200K
+  
+  # 4プロセスで並列バッチ変換
+  python image_converter.py --batch input_dir output_dir --format WEBP --workers 4
+  
+  # 圧縮より速度を優先してバッチ変換
+  python image_converter.py --batch input_dir output_dir --format PNG --effort fast
+  
+  # 段階別の処理時間を集計して保存
+  python image_converter.py --batch input_dir output_dir --format JPEG --metrics stats.json --metrics stats.prom
+  
+  # プリセットのレンディション (サムネイル・中サイズ等) を一括作成
+  python image_converter.py --batch input_dir output_dir --preset renditions.json
+  
+  # 巨大な画像を1ファイル1GBまでのメモリで変換 (超えるものは失敗として記録)
+  python image_converter.py --batch input_dir output_dir --format JPEG --resize 1920 1080 --max-memory 1G
+  
+  # 縦横比を保って長辺1600ピクセル以内に縮小 / 200x200の正方形に切り抜き
+  python image_converter.py --batch input_dir output_dir --format JPEG --max-side 1600
+  python image_converter.py --batch input_dir output_dir --format JPEG --fill 200 200
+  
+  # アニメーションGIFをアニメーションWebPに / 複数ページTIFFをページごとのJPEGに
+  python image_converter.py anim.gif anim.webp
+  python image_converter.py scan.tif pages/scan.jpg
+  
+  # ページごとの画像を1つの複数ページTIFFにまとめる
+  python image_converter.py --combine pages/ scan.tif
+  
+  # 既にJPEGで向きも正しいファイルは再エンコードせずにコピー
+  python image_converter.py --batch input_dir output_dir --format JPEG --passthrough
+  
+  # 変換せずに、全ファイルの形式・サイズと所要時間の見積もりを表示
+  python image_converter.py --batch input_dir output_dir --format WEBP --workers 0 --dry-run
+  
+  # 変換結果をキャッシュし、重複した画像の再変換を省く
+  python image_converter.py --batch input_dir output_dir --format WEBP --cache ~/.cache/image_converter
+  
+  # 変換サーバーとして常駐 (~/.image_converter/server.sock、クライアントは image_converter_server.py)
+  python image_converter.py --serve --workers 4
+  
+  # 変更のあったファイルのみ再変換
+  python image_converter.py --batch input_dir output_dir --format WEBP --incremental
+  
+  # 中断したバッチ変換を続きから再開
+  python image_converter.py --batch input_dir output_dir --format WEBP --resume
+  
+  # 4台のホストで分担 (ホストごとに 1/4 〜 4/4 を指定)
+  python image_converter.py --batch input_dir output_dir --format WEBP --shard 1/4
+  
+  # 共有ディレクトリのクレームで、起動したホスト・プロセスが空いているファイルを順に変換
+  python image_converter.py --batch input_dir output_dir --format WEBP --claim-dir /mnt/shared/claims
+  
+  # ジョブの一覧 (JSON Lines/CSV) を標準入力から読んで変換し、結果をJSON Linesで出力
+  generate_jobs | python image_converter.py --manifest - --workers 4 > results.jsonl
+        """
+    )
+    
+    parser.add_argument('input', nargs='?', help='入力ファイルまたはディレクトリ')
+    parser.add_argument('output', nargs='?', help='出力ファイルまたはディレクトリ')
+    parser.add_argument('--batch', action='store_true', 
+                       help='バッチ変換モード')
+    parser.add_argument('--format', default='PNG',
+                       choices=['JPEG', 'PNG', 'BMP', 'GIF', 'TIFF', 'WEBP'],
+                       help='出力形式 (バッチモード時)')
+    parser.add_argument('--quality', type=int, default=95, 
+                       help='JPEG品質 (1-100)')
+    parser.add_argument('--target-size', type=parse_byte_size, metavar='SIZE',
+                       help='出力の上限 (例: 200K, JPEG/WebPのみ)。上限に収まる最大の'
+                            '品質 (--quality以下) を探して保存する')
+    resize_group = parser.add_mutually_exclusive_group()
+    resize_group.add_argument('--resize', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'),
+                       help='リサイズサイズ (幅 高さ、縦横比は保たない)')
+    resize_group.add_argument('--fit', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'),
+                       help='縦横比を保って幅・高さに収まるよう縮小 (拡大はしない)')
+    resize_group.add_argument('--fill', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'),
+                       help='縦横比を保って幅・高さを覆うよう縮小し、はみ出た部分を中央で切り取る')
+    resize_group.add_argument('--max-side', type=int, metavar='N',
+                       help='長辺がNピクセル以下になるよう縦横比を保って縮小')
+    resize_group.add_argument('--thumbnail', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'),
+                       help='--fitと同じサイズのサムネイルを、縮小デコードで省メモリに作成')
+    parser.add_argument('--resample-strategy', default='exact',
+                       choices=ImageConverter.RESAMPLE_STRATEGIES,
+                       help='縮小戦略: fast=高速, balanced=速度と品質の両立, '
+                            'exact=元解像度から縮小 (デフォルト: exact)')
+    parser.add_argument('--effort', default='default',
+                       choices=ImageConverter.EFFORT_LEVELS,
+                       help='圧縮努力度: fast=高速, default=標準, '
+                            'max=出力サイズ最小 (デフォルト: default)')
+    parser.add_argument('--background', type=parse_color, default=(255, 255, 255), metavar='COLOR',
+                       help="JPEG/BMPへの変換で透明部分に合成する背景色 "
+                            "(例: white, '#f0f0f0'、デフォルト: white)")
+    parser.add_argument('--frames', default='all', choices=ImageConverter.FRAME_MODES,
+                       help='アニメーションや複数ページTIFFの扱い: all=全フレームを変換 '
+                            '(JPEG/BMPへはフレームごとのファイル), first=先頭のみ, '
+                            'split=常にフレームごとのファイル (デフォルト: all)')
+    parser.add_argument('--combine', action='store_true',
+                       help='入力ディレクトリ内の画像をファイル名順に1つの複数ページTIFF・'
+                            'アニメーション (GIF/WebP/PNG) にまとめる')
+    parser.add_argument('--metrics', action='append', metavar='FILE',
+                       help='段階別の時間とバイト数の集計を保存 (.json/.csv/.prom、複数指定可)')
+    parser.add_argument('--max-memory', type=parse_byte_size, metavar='SIZE',
+                       help='1ファイルの変換に使うメモリの上限 (例: 512M, 2G)。'
+                            '超える画像は縮小デコードするか、変換せずに失敗とする')
+    parser.add_argument('--max-pixels', type=int, metavar='N',
+                       help='画素数の上限 (0で無制限、デフォルト: Pillowの既定値)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                       help='バッチ変換の並列プロセス数 (0でCPUコア数、デフォルト: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                       help='前回から変更のないファイルをスキップ (バッチモード時)')
+    parser.add_argument('--recursive', action='store_true',
+                       help='サブディレクトリも変換し、出力に同じ構成で保存 (バッチモード時)')
+    parser.add_argument('--resume', action='store_true',
+                       help='中断したバッチ変換を、出力ディレクトリのジャーナルを使って続きから再開 '
+                            '(前回と同じ設定の場合のみ、失敗したファイルは変換し直す)')
+    parser.add_argument('--durable', action='store_true',
+                       help='バッチ変換の出力をジャーナルに記録する前にfsyncし、電源断でも変換済みの出力を'
+                            '失わないようにする (出力ごとにfsyncするため遅くなる)')
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                       help='入力を相対パスのハッシュでN個に分け、I番目 (1からN) だけを変換 (バッチモード時)')
+    parser.add_argument('--claim-dir', metavar='DIR',
+                       help='共有ディレクトリのクレームファイルで複数のホスト・プロセスが分担し、'
+                            '他が担当したファイルは変換しない (バッチモード時)')
+    parser.add_argument('--passthrough', action='store_true',
+                       help='同じ形式で向き・サイズの変更が不要なファイルは再エンコードせずにコピー '
+                            '(向きだけが異なるJPEGはjpegtranがあれば可逆に回転)')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='変換せずに、ヘッダから形式・サイズ等を調べて所要時間を見積もる')
+    parser.add_argument('--preflight', action='store_true',
+                       help='変換前に全ファイルのヘッダを調べ、読み込めないファイルを除外して'
+                            '大きい画像から変換する (バッチモード時)')
+    parser.add_argument('--cache', metavar='DIR',
+                       help='変換結果のキャッシュ。同じ内容の入力を同じ設定で変換する場合は再利用する')
+    parser.add_argument('--cache-size', type=parse_byte_size, default=1024 ** 3, metavar='SIZE',
+                       help='キャッシュの合計サイズの上限 (古いものから削除、デフォルト: 1G)')
+    parser.add_argument('--cache-link', action='store_true',
+                       help='キャッシュからコピーする代わりにハードリンクを作る')
+    parser.add_argument('--serve', nargs='?', const='', metavar='ADDRESS',
+                       help="変換サーバーとして常駐する (Unixソケットのパス、デフォルト: "
+                            "~/.image_converter/server.sock。'HOST:PORT' のTCPはトークンで認証)。"
+                            "ワーカー数は --workers で指定")
+    parser.add_argument('--manifest', metavar='FILE',
+                       help="ジョブの一覧 (JSON LinesまたはCSV、'-'で標準入力) に従って変換する。"
+                            "各行は input, output と format, quality, resize 等を持ち、"
+                            "結果は1件ずつJSON Linesで標準出力に書く (メッセージは標準エラー出力)")
+    parser.add_argument('--preset', metavar='FILE',
+                       help='レンディションのプリセット (JSON)。1度のデコードで複数の形式・'
+                            'サイズを出力し、出力はディレクトリとして扱う')
+    
+    args = parser.parse_args()
+    
+    if args.serve is not None:
+        import image_converter_server
+        try:
+            image_converter_server.serve(args.serve or image_converter_server.DEFAULT_ADDRESS,
+                                         args.workers)
+        except (OSError, ValueError) as e:
+            print(f"エラー: サーバーを起動できません: {e}")
+            return 1
+        return 0
+    if args.manifest:
+        if args.input or args.batch or args.preset or args.combine:
+            parser.error("--manifest は入力・出力の指定や --batch/--preset/--combine と同時に指定できません")
+    elif not args.input or not args.output:
+        parser.error("入力と出力を指定してください")
+    
+    # 引数の検証
+    if args.quality < 1 or args.quality > 100:
+        print("エラー: 品質は1-100の間で指定してください")
+        return 1
+    if args.workers < 0:
+        print("エラー: 並列数は0以上で指定してください")
+        return 1
+    if args.max_pixels is not None and args.max_pixels < 0:
+        print("エラー: 画素数の上限は0以上で指定してください")
+        return 1
+    if args.durable and not args.batch:
+        print("エラー: --durable はバッチモードでのみ指定できます")
+        return 1
+    if (args.shard or args.claim_dir) and not args.batch:
+        print("エラー: --shard/--claim-dir はバッチモードでのみ指定できます")
+        return 1
+    if (args.shard or args.claim_dir) and args.incremental:
+        print("エラー: --incremental は --shard/--claim-dir と同時に指定できません")
+        return 1
+    if args.target_size is not None:
+        if args.preset or args.combine:
+            print("エラー: --target-size は --preset/--combine と同時に指定できません")
+            return 1
+        if args.batch and args.format not in _TARGET_SIZE_FORMATS:
+            print(f"エラー: --target-size は {'/'.join(_TARGET_SIZE_FORMATS)} の出力でのみ指定できます")
+            return 1
+    
+    for path in args.metrics or []:
+        if Path(path).suffix.lower() not in ConversionMetrics.FILE_EXTENSIONS:
+            print(f"エラー: メトリクスの形式が不明です "
+                  f"({'/'.join(ConversionMetrics.FILE_EXTENSIONS)}): {path}")
+            return 1
+    
+    renditions = None
+    if args.preset:
+        try:
+            renditions = ImageConverter.load_preset(args.preset)
+        except (OSError, ValueError) as e:
+            print(f"エラー: プリセットを読み込めません: {e}")
+            return 1
+    
+    cache = None
+    if args.cache:
+        cache = OutputCache(args.cache, args.cache_size, link=args.cache_link)
+    converter = ImageConverter(cache=cache)
+    
+    # リサイズ方法ごとのオプションを (サイズ, 方法) にまとめる
+    resize, resize_mode = None, 'stretch'
+    if args.resize:
+        resize = tuple(args.resize)
+    elif args.fit or args.fill or args.thumbnail:
+        resize_mode = 'fit' if args.fit else 'fill' if args.fill else 'thumbnail'
+        resize = tuple(args.fit or args.fill or args.thumbnail)
+    elif args.max_side:
+        resize, resize_mode = (args.max_side, args.max_side), 'fit'
+    if resize and min(resize) < 1:
+        print("エラー: リサイズのサイズは1以上で指定してください")
+        return 1
+    
+    try:
+        if args.manifest:
+            # 結果は標準出力へ1件ずつ書き、下流のツールが逐次読めるようにする
+            def write_result(record):
+                print(json.dumps(record, ensure_ascii=False), flush=True)
+            
+            def print_message(event):
+                text = ImageConverter.format_event(event)
+                if text is not None:
+                    print(text, file=sys.stderr)
+            
+            options = {'quality': args.quality, 'resize': resize, 'resize_mode': resize_mode,
+                       'resample_strategy': args.resample_strategy, 'effort': args.effort,
+                       'max_memory': args.max_memory, 'max_pixels': args.max_pixels,
+                       'passthrough': args.passthrough, 'frames': args.frames,
+                       'background': args.background, 'target_size': args.target_size}
+            if args.manifest == '-':
+                counts = converter.convert_manifest(sys.stdin, args.format, options, args.workers,
+                                                    write_result, print_message)
+            else:
+                try:
+                    f = open(args.manifest, 'r', encoding='utf-8', newline='')
+                except OSError as e:
+                    print(f"エラー: ジョブの一覧を読み込めません: {e}", file=sys.stderr)
+                    return 1
+                with f:
+                    counts = converter.convert_manifest(f, args.format, options, args.workers,
+                                                        write_result, print_message)
+            for path in args.metrics or []:
+                converter.metrics.write(path)
+            return 1 if counts['failed'] else 0
+        elif args.combine:
+            success = converter.combine_images(args.input, args.output, args.quality, resize,
+                                               resample_strategy=args.resample_strategy,
+                                               effort=args.effort,
+                                               max_memory=args.max_memory,
+                                               max_pixels=args.max_pixels,
+                                               resize_mode=resize_mode)
+            for path in args.metrics or []:
+                converter.metrics.write(path)
+            return 0 if success else 1
+        elif args.batch:
             # バッチ変換
-            resize = tuple(args.resize) if args.resize else None
             converter.batch_convert(args.input, args.output, args.format, 
-                                  args.quality, resize)
+                                  args.quality, resize, workers=args.workers,
+                                  incremental=args.incremental,
+                                  resample_strategy=args.resample_strategy,
+                                  recursive=args.recursive,
+                                  renditions=renditions, effort=args.effort,
+                                  metrics_files=args.metrics,
+                                  max_memory=args.max_memory,
+                                  max_pixels=args.max_pixels,
+                                  preflight=args.preflight, dry_run=args.dry_run,
+                                  passthrough=args.passthrough, resize_mode=resize_mode,
+                                  frames=args.frames, background=args.background,
+                                  resume=args.resume, target_size=args.target_size,
+                                  shard=args.shard, claim_dir=args.claim_dir,
+                                  durable=args.durable)
+        elif args.dry_run:
+            probe = converter.probe(args.input)
+            print(converter.format_probe(probe))
+            return 0 if probe['ok'] else 1
         else:
             # 単一ファイル変換
             if not converter.is_supported_format(args.input):
@@ -225,9 +3796,27 @@ def main():
                 print(f"サポート形式: {', '.join(converter.get_supported_extensions())}")
                 return 1
             
-            resize = tuple(args.resize) if args.resize else None
-            success = converter.convert_image(args.input, args.output, 
-                                            args.quality, resize)
+            if renditions:
+                success = converter.convert_renditions(args.input, args.output, renditions,
+                                                       resample_strategy=args.resample_strategy,
+                                                       effort=args.effort,
+                                                       max_memory=args.max_memory,
+                                                       max_pixels=args.max_pixels,
+                                                       background=args.background)
+            else:
+                success = converter.convert_image(args.input, args.output, 
+                                                args.quality, resize,
+                                                resample_strategy=args.resample_strategy,
+                                                effort=args.effort,
+                                                max_memory=args.max_memory,
+                                                max_pixels=args.max_pixels,
+                                                passthrough=args.passthrough,
+                                                resize_mode=resize_mode,
+                                                frames=args.frames,
+                                                background=args.background,
+                                                target_size=args.target_size)
+            for path in args.metrics or []:
+                converter.metrics.write(path)
             return 0 if success else 1
             
     except KeyboardInterrupt:
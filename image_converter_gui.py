@@ -6,12 +6,465 @@ Windows用Python画像変換ツール - グラフィカルユーザーインタ
 """
 
 import os
+import queue
+import time
 import tkinter as tk
+from collections import OrderedDict, deque
 from tkinter import ttk, filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
 import threading
-from pathlib import Path
-from image_converter import ImageConverter
+from image_converter import BatchControl, ImageConverter
+
+
+# 進捗イベントを処理する間隔 (ミリ秒) と、1回に処理する最大イベント数
+EVENT_POLL_INTERVAL = 100
+EVENT_BATCH_LIMIT = 1000
+
+# 処理速度を求める直近の時間 (秒)
+THROUGHPUT_WINDOW = 5.0
+
+# サムネイル一覧: サムネイルとセルの大きさ (ピクセル)、キャッシュする画素データの上限
+THUMBNAIL_SIZE = (128, 128)
+THUMBNAIL_CELL = (150, 156)
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+
+# 変換前後のプレビューの大きさと、入力・設定の変更から作り直すまでの待ち時間 (ミリ秒)
+PREVIEW_BOX = (320, 240)
+PREVIEW_DELAY = 300
+
+# フォルダの走査結果を画面へ渡す件数
+LISTING_CHUNK = 1000
+
+# リサイズ方法の表示名
+RESIZE_MODE_LABELS = {
+    'stretch': '指定サイズ',
+    'fit': '縦横比を保って収める',
+    'fill': '切り抜いて埋める',
+    'thumbnail': 'サムネイル',
+}
+
+
+def format_bytes(nbytes):
+    """バイト数をKB/MB単位の文字列にする"""
+    if nbytes < 1024 * 1024:
+        return f"{nbytes / 1024:.1f} KB"
+    return f"{nbytes / 1024 / 1024:.1f} MB"
+
+
+def format_duration(seconds):
+    """秒数を h:mm:ss (1時間未満は m:ss) の文字列にする"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ThroughputMeter:
+    """
+    処理済みのファイル数とバイト数から、処理速度と残り時間を求める
+    
+    並列実行の結果がまとめて届いても表示が大きく揺れないよう、
+    直近 window 秒の記録から速度を求める。
+    """
+    
+    def __init__(self, window=THROUGHPUT_WINDOW):
+        self.window = window
+        self.started = time.monotonic()
+        self.files = 0
+        self.bytes = 0
+        self._samples = deque([(self.started, 0, 0)])
+    
+    def add(self, files, nbytes):
+        """処理済みのファイル数とバイト数を加える"""
+        self.files += files
+        self.bytes += nbytes
+        now = time.monotonic()
+        self._samples.append((now, self.files, self.bytes))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+    
+    def elapsed(self):
+        return time.monotonic() - self.started
+    
+    def rates(self):
+        """直近の (ファイル/秒, バイト/秒) を返す"""
+        since, files, nbytes = self._samples[0]
+        seconds = time.monotonic() - since
+        if seconds <= 0:
+            return 0.0, 0.0
+        return (self.files - files) / seconds, (self.bytes - nbytes) / seconds
+    
+    def eta(self, total):
+        """残り時間 (秒) を返す (総数が不明、または速度が0の場合はNone)"""
+        files_per_second = self.rates()[0]
+        if not total or files_per_second <= 0:
+            return None
+        return max(total - self.files, 0) / files_per_second
+
+
+class ThumbnailCache:
+    """
+    サムネイルのLRUキャッシュ
+    
+    画素データの合計が max_bytes を超えたら、最も長く使われていないものから捨てる。
+    メインスレッドからのみ使う。
+    """
+    
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+    
+    @staticmethod
+    def _image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def get(self, key):
+        """キャッシュにあれば返し、最近使ったものにする (なければNone)"""
+        img = self._items.get(key)
+        if img is not None:
+            self._items.move_to_end(key)
+        return img
+    
+    def put(self, key, img):
+        """追加し、上限を超えた分を古いものから捨てる"""
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.bytes -= self._image_bytes(old)
+        self._items[key] = img
+        self.bytes += self._image_bytes(img)
+        while self.bytes > self.max_bytes and len(self._items) > 1:
+            _, evicted = self._items.popitem(last=False)
+            self.bytes -= self._image_bytes(evicted)
+
+
+class PreviewPanel(ttk.Frame):
+    """
+    入力フォルダのサムネイル一覧と、選択した画像の変換前後のプレビュー
+    
+    一覧は見えている行のセルだけをCanvasに描き、サムネイルもその分だけ
+    バックグラウンドのスレッドで縮小デコードする。スクロールで見えなくなったセルの
+    未着手のデコードは取り消す。フォルダの走査も別スレッドで行い、一定件数ごとに
+    一覧へ加えるため、ファイル数が多くても操作を妨げない。ワーカーの結果はキューで
+    受け取り、Tkの操作はafterによる定期処理 (メインスレッド) でのみ行う。
+    """
+    
+    def __init__(self, parent, converter, get_settings):
+        """
+        Args:
+            converter: サムネイルとプレビューを作るImageConverter
+            get_settings: 現在の変換設定 (output_format, quality, resize, resize_mode) を
+                          返す関数 (メインスレッドで呼ぶ)
+        """
+        super().__init__(parent, padding="10")
+        self.converter = converter
+        self.get_settings = get_settings
+        self.results = queue.Queue()
+        self.cache = ThumbnailCache()
+        self.failed = set()
+        # ワーカーのスレッドは最初に使うときに作る (ウィンドウを早く表示するため)
+        self.executor = None
+        self.preview_executor = None
+        
+        self.paths = []
+        self.selected = None
+        # デコード中のサムネイル (パス -> Future) と、表示中のセルのPhotoImage
+        self.pending = {}
+        self.photos = {}
+        # 古い走査・プレビューの結果を捨てるための通し番号
+        self.listing_id = 0
+        self.listing = False
+        self.preview_id = 0
+        self.preview_future = None
+        self.preview_photos = ()
+        self.redraw_scheduled = False
+        self.load_job = None
+        self.preview_job = None
+        
+        self.setup_ui()
+        self.after(EVENT_POLL_INTERVAL, self.poll_results)
+    
+    def setup_ui(self):
+        """UIセットアップ"""
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        
+        self.count_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.count_var).grid(row=0, column=0, sticky=tk.W)
+        
+        self.canvas = tk.Canvas(self, background="white", highlightthickness=0,
+                                yscrollincrement=THUMBNAIL_CELL[1] // 4)
+        self.canvas.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scroll)
+        scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.canvas.config(yscrollcommand=scrollbar.set)
+        
+        self.canvas.bind("<Configure>", lambda event: self.schedule_redraw())
+        self.canvas.bind("<Button-1>", self.on_click)
+        # ホイール (Windows/macOSは<MouseWheel>、X11は<Button-4>/<Button-5>)
+        self.canvas.bind("<MouseWheel>", lambda event: self.on_scroll(
+            'scroll', -1 if event.delta > 0 else 1, 'units'))
+        self.canvas.bind("<Button-4>", lambda event: self.on_scroll('scroll', -1, 'units'))
+        self.canvas.bind("<Button-5>", lambda event: self.on_scroll('scroll', 1, 'units'))
+        
+        # 変換前後のプレビュー (出力の解像度で中央を等倍で切り出す)
+        compare_frame = ttk.Frame(self)
+        compare_frame.grid(row=1, column=2, sticky=(tk.N, tk.S), padx=(10, 0))
+        ttk.Label(compare_frame, text="変換前").grid(row=0, column=0, sticky=tk.W)
+        self.before_label = ttk.Label(compare_frame)
+        self.before_label.grid(row=1, column=0, sticky=tk.W)
+        ttk.Label(compare_frame, text="変換後").grid(row=2, column=0, sticky=tk.W, pady=(10, 0))
+        self.after_label = ttk.Label(compare_frame)
+        self.after_label.grid(row=3, column=0, sticky=tk.W)
+        self.info_var = tk.StringVar(value="画像をクリックすると変換結果をプレビューします")
+        ttk.Label(compare_frame, textvariable=self.info_var, wraplength=PREVIEW_BOX[0]).grid(
+            row=4, column=0, sticky=tk.W, pady=(10, 0))
+    
+    def schedule_load(self, path):
+        """入力欄の変更が落ち着いてから一覧を作り直す"""
+        if self.load_job is not None:
+            self.after_cancel(self.load_job)
+        self.load_job = self.after(PREVIEW_DELAY, lambda: self.load(path))
+    
+    def load(self, path):
+        """入力 (フォルダまたは画像ファイル) の一覧を作り直す"""
+        self.load_job = None
+        self.listing_id += 1
+        self.cancel_pending()
+        self.paths = []
+        self.selected = None
+        self.listing = False
+        if os.path.isdir(path):
+            self.listing = True
+            thread = threading.Thread(target=self.list_files, args=(path, self.listing_id))
+            thread.daemon = True
+            thread.start()
+        elif os.path.isfile(path) and self.converter.is_supported_format(path):
+            self.paths = [path]
+            self.select(path)
+        self.canvas.yview_moveto(0)
+        self.update_count()
+        self.schedule_redraw()
+    
+    def list_files(self, directory, listing_id):
+        """フォルダを走査し、LISTING_CHUNK件ごとに結果キューへ渡す（別スレッド）
+
+        読めないフォルダなどの警告もイベントとして結果キューへ渡す。
+        """
+        def post(event):
+            self.results.put(('event', listing_id, event))
+        
+        chunk = []
+        for path in self.converter.iter_image_files(directory, on_event=post):
+            # 別のフォルダを選び直した場合は走査をやめる
+            if listing_id != self.listing_id:
+                return
+            chunk.append(path)
+            if len(chunk) >= LISTING_CHUNK:
+                self.results.put(('files', listing_id, chunk))
+                chunk = []
+        self.results.put(('files', listing_id, chunk))
+        self.results.put(('listed', listing_id, None))
+    
+    def update_count(self):
+        text = f"{len(self.paths)} ファイル"
+        if self.listing:
+            text += " (読み込み中...)"
+        self.count_var.set(text)
+    
+    def on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_redraw()
+    
+    def columns(self):
+        return max(1, self.canvas.winfo_width() // THUMBNAIL_CELL[0])
+    
+    def on_click(self, event):
+        """クリックしたセルの画像を選択する"""
+        column = int(self.canvas.canvasx(event.x)) // THUMBNAIL_CELL[0]
+        row = int(self.canvas.canvasy(event.y)) // THUMBNAIL_CELL[1]
+        columns = self.columns()
+        index = row * columns + column
+        if column < columns and 0 <= index < len(self.paths):
+            self.select(self.paths[index])
+            self.schedule_redraw()
+    
+    def select(self, path):
+        self.selected = path
+        self.schedule_preview()
+    
+    def schedule_redraw(self):
+        """描き直しを1回にまとめる"""
+        if not self.redraw_scheduled:
+            self.redraw_scheduled = True
+            self.after_idle(self.redraw)
+    
+    def redraw(self):
+        """見えている行のセルだけを描き、未取得のサムネイルのデコードを依頼する"""
+        from PIL import ImageTk
+        
+        self.redraw_scheduled = False
+        canvas = self.canvas
+        cell_width, cell_height = THUMBNAIL_CELL
+        thumb_width, thumb_height = THUMBNAIL_SIZE
+        columns = self.columns()
+        rows = -(-len(self.paths) // columns)
+        canvas.config(scrollregion=(0, 0, columns * cell_width, rows * cell_height))
+        
+        top = int(canvas.canvasy(0))
+        bottom = top + canvas.winfo_height()
+        first = max(top // cell_height, 0) * columns
+        last = min((bottom // cell_height + 1) * columns, len(self.paths))
+        visible = set(self.paths[first:last])
+        
+        # 見えなくなったセルの、まだ始まっていないデコードを取り消す
+        for path in [path for path in self.pending if path not in visible]:
+            if self.pending[path].cancel():
+                del self.pending[path]
+        
+        canvas.delete('cell')
+        photos = {}
+        for index in range(first, last):
+            path = self.paths[index]
+            x = (index % columns) * cell_width + cell_width // 2
+            y = (index // columns) * cell_height + 4 + thumb_height // 2
+            if path == self.selected:
+                canvas.create_rectangle(x - cell_width // 2 + 2, y - thumb_height // 2 - 3,
+                                        x + cell_width // 2 - 2, y - thumb_height // 2 + cell_height - 6,
+                                        outline="#3874d8", width=2, tags='cell')
+            thumb = self.cache.get(path)
+            if thumb is not None:
+                photo = self.photos.get(path)
+                if photo is None:
+                    photo = ImageTk.PhotoImage(thumb)
+                photos[path] = photo
+                canvas.create_image(x, y, image=photo, tags='cell')
+            elif path in self.failed:
+                canvas.create_text(x, y, text="読み込めません", fill="gray50", tags='cell')
+            else:
+                canvas.create_rectangle(x - thumb_width // 2, y - thumb_height // 2,
+                                        x + thumb_width // 2, y + thumb_height // 2,
+                                        outline="gray85", tags='cell')
+                if path not in self.pending:
+                    self.request_thumbnail(path)
+            name = os.path.basename(path)
+            if len(name) > 20:
+                name = name[:9] + '…' + name[-9:]
+            canvas.create_text(x, y + thumb_height // 2 + 12, text=name, tags='cell')
+        # 表示中のセルのPhotoImageだけを保持する (Tkの画像はメモリ上限の対象外のため)
+        self.photos = photos
+    
+    def request_thumbnail(self, path):
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        future = self.executor.submit(self.converter.make_thumbnail, path, THUMBNAIL_SIZE)
+        self.pending[path] = future
+        future.add_done_callback(lambda future: self.results.put(('thumbnail', path, future)))
+    
+    def cancel_pending(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+    
+    def schedule_preview(self, *args):
+        """設定の変更が落ち着いてからプレビューを作り直す"""
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+        self.preview_job = self.after(PREVIEW_DELAY, self.start_preview)
+    
+    def start_preview(self):
+        """選択中の画像を現在の設定でメモリ上に変換する (別スレッド)"""
+        self.preview_job = None
+        if self.selected is None:
+            return
+        try:
+            settings = self.get_settings()
+        except (tk.TclError, ValueError):
+            # 品質やサイズの入力途中は作らない
+            return
+        if self.preview_future is not None:
+            self.preview_future.cancel()
+        self.preview_id += 1
+        preview_id = self.preview_id
+        self.info_var.set(f"プレビューを作成中: {os.path.basename(self.selected)}")
+        if self.preview_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.preview_executor = ThreadPoolExecutor(max_workers=1)
+        self.preview_future = self.preview_executor.submit(
+            self.converter.preview, self.selected, settings['output_format'],
+            settings['quality'], PREVIEW_BOX, resize=settings['resize'],
+            resize_mode=settings['resize_mode'])
+        self.preview_future.add_done_callback(
+            lambda future: self.results.put(('preview', preview_id, (future, settings))))
+    
+    def show_preview(self, future, settings):
+        from PIL import ImageTk
+        
+        try:
+            preview = future.result()
+        except Exception as e:
+            self.before_label.config(image='')
+            self.after_label.config(image='')
+            self.preview_photos = ()
+            self.info_var.set(f"プレビューを作成できません: {e}")
+            return
+        self.preview_photos = (ImageTk.PhotoImage(preview['before']),
+                               ImageTk.PhotoImage(preview['after']))
+        self.before_label.config(image=self.preview_photos[0])
+        self.after_label.config(image=self.preview_photos[1])
+        width, height = preview['size']
+        ratio = preview['output_bytes'] / max(preview['input_bytes'], 1)
+        self.info_var.set(
+            f"{os.path.basename(self.selected)}\n"
+            f"{width}x{height} {settings['output_format']} 品質{settings['quality']}: "
+            f"{format_bytes(preview['output_bytes'])} "
+            f"(元 {format_bytes(preview['input_bytes'])} の {ratio:.0%})")
+    
+    def poll_results(self):
+        """ワーカーの結果をまとめて反映する（メインスレッド）"""
+        changed = False
+        for _ in range(EVENT_BATCH_LIMIT):
+            try:
+                kind, key, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'files' and key == self.listing_id:
+                self.paths.extend(value)
+                changed = True
+            elif kind == 'listed' and key == self.listing_id:
+                self.listing = False
+                changed = True
+            elif kind == 'event' and key == self.listing_id and value.get('message'):
+                self.info_var.set(value['message'])
+            elif kind == 'thumbnail':
+                if self.pending.get(key) is value:
+                    del self.pending[key]
+                if value.cancelled():
+                    continue
+                try:
+                    self.cache.put(key, value.result())
+                except Exception:
+                    self.failed.add(key)
+                changed = True
+            elif kind == 'preview' and key == self.preview_id and not value[0].cancelled():
+                self.show_preview(*value)
+        if changed:
+            self.update_count()
+            self.schedule_redraw()
+        self.after(EVENT_POLL_INTERVAL, self.poll_results)
+    
+    def shutdown(self):
+        """未着手のデコードを取り消し、ワーカーを終了する"""
+        self.listing_id += 1
+        self.cancel_pending()
+        if self.preview_future is not None:
+            self.preview_future.cancel()
+        for executor in (self.executor, self.preview_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
 
 
 class ImageConverterGUI:
@@ -20,7 +473,7 @@ class ImageConverterGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("画像ファイル変換ソフト - Image File Converter")
-        self.root.geometry("800x600")
+        self.root.geometry("900x760")
         self.root.resizable(True, True)
         
         # アイコン設定（オプション）
@@ -31,7 +484,14 @@ class ImageConverterGUI:
             pass
         
         self.converter = ImageConverter()
+        # 変換スレッドからの進捗イベント（Tkの操作はメインスレッドのみで行う）
+        self.events = queue.Queue()
+        # 実行中のバッチ変換の中止・一時停止と、処理速度の計測
+        self.control = None
+        self.meter = None
+        self.total = None
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def setup_ui(self):
         """UIセットアップ"""
@@ -123,7 +583,27 @@ class ImageConverterGUI:
         self.height_var = tk.IntVar(value=600)
         self.height_spin = ttk.Spinbox(resize_frame, from_=1, to=10000, textvariable=self.height_var, 
                                       width=8, state="disabled")
-        self.height_spin.grid(row=0, column=4)
+        self.height_spin.grid(row=0, column=4, padx=(0, 10))
+        
+        ttk.Label(resize_frame, text="方法:").grid(row=0, column=5, sticky=tk.W, padx=(0, 5))
+        self.resize_mode_var = tk.StringVar(value=RESIZE_MODE_LABELS['stretch'])
+        self.resize_mode_combo = ttk.Combobox(resize_frame, textvariable=self.resize_mode_var,
+                                              values=list(RESIZE_MODE_LABELS.values()),
+                                              state="disabled", width=16)
+        self.resize_mode_combo.grid(row=0, column=6)
+        
+        # バッチ変換オプション
+        batch_frame = ttk.Frame(options_frame)
+        batch_frame.grid(row=2, column=0, columnspan=4, sticky=(tk.W, tk.E), pady=(10, 0))
+        
+        ttk.Label(batch_frame, text="並列数:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(batch_frame, from_=1, to=64, textvariable=self.workers_var,
+                    width=8).grid(row=0, column=1, padx=(0, 20))
+        
+        self.resume_var = tk.BooleanVar()
+        ttk.Checkbutton(batch_frame, text="中止したバッチ変換を続きから再開",
+                        variable=self.resume_var).grid(row=0, column=2, sticky=tk.W)
         
         # 実行ボタン
         button_frame = ttk.Frame(main_frame)
@@ -132,6 +612,14 @@ class ImageConverterGUI:
         self.convert_button = ttk.Button(button_frame, text="変換開始", command=self.start_conversion)
         self.convert_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.pause_button = ttk.Button(button_frame, text="一時停止", command=self.toggle_pause,
+                                       state="disabled")
+        self.pause_button.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.cancel_button = ttk.Button(button_frame, text="中止", command=self.cancel_conversion,
+                                        state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.clear_button = ttk.Button(button_frame, text="クリア", command=self.clear_fields)
         self.clear_button.pack(side=tk.LEFT)
         
@@ -140,16 +628,33 @@ class ImageConverterGUI:
         self.progress_bar = ttk.Progressbar(main_frame, variable=self.progress_var, mode='indeterminate')
         self.progress_bar.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(10, 0))
         
-        # ログ表示
-        log_frame = ttk.LabelFrame(main_frame, text="変換ログ", padding="10")
-        log_frame.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
+        # 処理件数・速度・残り時間
+        self.status_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.status_var).grid(
+            row=7, column=0, columnspan=3, sticky=tk.W, pady=(5, 0))
+        
+        # ログ表示とプレビュー (タブで切り替える)
+        notebook = ttk.Notebook(main_frame)
+        notebook.grid(row=8, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
+        main_frame.rowconfigure(8, weight=1)
+        
+        log_frame = ttk.Frame(notebook, padding="10")
         log_frame.columnconfigure(0, weight=1)
         log_frame.rowconfigure(0, weight=1)
-        main_frame.rowconfigure(7, weight=1)
+        notebook.add(log_frame, text="変換ログ")
         
         self.log_text = ScrolledText(log_frame, height=10, width=80)
         self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        self.preview = PreviewPanel(notebook, self.converter, self.conversion_settings)
+        notebook.add(self.preview, text="プレビュー")
+        
+        # 入力と変換設定の変更をプレビューに反映する
+        self.input_var.trace_add('write', lambda *args: self.preview.schedule_load(self.input_var.get()))
+        for var in (self.format_var, self.quality_var, self.resize_var, self.width_var,
+                    self.height_var, self.resize_mode_var):
+            var.trace_add('write', self.preview.schedule_preview)
+        
         # 初期状態設定
         self.on_mode_change()
         
@@ -167,6 +672,7 @@ class ImageConverterGUI:
         state = "normal" if self.resize_var.get() else "disabled"
         self.width_spin.config(state=state)
         self.height_spin.config(state=state)
+        self.resize_mode_combo.config(state="readonly" if self.resize_var.get() else "disabled")
         
     def browse_input(self):
         """入力ファイル/フォルダ選択"""
@@ -208,6 +714,16 @@ class ImageConverterGUI:
             if folder_path:
                 self.output_var.set(folder_path)
                 
+    def conversion_settings(self):
+        """出力形式・品質・リサイズの設定を読み取る（メインスレッド）"""
+        return {
+            'output_format': self.format_var.get(),
+            'quality': self.quality_var.get(),
+            'resize': (self.width_var.get(), self.height_var.get()) if self.resize_var.get() else None,
+            'resize_mode': next(mode for mode, label in RESIZE_MODE_LABELS.items()
+                                if label == self.resize_mode_var.get()),
+        }
+    
     def clear_fields(self):
         """フィールドクリア"""
         self.input_var.set("")
@@ -218,7 +734,6 @@ class ImageConverterGUI:
         """ログメッセージ表示"""
         self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
         
     def start_conversion(self):
         """変換開始"""
@@ -226,68 +741,188 @@ class ImageConverterGUI:
             messagebox.showerror("エラー", "入力と出力を指定してください")
             return
             
-        # UIを無効化
+        # UIを無効化 (中止・一時停止はバッチ変換のみ)
         self.convert_button.config(state="disabled")
+        self.progress_bar.config(mode='indeterminate')
         self.progress_bar.start()
         self.log_text.delete(1.0, tk.END)
         
-        # 別スレッドで変換実行
-        thread = threading.Thread(target=self.run_conversion)
+        # 統計は実行ごとに集計する
+        self.converter.reset_stats()
+        self.meter = ThroughputMeter()
+        self.total = None
+        self.status_var.set("")
+        if self.mode_var.get() == "batch":
+            self.control = BatchControl()
+            self.pause_button.config(state="normal", text="一時停止")
+            self.cancel_button.config(state="normal")
+        
+        # 変換設定はメインスレッドで読み取ってから渡す
+        settings = dict(
+            self.conversion_settings(),
+            mode=self.mode_var.get(),
+            input_path=self.input_var.get(),
+            output_path=self.output_var.get(),
+            workers=max(1, self.workers_var.get()),
+            resume=self.resume_var.get(),
+            control=self.control,
+        )
+        
+        # 別スレッドで変換実行し、進捗イベントを定期的に取り出して表示する
+        thread = threading.Thread(target=self.run_conversion, args=(settings,))
         thread.daemon = True
         thread.start()
+        self.root.after(EVENT_POLL_INTERVAL, self.poll_events)
         
-    def run_conversion(self):
-        """変換実行（別スレッド）"""
+    def run_conversion(self, settings):
+        """変換実行（別スレッド）。結果はすべてイベントキュー経由で通知する"""
+        post = self.events.put
+        success = False
         try:
-            input_path = self.input_var.get()
-            output_path = self.output_var.get()
-            quality = self.quality_var.get()
-            resize = (self.width_var.get(), self.height_var.get()) if self.resize_var.get() else None
-            
-            if self.mode_var.get() == "single":
+            if settings['mode'] == "single":
                 # 単一ファイル変換
-                self.log_message(f"変換開始: {input_path}")
-                success = self.converter.convert_image(input_path, output_path, quality, resize)
-                if success:
-                    self.log_message("変換が完了しました！")
-                    messagebox.showinfo("完了", "変換が完了しました！")
-                else:
-                    messagebox.showerror("エラー", "変換に失敗しました")
+                post({'type': 'message', 'message': f"変換開始: {settings['input_path']}"})
+                success = self.converter.convert_image(
+                    settings['input_path'], settings['output_path'],
+                    settings['quality'], settings['resize'], on_event=post,
+                    resize_mode=settings['resize_mode'])
             else:
-                # バッチ変換
-                self.log_message(f"バッチ変換開始")
-                self.log_message(f"入力フォルダ: {input_path}")
-                self.log_message(f"出力フォルダ: {output_path}")
-                self.log_message(f"出力形式: {self.format_var.get()}")
-                
-                # コンソール出力をキャプチャするため、一時的にprint関数を置き換え
-                original_print = print
-                def gui_print(*args, **kwargs):
-                    message = ' '.join(str(arg) for arg in args)
-                    self.root.after(0, lambda: self.log_message(message))
-                
-                import builtins
-                builtins.print = gui_print
-                
-                try:
-                    self.converter.batch_convert(input_path, output_path, 
-                                               self.format_var.get(), quality, resize)
-                    self.root.after(0, lambda: messagebox.showinfo("完了", "バッチ変換が完了しました！"))
-                finally:
-                    builtins.print = original_print
-                    
+                # バッチ変換（総数を先に数え、進捗バーを確定表示にする）
+                # 子プロセスで並列に変換し、結果はこのスレッドからイベントとして届く
+                post({'type': 'message', 'message': f"出力フォルダ: {settings['output_path']}"})
+                self.converter.batch_convert(
+                    settings['input_path'], settings['output_path'],
+                    settings['output_format'], settings['quality'], settings['resize'],
+                    workers=settings['workers'], on_event=post, prescan=True,
+                    resize_mode=settings['resize_mode'], resume=settings['resume'],
+                    control=settings['control'])
+                success = True
         except Exception as e:
-            error_msg = f"エラーが発生しました: {str(e)}"
-            self.root.after(0, lambda: self.log_message(error_msg))
-            self.root.after(0, lambda: messagebox.showerror("エラー", error_msg))
+            post({'type': 'error', 'message': f"エラーが発生しました: {str(e)}"})
         finally:
-            # UIを有効化
-            self.root.after(0, self.conversion_finished)
+            post({'type': 'finished', 'mode': settings['mode'], 'success': success})
+    
+    def poll_events(self):
+        """イベントキューをまとめて処理し、ログと進捗バーを更新する（メインスレッド）"""
+        lines = []
+        finished = None
+        for _ in range(EVENT_BATCH_LIMIT):
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
             
-    def conversion_finished(self):
+            if event['type'] == 'finished':
+                finished = event
+                break
+            if event['type'] == 'start' and event.get('total'):
+                self.total = event['total']
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate', maximum=event['total'])
+                self.progress_var.set(0)
+            elif event.get('completed') is not None and event.get('total'):
+                self.progress_var.set(event['completed'])
+            if event['type'] in ('file_done', 'file_failed'):
+                self.meter.add(1, event['result']['input_bytes'])
+            elif event['type'] == 'file_skipped':
+                self.meter.add(1, 0)
+            
+            text = ImageConverter.format_event(event)
+            if text is not None:
+                lines.append(text)
+        
+        # ログは1回の挿入にまとめる
+        if lines:
+            self.log_message('\n'.join(lines))
+        
+        if finished is not None:
+            self.conversion_finished(finished)
+        else:
+            if self.control is not None:
+                self.update_status()
+            self.root.after(EVENT_POLL_INTERVAL, self.poll_events)
+    
+    def update_status(self):
+        """処理件数・速度・残り時間の表示を更新する（メインスレッド）"""
+        files_per_second, bytes_per_second = self.meter.rates()
+        text = f"{self.meter.files}" + (f" / {self.total}" if self.total else "") + " ファイル"
+        if self.control.cancelled:
+            text += "  中止しています (変換中のファイルの完了を待っています)"
+        elif self.control.paused:
+            text += "  一時停止中"
+        else:
+            text += (f"  {files_per_second:.1f} ファイル/秒"
+                     f"  {bytes_per_second / 1024 / 1024:.1f} MB/秒")
+            eta = self.meter.eta(self.total)
+            if eta is not None:
+                text += f"  残り約 {format_duration(eta)}"
+        self.status_var.set(text)
+    
+    def toggle_pause(self):
+        """バッチ変換の一時停止・再開"""
+        if self.control is None:
+            return
+        if self.control.paused:
+            self.control.resume()
+            self.pause_button.config(text="一時停止")
+            self.log_message("再開しました")
+        else:
+            self.control.pause()
+            self.pause_button.config(text="再開")
+            self.log_message("一時停止しました (変換中のファイルは最後まで変換します)")
+    
+    def cancel_conversion(self):
+        """バッチ変換の中止（変換中のファイルの完了を待って終了する）"""
+        if self.control is None:
+            return
+        self.control.cancel()
+        self.pause_button.config(state="disabled")
+        self.cancel_button.config(state="disabled")
+        self.log_message("中止しています...")
+    
+    def on_close(self):
+        """ウィンドウを閉じる際は、実行中のバッチ変換を中止する"""
+        if self.control is not None:
+            self.control.cancel()
+        self.preview.shutdown()
+        self.root.destroy()
+    
+    def log_run_stats(self):
+        """今回の実行の統計をログに表示する"""
+        summary = self.converter.metrics.summary()
+        elapsed = self.meter.elapsed()
+        input_mb = summary['input_bytes'] / 1024 / 1024
+        output_mb = summary['output_bytes'] / 1024 / 1024
+        self.log_message(
+            f"処理時間: {format_duration(elapsed)} "
+            f"(平均 {self.meter.files / elapsed:.1f} ファイル/秒, {input_mb / elapsed:.1f} MB/秒)\n"
+            f"入力: {input_mb:.1f} MB -> 出力: {output_mb:.1f} MB")
+            
+    def conversion_finished(self, event):
         """変換完了時の処理"""
         self.progress_bar.stop()
         self.convert_button.config(state="normal")
+        self.pause_button.config(state="disabled", text="一時停止")
+        self.cancel_button.config(state="disabled")
+        control, self.control = self.control, None
+        
+        if event['mode'] == "batch" and self.meter.files:
+            self.status_var.set(f"{self.meter.files} ファイル処理済み "
+                                f"({format_duration(self.meter.elapsed())})")
+            self.log_run_stats()
+        
+        if event['mode'] == "single":
+            if event['success']:
+                self.log_message("変換が完了しました！")
+                messagebox.showinfo("完了", "変換が完了しました！")
+            else:
+                messagebox.showerror("エラー", "変換に失敗しました")
+        elif event['success'] and control is not None and control.cancelled:
+            messagebox.showinfo("中止", "バッチ変換を中止しました")
+        elif event['success']:
+            messagebox.showinfo("完了", "バッチ変換が完了しました！")
+        else:
+            messagebox.showerror("エラー", "バッチ変換に失敗しました")
 
 
 def main():
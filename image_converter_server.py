@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像ファイル変換ソフト 常駐サーバー (Image File Converter Server)
+
+変換プロセスを起動したまま待ち受け、ローカルのソケット経由で変換ジョブを受け付ける。
+ファイルごとにPythonの起動とPillowの読み込みを行わずに済むため、
+シェルスクリプトから1ファイルずつ変換する場合の待ち時間を短縮できる。
+
+プロトコル: 1行1件のJSON (UTF-8)。1つの接続で複数のジョブを続けて送ってよく、
+結果は完了した順に、リクエストのidを付けて返す。
+  パス指定: {"id": 1, "input": "/abs/in.jpg", "output": "/abs/out.png", "options": {...}}
+  データ指定: {"id": 2, "data": "<base64>", "format": "WEBP", "options": {...}}
+optionsには quality, resize, resize_mode, resample_strategy, effort, max_memory,
+max_pixels, passthrough, frames, background, target_size (バイト), renditions を指定できる。
+パス指定の結果は ImageConverter.add_hook と同じ辞書、
+データ指定の結果は id, success, error, elapsed と変換後の data (base64)。
+
+パス指定のジョブはサーバーの実行ユーザーが読み書きできる任意のファイルを扱えるため、
+既定では所有者のみが接続できるUnixドメインソケット (~/.image_converter/server.sock) で待ち受ける。
+TCPで待ち受ける場合は、接続の最初の行で {"token": "..."} を送って認証する必要がある。
+トークンは環境変数 IMAGE_CONVERTER_TOKEN、なければサーバーが作成して
+~/.image_converter/server.token (所有者のみ読み込み可) に保存したものを使う。
+
+このモジュールの先頭では標準ライブラリのみを読み込み、クライアントとして
+起動する場合はPillowを読み込まない。
+
+使用例:
+  python image_converter.py --serve --workers 4
+  python image_converter_server.py ~/.image_converter/server.sock photo.jpg photo.webp --option quality=80
+  cat photo.jpg | python image_converter_server.py ~/.image_converter/server.sock - - --format PNG > photo.png
+"""
+
+import argparse
+import base64
+import hmac
+import json
+import os
+import queue
+import secrets
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, Tuple
+
+# サーバーのソケットとトークンを置く、所有者のみが使えるディレクトリ
+STATE_DIR = os.path.join(os.path.expanduser('~'), '.image_converter')
+
+# 既定の待ち受けアドレス (Unixドメインソケットを使えない環境のみTCP)
+DEFAULT_ADDRESS = (os.path.join(STATE_DIR, 'server.sock') if hasattr(socket, 'AF_UNIX')
+                   else '127.0.0.1:8765')
+
+# TCPの認証に使うトークンの環境変数とファイル
+TOKEN_ENV = 'IMAGE_CONVERTER_TOKEN'
+TOKEN_FILE = os.path.join(STATE_DIR, 'server.token')
+
+# ジョブで指定できる変換オプション
+JOB_OPTIONS = ('quality', 'resize', 'resize_mode', 'resample_strategy', 'effort',
+               'max_memory', 'max_pixels', 'passthrough', 'frames', 'background',
+               'target_size', 'renditions')
+
+# 1接続あたりのワーカー数に対する未完了ジョブの上限倍率
+PENDING_PER_WORKER = 2
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """
+    アドレス文字列を (ソケットファミリー, bind/connect用アドレス) に変換する
+
+    'HOST:PORT' または 'PORT' はTCP (ループバックのみ)、それ以外はUnixドメインソケットのパス。
+
+    Raises:
+        ValueError: ループバック以外のホスト、または未対応の環境でUnixソケットを指定した場合
+    """
+    host, sep, port = address.rpartition(':')
+    if port.isdigit():
+        host = host or '127.0.0.1'
+        if host not in ('127.0.0.1', 'localhost', '::1'):
+            raise ValueError(f"ローカルホスト以外では待ち受けできません: {address}")
+        return socket.AF_INET6 if host == '::1' else socket.AF_INET, (host, int(port))
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError(f"この環境ではUnixドメインソケットを使用できません: {address}")
+    return socket.AF_UNIX, address
+
+
+def _make_state_dir() -> None:
+    """ソケットとトークンを置くディレクトリを所有者のみが使える権限で作る"""
+    os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+
+
+def _owner_only_umask():
+    """作成するファイルを所有者のみが使える権限にするumaskを設定し、元の値を返す"""
+    return os.umask(0o077)
+
+
+def server_token(create: bool = False) -> str:
+    """
+    TCP接続の認証トークンを返す
+
+    環境変数 IMAGE_CONVERTER_TOKEN を優先し、なければトークンファイルを読む。
+    createがTrueでファイルもない場合は、新しいトークンを作成して保存する。
+
+    Raises:
+        OSError: トークンがなく、作成もしない場合
+    """
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    try:
+        with open(TOKEN_FILE, 'r', encoding='ascii') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        if not create:
+            raise
+    if not create:
+        raise OSError(f"トークンが空です: {TOKEN_FILE}")
+    _make_state_dir()
+    token = secrets.token_urlsafe(32)
+    old_umask = _owner_only_umask()
+    try:
+        with open(TOKEN_FILE, 'w', encoding='ascii') as f:
+            f.write(token + '\n')
+    finally:
+        os.umask(old_umask)
+    return token
+
+
+def _run_job(job: dict) -> dict:
+    """
+    1件のジョブを変換して結果を返す（ワーカープロセスで実行される）
+
+    例外は送出せず、結果のsuccess/errorで返す。
+    """
+    from image_converter import _convert_bytes, _convert_task, _normalize_format
+
+    options = {key: value for key, value in (job.get('options') or {}).items()
+               if key in JOB_OPTIONS}
+    for key in ('resize', 'background'):
+        if options.get(key):
+            options[key] = tuple(options[key])
+    if options.get('renditions'):
+        options.pop('passthrough', None)
+        options.pop('resize_mode', None)
+        options.pop('frames', None)
+        options.pop('target_size', None)
+
+    if 'data' not in job:
+        return _convert_task((job['input'], job['output'], options))
+
+    result = {'success': False, 'error': None, 'elapsed': 0.0}
+    start = time.perf_counter()
+    try:
+        options.pop('renditions', None)
+        options.pop('passthrough', None)
+        data = _convert_bytes(base64.b64decode(job['data']),
+                              _normalize_format(job.get('format', 'PNG')), options)
+        result['data'] = base64.b64encode(data).decode('ascii')
+        result['success'] = True
+    except Exception as e:
+        result['error'] = f"変換エラー: {str(e)}"
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def _warm_worker(_index: int) -> int:
+    """ワーカープロセスでPillowとコーデックを読み込んでおく"""
+    from PIL import Image
+    Image.init()
+    return os.getpid()
+
+
+class _WorkerPool:
+    """
+    ジョブを実行するプロセスプール
+
+    ワーカープロセスが強制終了されるとプール全体が使えなくなる (BrokenProcessPool) ため、
+    その場合は新しいプールに作り直して受付を続ける。実行中だったジョブはエラーの結果になる。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        # 最初のジョブで起動待ちが発生しないよう、先に全ワーカーを起動する
+        list(executor.map(_warm_worker, range(self.workers)))
+        return executor
+
+    def submit(self, job: dict):
+        """
+        ジョブをワーカーへ渡し、Futureを返す
+
+        Raises:
+            RuntimeError: プールを作り直しても渡せない場合 (BrokenProcessPoolを含む)
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        with self._lock:
+            executor = self._executor
+        try:
+            return executor.submit(_run_job, job)
+        except BrokenProcessPool:
+            pass
+        with self._lock:
+            # 他の接続のスレッドが先に作り直していれば、それを使う
+            if self._executor is executor:
+                print("ワーカープロセスが異常終了したため、ワーカーを起動し直します", file=sys.stderr)
+                executor.shutdown(wait=False)
+                self._executor = self._start()
+            executor = self._executor
+        return executor.submit(_run_job, job)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._executor.shutdown()
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """1接続分のジョブを読み込み、ワーカープールへ渡して結果を書き戻す"""
+
+    def handle(self):
+        pool = self.server.pool
+        if self.server.token is not None and not self._authenticate():
+            return
+        # 完了した結果 (job_id, future)、不正なリクエストへの応答 (dict)、
+        # 読み込み終了時の受付件数 (int) を受け取る
+        results = queue.Queue()
+        # 大量のジョブを送られても、受け付けた入力データを溜め込み過ぎないようにする
+        slots = threading.BoundedSemaphore(self.server.max_pending)
+
+        def read_jobs():
+            # 応答を返す件数 (書き込み側はこの件数の応答を返してから切断する)
+            received = 0
+            try:
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        job = json.loads(line)
+                        if not isinstance(job, dict) or not (
+                                'data' in job or ('input' in job and 'output' in job)):
+                            raise ValueError("input/output または data を指定してください")
+                    except ValueError as e:
+                        results.put({'id': None, 'success': False,
+                                     'error': f"不正なリクエスト: {str(e)}"})
+                        received += 1
+                        continue
+                    slots.acquire()
+                    try:
+                        future = pool.submit(job)
+                    except RuntimeError as e:
+                        slots.release()
+                        results.put({'id': job.get('id'), 'success': False,
+                                     'error': f"サーバーエラー: {str(e)}"})
+                        received += 1
+                        continue
+                    received += 1
+                    # 完了通知はワーカープールの管理スレッドで呼ばれるため、書き込みはここで行わない
+                    future.add_done_callback(
+                        lambda f, job_id=job.get('id'): results.put((job_id, f)))
+            except OSError:
+                pass
+            finally:
+                results.put(received)
+
+        threading.Thread(target=read_jobs, daemon=True).start()
+
+        # 送信側が書き込みを閉じた後も、受け付けたジョブの結果をすべて返してから切断する
+        sent = 0
+        expected = None
+        while expected is None or sent < expected:
+            item = results.get()
+            if isinstance(item, int):
+                expected = item
+                continue
+            if isinstance(item, tuple):
+                job_id, future = item
+                slots.release()
+                try:
+                    response = dict(future.result(), id=job_id)
+                except Exception as e:
+                    response = {'id': job_id, 'success': False, 'error': f"サーバーエラー: {str(e)}"}
+            else:
+                response = item
+            sent += 1
+            try:
+                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            except OSError:
+                # クライアントが切断した場合は結果を捨てる
+                pass
+
+    def _authenticate(self) -> bool:
+        """接続の最初の行のトークンを確かめ、一致しなければエラーを返してFalse"""
+        try:
+            request = json.loads(self.rfile.readline())
+            token = request.get('token') if isinstance(request, dict) else None
+        except (OSError, ValueError):
+            token = None
+        if isinstance(token, str) and hmac.compare_digest(token.encode('utf-8'),
+                                                          self.server.token.encode('utf-8')):
+            return True
+        try:
+            self.wfile.write(json.dumps({'id': None, 'success': False,
+                                         'error': "認証に失敗しました (トークンが一致しません)"},
+                                        ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+        except OSError:
+            pass
+        return False
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(address: str = DEFAULT_ADDRESS, workers: int = 0) -> None:
+    """
+    変換サーバーを起動し、中断されるまで待ち受ける
+
+    Args:
+        address: Unixドメインソケットのパス、または 'HOST:PORT' (ループバックのみ、
+                 接続にはトークンが必要)
+        workers: ワーカープロセス数 (0でCPUコア数)
+    """
+    family, bind_address = parse_address(address)
+    workers = workers if workers > 0 else os.cpu_count() or 1
+    unix = family == getattr(socket, 'AF_UNIX', None)
+
+    token = None
+    if unix:
+        if os.path.dirname(bind_address) == STATE_DIR:
+            _make_state_dir()
+        if os.path.exists(bind_address):
+            os.unlink(bind_address)
+        # パス指定のジョブは任意のファイルを読み書きできるため、ソケットは作成時から
+        # 所有者のみが接続できるようにする (作成後にchmodすると、その間は誰でも接続できる)
+        old_umask = _owner_only_umask()
+        try:
+            server = _ThreadingUnixServer(bind_address, _JobHandler)
+        finally:
+            os.umask(old_umask)
+    else:
+        # TCPはローカルの他のユーザーやブラウザからも接続できるため、トークンで認証する
+        token = server_token(create=True)
+        _ThreadingTCPServer.address_family = family
+        server = _ThreadingTCPServer(bind_address, _JobHandler)
+
+    try:
+        pool = _WorkerPool(workers)
+    except BaseException:
+        server.server_close()
+        if unix and os.path.exists(bind_address):
+            os.unlink(bind_address)
+        raise
+    server.pool = pool
+    server.token = token
+    server.max_pending = workers * PENDING_PER_WORKER
+    print(f"変換サーバーを起動しました: {address} (ワーカー: {workers})", file=sys.stderr)
+    if token is not None and not os.environ.get(TOKEN_ENV):
+        print(f"接続用のトークン: {TOKEN_FILE}", file=sys.stderr)
+    # サービスとして停止された場合も、Ctrl+Cと同じく後片付けしてから終了する
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n変換サーバーを停止しました", file=sys.stderr)
+    finally:
+        server.server_close()
+        pool.shutdown()
+        if unix and os.path.exists(bind_address):
+            os.unlink(bind_address)
+
+
+class ConversionClient:
+    """
+    変換サーバーのクライアント
+
+    使用例:
+        with ConversionClient() as client:
+            for result in client.convert_many(jobs):
+                print(result['id'], result['success'])
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: float = None,
+                 token: str = None):
+        """
+        Args:
+            address: サーバーのアドレス (Unixドメインソケットのパス、または 'HOST:PORT')
+            timeout: ソケットのタイムアウト (秒)
+            token: TCP接続の認証トークン (省略時は環境変数、トークンファイルの順に探す)
+        """
+        family, connect_address = parse_address(address)
+        if family != getattr(socket, 'AF_UNIX', None) and token is None:
+            token = server_token()
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(connect_address)
+        if token is not None:
+            self.sock.sendall(json.dumps({'token': token}).encode('utf-8') + b'\n')
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> 'ConversionClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def file_job(input_path: str, output_path: str, **options) -> dict:
+        """パス指定のジョブを作る (サーバーの作業ディレクトリに依らないよう絶対パスにする)"""
+        return {'input': os.path.abspath(input_path), 'output': os.path.abspath(output_path),
+                'options': options}
+
+    @staticmethod
+    def data_job(data: bytes, output_format: str, **options) -> dict:
+        """データ指定のジョブを作る"""
+        return {'data': base64.b64encode(data).decode('ascii'), 'format': output_format,
+                'options': options}
+
+    def convert_many(self, jobs: Iterable[dict]) -> Iterator[dict]:
+        """
+        ジョブを送信し、結果を完了順に返す
+
+        送信は別スレッドで行い、結果の受信と並行して進める。
+        idのないジョブには送信順の番号を付ける。
+        """
+        sent = []
+        errors = []
+
+        def sender():
+            try:
+                with self.sock.makefile('wb') as writer:
+                    for index, job in enumerate(jobs):
+                        job = dict(job)
+                        job.setdefault('id', index)
+                        writer.write(json.dumps(job).encode('utf-8') + b'\n')
+                        writer.flush()
+                        sent.append(job['id'])
+                self.sock.shutdown(socket.SHUT_WR)
+            except Exception as e:
+                errors.append(e)
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=sender, daemon=True)
+        thread.start()
+        # 認証の失敗などでサーバーが切断した場合、その理由は結果として受信済み
+        rejected = False
+        with self.sock.makefile('rb') as reader:
+            for line in reader:
+                result = json.loads(line)
+                rejected = rejected or result.get('id') is None
+                yield result
+        thread.join()
+        if errors and not (rejected and isinstance(errors[0], OSError)):
+            raise errors[0]
+
+    def convert_file(self, input_path: str, output_path: str, **options) -> dict:
+        """1ファイルを変換し、結果の辞書を返す"""
+        return next(self.convert_many([self.file_job(input_path, output_path, **options)]))
+
+    def convert_bytes(self, data: bytes, output_format: str, **options) -> bytes:
+        """
+        メモリ上の画像データを変換して返す
+
+        Raises:
+            ValueError: 変換に失敗した場合
+        """
+        result = next(self.convert_many([self.data_job(data, output_format, **options)]))
+        if not result['success']:
+            raise ValueError(result['error'])
+        return base64.b64decode(result['data'])
+
+
+def _parse_option(text: str) -> Tuple[str, object]:
+    """'key=value' 形式のオプションを解析する (値はJSONとして解釈し、失敗時は文字列)"""
+    key, sep, value = text.partition('=')
+    if not sep or key not in JOB_OPTIONS:
+        raise argparse.ArgumentTypeError(f"不明なオプションです ({', '.join(JOB_OPTIONS)}): {text}")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main():
+    """クライアントのメイン関数"""
+    parser = argparse.ArgumentParser(
+        description='画像変換サーバーのクライアント',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  # 1ファイルを変換 (サーバーは python image_converter.py --serve で起動)
+  python image_converter_server.py ~/.image_converter/server.sock photo.jpg photo.webp --option quality=80
+
+  # 複数ファイルをまとめて送信 (入力と出力を交互に指定)
+  python image_converter_server.py ~/.image_converter/server.sock a.jpg a.png b.jpg b.png
+
+  # TCPのサーバーへ (トークンは IMAGE_CONVERTER_TOKEN または ~/.image_converter/server.token)
+  cat photo.jpg | python image_converter_server.py 127.0.0.1:8765 - - --format PNG > photo.png
+        """
+    )
+    parser.add_argument('address', help="サーバーのアドレス ('HOST:PORT' またはソケットのパス)")
+    parser.add_argument('files', nargs='+', metavar='INPUT OUTPUT',
+                        help="入力と出力の組 ('- -' で標準入出力のデータを変換)")
+    parser.add_argument('--format', default='PNG', help="'- -' 指定時の出力形式 (デフォルト: PNG)")
+    parser.add_argument('--option', action='append', type=_parse_option, default=[],
+                        metavar='KEY=VALUE',
+                        help='変換オプション (例: quality=80, resize=[800,600], effort="max")')
+    args = parser.parse_args()
+
+    if len(args.files) % 2:
+        parser.error("入力と出力は組で指定してください")
+    options = dict(args.option)
+    pairs = list(zip(args.files[::2], args.files[1::2]))
+
+    try:
+        with ConversionClient(args.address) as client:
+            if pairs == [('-', '-')]:
+                data = client.convert_bytes(sys.stdin.buffer.read(), args.format, **options)
+                sys.stdout.buffer.write(data)
+                return 0
+
+            jobs = [ConversionClient.file_job(input_path, output_path, **options)
+                    for input_path, output_path in pairs]
+            failed = 0
+            for result in client.convert_many(jobs):
+                if result['success']:
+                    print(f"変換完了: {result['input']} -> {result['output']}")
+                else:
+                    failed += 1
+                    print(result['error'], file=sys.stderr)
+            return 1 if failed else 0
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())